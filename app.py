@@ -8,10 +8,18 @@ import pandas as pd
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
-import gspread
-from google.oauth2.service_account import Credentials
 from urllib.parse import quote
 
+from beautybox import sincronizar
+from beautybox.repositorio import filtrar_por_fecha
+from beautybox import instrumentacion
+from beautybox.cache import lee_tablas
+from beautybox.instrumentacion import cache_compartida, medido
+from beautybox.esquema import formato_fecha, formato_hora
+from beautybox.citas import PROYECCION_NOMBRES, citas_entre, con_nombres
+from beautybox.conexion import (get_limitador, get_notificador, get_repositorio, get_repositorio_sheets, get_snapshot,
+                                get_vista_citas, usa_sheets)
+
 # ============================================
 # CONFIGURACIÓN DE LA PÁGINA
 # ============================================
@@ -515,77 +523,39 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ============================================
-# CONEXIÓN A GOOGLE SHEETS
+# CONEXIÓN A LOS DATOS
 # ============================================
 
-@st.cache_resource
-def get_google_connection():
-    """Conectar a Google Sheets"""
-    try:
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=scopes
-        )
-        client = gspread.authorize(credentials)
-        return client
-    except Exception as e:
-        st.error(f"Error conectando a Google Sheets: {e}")
-        st.info("Asegúrate de configurar las credenciales en Streamlit Secrets")
-        st.stop()
-
-@st.cache_resource
-def get_spreadsheet():
-    """Obtener el spreadsheet de BeautyBox"""
-    client = get_google_connection()
-    try:
-        spreadsheet = client.open("BeautyBox_Database")
-        return spreadsheet
-    except gspread.SpreadsheetNotFound:
-        st.error("No se encontró el spreadsheet 'BeautyBox_Database'")
-        st.stop()
-
-def get_or_create_worksheet(spreadsheet, name, headers):
-    """Obtener o crear una hoja con los headers especificados"""
-    try:
-        worksheet = spreadsheet.worksheet(name)
-    except gspread.WorksheetNotFound:
-        worksheet = spreadsheet.add_worksheet(title=name, rows=1000, cols=20)
-        worksheet.append_row(headers)
-    return worksheet
+# get_google_connection / get_spreadsheet viven en beautybox.conexion para
+# compartirlos con la página de reservas. Todas las escrituras pasan por el
+# repositorio (Google Sheets o SQLite local) y las lecturas por el snapshot,
+# que trae todas las tablas de una vez.
+#
+# Cada lector declara con @lee_tablas las hojas de las que depende; cuando el
+# repositorio escribe en una hoja solo se limpian esos lectores.
+#
+# Los lectores usan @cache_compartida: el resultado se calcula una vez por
+# versión de sus tablas en el snapshot y lo comparten todas las sesiones,
+# sin serializarlo ni copiarlo en cada rerun como hacía st.cache_data.
+
+def versiones(*tablas):
+    """Versión de las tablas en el snapshot compartido, para @cache_compartida"""
+    return lambda: get_snapshot().versiones(tablas)
 
 # ============================================
 # FUNCIONES DE DATOS
 # ============================================
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
+@lee_tablas('categorias')
+@cache_compartida(versiones('categorias'))
 def get_categorias():
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'nombre', 'descripcion', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'categorias', headers)
-    data = worksheet.get_all_records()
-    if not data:
-        categorias_default = [
-            [1, 'Pestañas', 'Extensiones y tratamientos de pestañas', datetime.now().isoformat()],
-            [2, 'Cejas', 'Diseño, laminado y micropigmentación', datetime.now().isoformat()],
-            [3, 'Uñas', 'Manicura y pedicura', datetime.now().isoformat()],
-            [4, 'Otros', 'Otros servicios', datetime.now().isoformat()]
-        ]
-        for cat in categorias_default:
-            worksheet.append_row(cat)
-        data = worksheet.get_all_records()
-    return pd.DataFrame(data)
-
-@st.cache_data(ttl=300)
+    # Las categorías por defecto las siembra repo.preparar() al arrancar
+    return get_snapshot().tabla('categorias', copiar=False)
+
+@lee_tablas('servicios', 'categorias')
+@cache_compartida(versiones('servicios', 'categorias'))
 def get_servicios():
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'nombre', 'categoria_id', 'precio', 'duracion_minutos', 'costo_insumos', 'activo', 'descripcion', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'servicios', headers)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
+    df = get_snapshot().tabla('servicios', copiar=False)
     if len(df) > 0:
         df = df[df['activo'] == 1]
         categorias = get_categorias()
@@ -596,93 +566,46 @@ def get_servicios():
             df = df.drop(columns=['id_cat'])
     return df
 
-@st.cache_data(ttl=60)  # Cache por 1 minuto
+@lee_tablas('clientes')
+@cache_compartida(versiones('clientes'))
 def get_clientes():
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'nombre', 'telefono', 'email', 'fecha_primera_visita', 'canal_adquisicion', 'notas', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'clientes', headers)
-    data = worksheet.get_all_records()
-    return pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
+    return get_snapshot().tabla('clientes', copiar=False)
 
-@st.cache_data(ttl=60)
+@medido
 def get_citas(fecha_inicio=None, fecha_fin=None):
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'fecha', 'hora', 'cliente_id', 'servicio_id', 'precio_cobrado', 'propina', 'canal_origen', 'metodo_pago', 'notas', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'citas', headers)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
-    
-    if len(df) > 0:
-        if fecha_inicio and fecha_fin:
-            df['fecha'] = pd.to_datetime(df['fecha'])
-            df = df[(df['fecha'] >= pd.to_datetime(fecha_inicio)) & 
-                   (df['fecha'] <= pd.to_datetime(fecha_fin))]
-        
-        clientes = get_clientes()
-        servicios = get_servicios()
-        categorias = get_categorias()
-        
-        if len(clientes) > 0:
-            df = df.merge(clientes[['id', 'nombre']], left_on='cliente_id', right_on='id', 
-                         how='left', suffixes=('', '_cliente'))
-            df = df.rename(columns={'nombre': 'cliente_nombre'})
-            if 'id_cliente' in df.columns:
-                df = df.drop(columns=['id_cliente'])
-        
-        if len(servicios) > 0:
-            servicios_info = servicios[['id', 'nombre', 'categoria_id', 'costo_insumos']].copy()
-            df = df.merge(servicios_info, left_on='servicio_id', right_on='id', 
-                         how='left', suffixes=('', '_servicio'))
-            df = df.rename(columns={'nombre': 'servicio_nombre'})
-            if 'id_servicio' in df.columns:
-                df = df.drop(columns=['id_servicio'])
-            
-            if len(categorias) > 0:
-                df = df.merge(categorias[['id', 'nombre']], left_on='categoria_id', right_on='id',
-                             how='left', suffixes=('', '_cat'))
-                df = df.rename(columns={'nombre': 'categoria_nombre'})
-                if 'id_cat' in df.columns:
-                    df = df.drop(columns=['id_cat'])
-        
-        df = df.sort_values('fecha', ascending=False)
-    return df
-
-@st.cache_data(ttl=300)
+    """Citas de un rango (o todas), de la más reciente a la más antigua"""
+    citas = get_vista_citas().por_fecha()
+    df = citas.rango(fecha_inicio, fecha_fin) if fecha_inicio and fecha_fin else citas.todas()
+    return df.iloc[::-1].reset_index(drop=True)
+
+@medido
+def get_resumen_citas(fecha_inicio, fecha_fin):
+    """Citas de un rango con las columnas del resumen del dashboard (proyección si no hay tabla en memoria)"""
+    if get_snapshot().fresca('citas'):
+        return get_citas(fecha_inicio, fecha_fin)
+    return citas_entre(get_snapshot(), fecha_inicio, fecha_fin).iloc[::-1].reset_index(drop=True)
+
+@lee_tablas('gastos_fijos')
+@cache_compartida(versiones('gastos_fijos'))
 def get_gastos_fijos():
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'concepto', 'monto', 'frecuencia', 'activo', 'notas', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'gastos_fijos', headers)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
+    df = get_snapshot().tabla('gastos_fijos', copiar=False)
     if len(df) > 0:
         df = df[df['activo'] == 1]
     return df
 
-@st.cache_data(ttl=60)
+@lee_tablas('gastos_variables')
+@cache_compartida(versiones('gastos_variables'))
 def get_gastos_variables(fecha_inicio=None, fecha_fin=None):
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'fecha', 'concepto', 'monto', 'categoria', 'notas', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'gastos_variables', headers)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
-    if len(df) > 0 and fecha_inicio and fecha_fin:
-        df['fecha'] = pd.to_datetime(df['fecha'])
-        df = df[(df['fecha'] >= pd.to_datetime(fecha_inicio)) & 
-               (df['fecha'] <= pd.to_datetime(fecha_fin))]
-    return df
+    return filtrar_por_fecha(get_snapshot().tabla('gastos_variables', copiar=False),
+                             'gastos_variables', fecha_inicio, fecha_fin)
 
-@st.cache_data(ttl=30)  # Cache por 30 segundos (para ver cambios más rápido)
-def get_solicitudes():
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'nombre', 'telefono', 'email', 'servicio_solicitado', 'preferencia_horario', 
-               'mensaje', 'estado', 'fecha_solicitud', 'fecha_respuesta', 'notas_admin']
-    worksheet = get_or_create_worksheet(spreadsheet, 'solicitudes', headers)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
-    if len(df) > 0:
-        df = df.sort_values('fecha_solicitud', ascending=False)
-    return df
+@medido
+def contar_pendientes():
+    """Solicitudes pendientes para el contador; sirve la última copia y la refresca en segundo plano"""
+    df = get_snapshot().proyectar({'solicitudes': (['estado'], None)}, revalidar=True)['solicitudes']
+    return int((df['estado'] == 'pendiente').sum()) if len(df) > 0 else 0
 
+@medido
 def buscar_cliente_existente(telefono, email):
     """Buscar si el cliente ya existe por teléfono o email"""
     clientes = get_clientes()
@@ -706,164 +629,112 @@ def buscar_cliente_existente(telefono, email):
     
     return None
 
-@st.cache_data(ttl=60)
+@medido
 def get_citas_hoy():
     """Obtener las citas programadas para hoy"""
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'fecha', 'hora', 'cliente_id', 'servicio_id', 'precio_cobrado', 'propina', 'canal_origen', 'metodo_pago', 'notas', 'created_at']
-    worksheet = get_or_create_worksheet(spreadsheet, 'citas', headers)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
-    
-    if len(df) == 0:
-        return pd.DataFrame()
-    
-    # Filtrar por fecha de hoy
-    hoy = datetime.now().strftime('%Y-%m-%d')
-    df['fecha_str'] = df['fecha'].astype(str).str[:10]
-    df_hoy = df[df['fecha_str'] == hoy].copy()
-    
-    if len(df_hoy) == 0:
-        return pd.DataFrame()
-    
-    # Agregar info de cliente y servicio
-    clientes = get_clientes()
-    servicios = get_servicios()
-    
-    if len(clientes) > 0:
-        df_hoy = df_hoy.merge(clientes[['id', 'nombre']], left_on='cliente_id', right_on='id', 
-                             how='left', suffixes=('', '_cliente'))
-        df_hoy = df_hoy.rename(columns={'nombre': 'cliente_nombre'})
-    
-    if len(servicios) > 0:
-        df_hoy = df_hoy.merge(servicios[['id', 'nombre']], left_on='servicio_id', right_on='id', 
-                             how='left', suffixes=('', '_servicio'))
-        df_hoy = df_hoy.rename(columns={'nombre': 'servicio_nombre'})
+    hoy = datetime.now().date()
+    if get_snapshot().fresca('citas'):
+        df_hoy = get_vista_citas().por_fecha().rango(hoy, hoy)
+    else:
+        # Sin la tabla en memoria basta con la columna fecha y las filas de hoy;
+        # las fechas y los nombres se piden juntos en una sola lectura
+        snapshot = get_snapshot()
+        snapshot.proyectar({'citas': (['fecha'], None), **PROYECCION_NOMBRES})
+        df_hoy = con_nombres(snapshot, citas_entre(snapshot, hoy, hoy))
     
     # Ordenar por hora
-    df_hoy = df_hoy.sort_values('hora')
-    
-    return df_hoy
+    return df_hoy.sort_values('hora').reset_index(drop=True)
 
 # ============================================
 # FUNCIONES DE INSERCIÓN
 # ============================================
 
-def get_next_id(worksheet):
-    data = worksheet.get_all_records()
-    if not data:
-        return 1
-    ids = [row.get('id', 0) for row in data]
-    return max(ids) + 1 if ids else 1
-
+@medido
 def insertar_servicio(nombre, categoria_id, precio, duracion, costo_insumos, descripcion):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('servicios')
-    new_id = get_next_id(worksheet)
-    row = [new_id, nombre, categoria_id, precio, duracion, costo_insumos, 1, descripcion, datetime.now().isoformat()]
-    worksheet.append_row(row)
-    st.cache_data.clear()
+    get_repositorio().insertar('servicios', {
+        'nombre': nombre, 'categoria_id': categoria_id, 'precio': precio,
+        'duracion_minutos': duracion, 'costo_insumos': costo_insumos, 'activo': 1,
+        'descripcion': descripcion, 'created_at': datetime.now().isoformat()
+    })
 
+@medido
 def insertar_cliente(nombre, telefono, email, canal, notas):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('clientes')
-    new_id = get_next_id(worksheet)
-    row = [new_id, nombre, telefono, email, datetime.now().strftime('%Y-%m-%d'), canal, notas, datetime.now().isoformat()]
-    worksheet.append_row(row)
-    st.cache_data.clear()
+    new_id = get_repositorio().insertar('clientes', {
+        'nombre': nombre, 'telefono': telefono, 'email': email,
+        'fecha_primera_visita': datetime.now().strftime('%Y-%m-%d'),
+        'canal_adquisicion': canal, 'notas': notas, 'created_at': datetime.now().isoformat()
+    })
     return new_id
 
+@medido
 def insertar_cita(fecha, hora, cliente_id, servicio_id, precio, propina, canal, metodo_pago, notas):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('citas')
-    new_id = get_next_id(worksheet)
     # Convertir todos los valores a tipos nativos de Python para evitar errores de serialización
-    row = [
-        int(new_id), 
-        str(fecha), 
-        str(hora), 
-        int(cliente_id), 
-        int(servicio_id), 
-        float(precio), 
-        float(propina), 
-        str(canal), 
-        str(metodo_pago), 
-        str(notas), 
-        datetime.now().isoformat()
-    ]
-    worksheet.append_row(row)
-    st.cache_data.clear()
-
+    get_repositorio().insertar('citas', {
+        'fecha': str(fecha),
+        'hora': str(hora),
+        'cliente_id': int(cliente_id),
+        'servicio_id': int(servicio_id),
+        'precio_cobrado': float(precio),
+        'propina': float(propina),
+        'canal_origen': str(canal),
+        'metodo_pago': str(metodo_pago),
+        'notas': str(notas),
+        'created_at': datetime.now().isoformat()
+    })
+
+@medido
 def insertar_gasto_fijo(concepto, monto, frecuencia, notas):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('gastos_fijos')
-    new_id = get_next_id(worksheet)
-    row = [new_id, concepto, monto, frecuencia, 1, notas, datetime.now().isoformat()]
-    worksheet.append_row(row)
-    st.cache_data.clear()
+    get_repositorio().insertar('gastos_fijos', {
+        'concepto': concepto, 'monto': monto, 'frecuencia': frecuencia, 'activo': 1,
+        'notas': notas, 'created_at': datetime.now().isoformat()
+    })
 
+@medido
 def insertar_gasto_variable(fecha, concepto, monto, categoria, notas):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('gastos_variables')
-    new_id = get_next_id(worksheet)
-    row = [new_id, str(fecha), concepto, monto, categoria, notas, datetime.now().isoformat()]
-    worksheet.append_row(row)
-    st.cache_data.clear()
+    get_repositorio().insertar('gastos_variables', {
+        'fecha': str(fecha), 'concepto': concepto, 'monto': monto, 'categoria': categoria,
+        'notas': notas, 'created_at': datetime.now().isoformat()
+    })
 
 # ============================================
 # FUNCIONES DE ACTUALIZACIÓN
 # ============================================
 
-def find_row_by_id(worksheet, id_value):
-    data = worksheet.get_all_records()
-    for i, row in enumerate(data):
-        if row.get('id') == id_value:
-            return i + 2
-    return None
-
+@medido
 def actualizar_servicio(servicio_id, nombre, categoria_id, precio, duracion, costo_insumos, descripcion):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('servicios')
-    row_num = find_row_by_id(worksheet, servicio_id)
-    if row_num:
-        worksheet.update(f'B{row_num}:H{row_num}', [[nombre, categoria_id, precio, duracion, costo_insumos, 1, descripcion]])
-    st.cache_data.clear()
+    get_repositorio().actualizar('servicios', servicio_id, {
+        'nombre': nombre, 'categoria_id': categoria_id, 'precio': precio,
+        'duracion_minutos': duracion, 'costo_insumos': costo_insumos, 'activo': 1,
+        'descripcion': descripcion
+    })
 
+@medido
 def eliminar_servicio(servicio_id):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('servicios')
-    row_num = find_row_by_id(worksheet, servicio_id)
-    if row_num:
-        worksheet.update(f'G{row_num}', [[0]])
-    st.cache_data.clear()
+    get_repositorio().actualizar('servicios', servicio_id, {'activo': 0})
 
+@medido
 def actualizar_solicitud(solicitud_id, estado, notas_admin):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('solicitudes')
-    row_num = find_row_by_id(worksheet, solicitud_id)
-    if row_num:
-        worksheet.update(f'H{row_num}:K{row_num}', [[estado, datetime.now().isoformat(), notas_admin]])
-    st.cache_data.clear()
+    get_repositorio().actualizar('solicitudes', solicitud_id, {
+        'estado': estado, 'fecha_respuesta': datetime.now().isoformat(), 'notas_admin': notas_admin
+    })
+
+@medido
+def actualizar_cita(cita_id, fecha, hora, servicio_id, precio):
+    get_repositorio().actualizar('citas', cita_id, {
+        'fecha': str(fecha), 'hora': str(hora), 'servicio_id': int(servicio_id), 'precio_cobrado': float(precio)
+    })
 
+@medido
 def eliminar_cliente(cliente_id):
     citas = get_citas()
     if len(citas) > 0 and cliente_id in citas['cliente_id'].values:
         return False, len(citas[citas['cliente_id'] == cliente_id])
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('clientes')
-    row_num = find_row_by_id(worksheet, cliente_id)
-    if row_num:
-        worksheet.delete_rows(row_num)
-    st.cache_data.clear()
+    get_repositorio().eliminar('clientes', cliente_id)
     return True, 0
 
+@medido
 def eliminar_cita(cita_id):
-    spreadsheet = get_spreadsheet()
-    worksheet = spreadsheet.worksheet('citas')
-    row_num = find_row_by_id(worksheet, cita_id)
-    if row_num:
-        worksheet.delete_rows(row_num)
-    st.cache_data.clear()
+    get_repositorio().eliminar('citas', cita_id)
 
 # ============================================
 # ESTADO DE NAVEGACIÓN
@@ -885,15 +756,30 @@ if 'editar_cita' not in st.session_state:
 # OBTENER DATOS GLOBALES
 # ============================================
 
+# Traza de este rerun (se ve en Configuración → Rendimiento)
+instrumentacion.iniciar_rerun(st.session_state.pagina)
+
+# Tablas que lee cada página (el dashboard se sirve con proyecciones de citas)
+TABLAS_POR_PAGINA = {
+    'agenda': ['citas', 'clientes', 'servicios', 'categorias'],
+    'registrar': ['clientes', 'servicios', 'categorias'],
+    'clientes': ['clientes', 'citas'],
+    'servicios': ['servicios', 'categorias'],
+    'gastos': ['gastos_fijos', 'gastos_variables'],
+    'proyecciones': ['citas', 'servicios', 'categorias', 'gastos_fijos', 'gastos_variables'],
+}
+
+# Las hojas que falten se piden ya en segundo plano; cada get_* espera solo si aún no han llegado
+get_snapshot().precargar(TABLAS_POR_PAGINA.get(st.session_state.pagina, []))
+
 # Filtros de fecha (usando el mes actual completo)
 fecha_inicio = datetime.now().replace(day=1).date()
 # Último día del mes
 siguiente_mes = datetime.now().replace(day=28) + timedelta(days=4)
 fecha_fin = (siguiente_mes - timedelta(days=siguiente_mes.day)).date()
 
-# Contar solicitudes pendientes
-solicitudes = get_solicitudes()
-pendientes = len(solicitudes[solicitudes['estado'] == 'pendiente']) if len(solicitudes) > 0 else 0
+# Contar solicitudes pendientes (sin esperar a recargas: la copia se refresca en segundo plano)
+pendientes = contar_pendientes()
 
 # ============================================
 # NAVEGACIÓN INFERIOR (FUNCIONAL)
@@ -995,6 +881,7 @@ st.markdown(f"""
 # ============================================
 
 pagina = st.session_state.pagina
+evento_pagina = instrumentacion.abrir(f'pagina:{pagina}', 'pagina')
 
 # ---------- DASHBOARD ----------
 if pagina == 'dashboard':
@@ -1014,7 +901,7 @@ if pagina == 'dashboard':
         st.markdown('<h2 class="section-title">📅 Citas de Hoy</h2>', unsafe_allow_html=True)
         
         for _, cita in citas_hoy.iterrows():
-            hora_str = str(cita['hora'])[:5] if cita['hora'] else 'Sin hora'
+            hora_str = formato_hora(cita['hora']) or 'Sin hora'
             cliente_nom = cita.get('cliente_nombre', 'Sin nombre')
             servicio_nom = cita.get('servicio_nombre', 'Sin servicio')
 
@@ -1041,7 +928,7 @@ if pagina == 'dashboard':
         """, unsafe_allow_html=True)
     
     # Obtener datos del mes
-    citas = get_citas(fecha_inicio, fecha_fin)
+    citas = get_resumen_citas(fecha_inicio, fecha_fin)
     
     if len(citas) == 0:
         ingresos = 0
@@ -1096,7 +983,6 @@ if pagina == 'dashboard':
         st.markdown("---")
         st.markdown('<h2 class="section-title">Ingresos del Mes</h2>', unsafe_allow_html=True)
         
-        citas['fecha'] = pd.to_datetime(citas['fecha'])
         ingresos_diarios = citas.groupby('fecha')['precio_cobrado'].sum().reset_index()
         
         fig = px.area(ingresos_diarios, x='fecha', y='precio_cobrado',
@@ -1125,45 +1011,33 @@ elif pagina == 'agenda':
     # Selector de vista
     vista = st.radio("Ver:", ["Hoy", "Esta semana", "Este mes"], horizontal=True)
     
-    # Obtener todas las citas
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'fecha', 'hora', 'cliente_id', 'servicio_id', 'precio_cobrado', 'propina', 'canal_origen', 'metodo_pago', 'notas', 'created_at']
-    worksheet_citas = get_or_create_worksheet(spreadsheet, 'citas', headers)
-    data = worksheet_citas.get_all_records()
-    citas_df = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
+    # Vista de citas enriquecidas, indexada por fecha
+    citas = get_vista_citas().por_fecha()
     
-    if len(citas_df) == 0:
+    if len(citas) == 0:
         st.info("📅 No hay citas registradas")
     else:
-        # Convertir fecha
-        citas_df['fecha'] = pd.to_datetime(citas_df['fecha'], errors='coerce')
-        
         # Filtrar según vista
         hoy = datetime.now().date()
         
         if vista == "Hoy":
-            citas_filtradas = citas_df[citas_df['fecha'].dt.date == hoy]
+            citas_filtradas = citas.rango(hoy, hoy)
             titulo_seccion = "Citas de Hoy"
         elif vista == "Esta semana":
             inicio_semana = hoy - timedelta(days=hoy.weekday())
             fin_semana = inicio_semana + timedelta(days=6)
-            citas_filtradas = citas_df[
-                (citas_df['fecha'].dt.date >= inicio_semana) & 
-                (citas_df['fecha'].dt.date <= fin_semana)
-            ]
+            citas_filtradas = citas.rango(inicio_semana, fin_semana)
             titulo_seccion = f"Citas de la Semana ({inicio_semana.strftime('%d/%m')} - {fin_semana.strftime('%d/%m')})"
         else:  # Este mes
-            citas_filtradas = citas_df[
-                (citas_df['fecha'].dt.month == hoy.month) & 
-                (citas_df['fecha'].dt.year == hoy.year)
-            ]
+            inicio_mes = hoy.replace(day=1)
+            fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            citas_filtradas = citas.rango(inicio_mes, fin_mes)
             titulo_seccion = f"Citas de {hoy.strftime('%B %Y')}"
         
         # Ordenar por fecha y hora
         citas_filtradas = citas_filtradas.sort_values(['fecha', 'hora'])
         
-        # Obtener info de clientes y servicios
-        clientes = get_clientes()
+        # Servicios para el formulario de edición
         servicios = get_servicios()
         
         st.markdown(f'<p style="color: #8E8E93; font-size: 0.9rem; margin-bottom: 16px;">{titulo_seccion} • {len(citas_filtradas)} cita(s)</p>', unsafe_allow_html=True)
@@ -1187,19 +1061,13 @@ elif pagina == 'agenda':
                 for _, cita in citas_del_dia.iterrows():
                     cita_id = int(cita['id'])
                     
-                    # Obtener nombre del cliente
-                    cliente_nombre = "Cliente desconocido"
-                    if len(clientes) > 0 and cita['cliente_id'] in clientes['id'].values:
-                        cliente_nombre = clientes[clientes['id'] == cita['cliente_id']]['nombre'].values[0]
-                    
-                    # Obtener nombre del servicio
-                    servicio_nombre = "Servicio"
+                    # Nombres ya resueltos en la vista
+                    cliente_nombre = cita['cliente_nombre'] if pd.notna(cita['cliente_nombre']) else "Cliente desconocido"
+                    servicio_nombre = cita['servicio_nombre'] if pd.notna(cita['servicio_nombre']) else "Servicio"
                     servicio_actual_id = cita['servicio_id']
-                    if len(servicios) > 0 and servicio_actual_id in servicios['id'].values:
-                        servicio_nombre = servicios[servicios['id'] == servicio_actual_id]['nombre'].values[0]
                     
-                    hora_str = str(cita['hora'])[:5] if cita['hora'] else 'Sin hora'
-                    precio = cita['precio_cobrado'] if cita['precio_cobrado'] else 0
+                    hora_str = formato_hora(cita['hora']) or 'Sin hora'
+                    precio = cita['precio_cobrado'] if pd.notna(cita['precio_cobrado']) else 0
 
                     # Mostrar tarjeta de cita
                     st.markdown(f"""
@@ -1228,8 +1096,7 @@ elif pagina == 'agenda':
                             fecha_actual = hoy
                         
                         try:
-                            hora_parts = str(cita['hora']).split(':')
-                            hora_actual = datetime.strptime(f"{hora_parts[0]}:{hora_parts[1]}", "%H:%M").time()
+                            hora_actual = datetime.strptime(formato_hora(cita['hora']), "%H:%M").time()
                         except:
                             hora_actual = datetime.strptime("10:00", "%H:%M").time()
                         
@@ -1271,15 +1138,9 @@ elif pagina == 'agenda':
                         col_guardar, col_cancelar = st.columns(2)
                         with col_guardar:
                             if st.button("💾 Guardar", key=f"save_edit_{cita_id}", use_container_width=True):
-                                row_num = find_row_by_id(worksheet_citas, cita_id)
-                                if row_num:
-                                    # Actualizar: fecha, hora, servicio_id, precio
-                                    worksheet_citas.update(f'B{row_num}', [[str(nueva_fecha)]])
-                                    worksheet_citas.update(f'C{row_num}', [[str(nueva_hora)]])
-                                    worksheet_citas.update(f'E{row_num}', [[int(nuevo_servicio_id)]])
-                                    worksheet_citas.update(f'F{row_num}', [[float(nuevo_precio)]])
+                                # Actualizar: fecha, hora, servicio_id, precio
+                                actualizar_cita(cita_id, nueva_fecha, nueva_hora, nuevo_servicio_id, nuevo_precio)
                                 st.session_state.editar_cita = None
-                                st.cache_data.clear()
                                 st.success("✅ Cita actualizada")
                                 st.rerun()
                         with col_cancelar:
@@ -1295,11 +1156,8 @@ elif pagina == 'agenda':
                         col_si, col_no = st.columns(2)
                         with col_si:
                             if st.button("✅ Sí, eliminar", key=f"confirm_del_{cita_id}", use_container_width=True):
-                                row_num = find_row_by_id(worksheet_citas, cita_id)
-                                if row_num:
-                                    worksheet_citas.delete_rows(row_num)
+                                eliminar_cita(cita_id)
                                 st.session_state.confirmar_eliminar_cita = None
-                                st.cache_data.clear()
                                 st.success("✅ Cita eliminada")
                                 st.rerun()
                         with col_no:
@@ -1393,12 +1251,7 @@ elif pagina == 'solicitudes':
     st.markdown('<h2 class="section-title">📋 Solicitudes</h2>', unsafe_allow_html=True)
     
     # Forzar recarga de datos (sin caché para solicitudes)
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'nombre', 'telefono', 'email', 'servicio_solicitado', 'preferencia_horario', 
-               'mensaje', 'estado', 'fecha_solicitud', 'fecha_respuesta', 'notas_admin']
-    worksheet = get_or_create_worksheet(spreadsheet, 'solicitudes', headers)
-    data = worksheet.get_all_records()
-    solicitudes = pd.DataFrame(data) if data else pd.DataFrame(columns=headers)
+    solicitudes = get_snapshot().tabla('solicitudes', recargar=True)
     
     tab1, tab2, tab3 = st.tabs(["⏳ Pendientes", "✅ Confirmadas", "❌ Rechazadas"])
     
@@ -1463,9 +1316,7 @@ Tu cita en BeautyBox Málaga ha sido *CONFIRMADA* ✅
                     if st.button("💾 Guardar cambios", key=f"save_{sol['id']}"):
                         nuevo_horario = f"{nueva_fecha} a las {nueva_hora.strftime('%H:%M')}"
                         # Actualizar en Google Sheets
-                        row_num = find_row_by_id(worksheet, sol['id'])
-                        if row_num:
-                            worksheet.update(f'F{row_num}', [[nuevo_horario]])
+                        get_repositorio().actualizar('solicitudes', sol['id'], {'preferencia_horario': nuevo_horario})
                         st.success("✅ Fecha actualizada")
                         st.rerun()
                 
@@ -1478,98 +1329,92 @@ Tu cita en BeautyBox Málaga ha sido *CONFIRMADA* ✅
                 with col1:
                     if st.button("✅ Confirmar", key=f"conf_{sol['id']}", use_container_width=True):
                         try:
-                            # 1. Buscar si el cliente ya existe
-                            cliente_id = buscar_cliente_existente(sol['telefono'], sol['email'])
+                            # Todas las escrituras de la confirmación se envían juntas al salir del lote
+                            with get_repositorio().lote():
+                                # 1. Buscar si el cliente ya existe
+                                cliente_id = buscar_cliente_existente(sol['telefono'], sol['email'])
                             
-                            if cliente_id:
-                                pass  # Cliente existente
-                            else:
-                                # Crear nuevo cliente
-                                cliente_id = insertar_cliente(
-                                    sol['nombre'], 
-                                    sol['telefono'], 
-                                    sol['email'], 
-                                    'Web',
-                                    f"Solicitud #{sol['id']}"
-                                )
+                                if cliente_id:
+                                    pass  # Cliente existente
+                                else:
+                                    # Crear nuevo cliente
+                                    cliente_id = insertar_cliente(
+                                        sol['nombre'], 
+                                        sol['telefono'], 
+                                        sol['email'], 
+                                        'Web',
+                                        f"Solicitud #{sol['id']}"
+                                    )
                             
-                            # 2. Extraer fecha y hora de preferencia_horario
-                            try:
-                                partes = str(sol['preferencia_horario']).split(' a las ')
-                                fecha_cita = partes[0].strip() if len(partes) > 0 else datetime.now().strftime('%Y-%m-%d')
-                                hora_cita = partes[1].strip() if len(partes) > 1 else '10:00'
-                            except:
-                                fecha_cita = datetime.now().strftime('%Y-%m-%d')
-                                hora_cita = '10:00'
+                                # 2. Extraer fecha y hora de preferencia_horario
+                                try:
+                                    partes = str(sol['preferencia_horario']).split(' a las ')
+                                    fecha_cita = partes[0].strip() if len(partes) > 0 else datetime.now().strftime('%Y-%m-%d')
+                                    hora_cita = partes[1].strip() if len(partes) > 1 else '10:00'
+                                except:
+                                    fecha_cita = datetime.now().strftime('%Y-%m-%d')
+                                    hora_cita = '10:00'
                             
-                            # 3. Buscar el servicio por nombre
-                            servicios = get_servicios()
-                            servicio_id = None
-                            precio_servicio = 50  # Por defecto
+                                # 3. Buscar el servicio por nombre
+                                servicios = get_servicios()
+                                servicio_id = None
+                                precio_servicio = 50  # Por defecto
                             
-                            if len(servicios) > 0:
-                                # Buscar servicio que coincida con el nombre
-                                servicio_solicitado = str(sol['servicio_solicitado'])
+                                if len(servicios) > 0:
+                                    # Buscar servicio que coincida con el nombre
+                                    servicio_solicitado = str(sol['servicio_solicitado'])
                                 
-                                # Intentar match exacto primero
-                                servicio_match = servicios[servicios['nombre'].str.lower() == servicio_solicitado.lower()]
+                                    # Intentar match exacto primero
+                                    servicio_match = servicios[servicios['nombre'].str.lower() == servicio_solicitado.lower()]
                                 
-                                # Si no hay match exacto, buscar parcial
-                                if len(servicio_match) == 0:
-                                    palabras = servicio_solicitado.split()
-                                    for palabra in palabras:
-                                        if len(palabra) > 3:  # Ignorar palabras cortas
-                                            servicio_match = servicios[servicios['nombre'].str.contains(palabra, case=False, na=False)]
-                                            if len(servicio_match) > 0:
-                                                break
+                                    # Si no hay match exacto, buscar parcial
+                                    if len(servicio_match) == 0:
+                                        palabras = servicio_solicitado.split()
+                                        for palabra in palabras:
+                                            if len(palabra) > 3:  # Ignorar palabras cortas
+                                                servicio_match = servicios[servicios['nombre'].str.contains(palabra, case=False, na=False)]
+                                                if len(servicio_match) > 0:
+                                                    break
                                 
-                                # Si encontró match, usar ese servicio
-                                if len(servicio_match) > 0:
-                                    servicio_id = int(servicio_match.iloc[0]['id'])
-                                    precio_servicio = float(servicio_match.iloc[0]['precio'])
+                                    # Si encontró match, usar ese servicio
+                                    if len(servicio_match) > 0:
+                                        servicio_id = int(servicio_match.iloc[0]['id'])
+                                        precio_servicio = float(servicio_match.iloc[0]['precio'])
+                                    else:
+                                        # Usar el primer servicio disponible
+                                        servicio_id = int(servicios.iloc[0]['id'])
+                                        precio_servicio = float(servicios.iloc[0]['precio'])
                                 else:
-                                    # Usar el primer servicio disponible
-                                    servicio_id = int(servicios.iloc[0]['id'])
-                                    precio_servicio = float(servicios.iloc[0]['precio'])
-                            else:
-                                # NO HAY SERVICIOS - Crear uno por defecto
-                                st.warning("⚠️ No hay servicios. Creando servicio por defecto...")
-                                insertar_servicio(
-                                    sol['servicio_solicitado'],  # nombre
-                                    1,  # categoria_id (Pestañas)
-                                    50,  # precio
-                                    60,  # duracion
-                                    5,   # costo_insumos
-                                    "Creado automáticamente"
-                                )
-                                servicio_id = 1
-                                precio_servicio = 50
-                            
-                            # 4. Crear la cita
-                            insertar_cita(
-                                fecha_cita,
-                                hora_cita,
-                                cliente_id,
-                                servicio_id,
-                                precio_servicio,
-                                0,  # propina
-                                'Web',  # canal
-                                'Pendiente',  # método de pago
-                                f"Solicitud #{sol['id']} - {comentario if comentario else ''}"
-                            )
+                                    # NO HAY SERVICIOS - Crear uno por defecto
+                                    st.warning("⚠️ No hay servicios. Creando servicio por defecto...")
+                                    insertar_servicio(
+                                        sol['servicio_solicitado'],  # nombre
+                                        1,  # categoria_id (Pestañas)
+                                        50,  # precio
+                                        60,  # duracion
+                                        5,   # costo_insumos
+                                        "Creado automáticamente"
+                                    )
+                                    servicio_id = 1
+                                    precio_servicio = 50
                             
-                            # 5. Actualizar estado de la solicitud
-                            row_num = find_row_by_id(worksheet, sol['id'])
-                            if row_num:
-                                fecha_respuesta = datetime.now().isoformat()
-                                worksheet.update(f'H{row_num}', [['confirmada']])
-                                worksheet.update(f'J{row_num}', [[fecha_respuesta]])
-                                worksheet.update(f'K{row_num}', [[comentario if comentario else '']])
+                                # 4. Crear la cita
+                                insertar_cita(
+                                    fecha_cita,
+                                    hora_cita,
+                                    cliente_id,
+                                    servicio_id,
+                                    precio_servicio,
+                                    0,  # propina
+                                    'Web',  # canal
+                                    'Pendiente',  # método de pago
+                                    f"Solicitud #{sol['id']} - {comentario if comentario else ''}"
+                                )
                             
-                            # 6. Limpiar caché para reflejar cambios
-                            st.cache_data.clear()
+                                # 5. Actualizar estado de la solicitud
+                                actualizar_solicitud(sol['id'], 'confirmada', comentario if comentario else '')
                             
-                            # 7. Guardar datos para mostrar WhatsApp
+                            # 6. Guardar datos para mostrar WhatsApp
                             st.session_state.solicitud_confirmada = {
                                 'nombre': sol['nombre'],
                                 'telefono': sol['telefono'],
@@ -1584,12 +1429,7 @@ Tu cita en BeautyBox Málaga ha sido *CONFIRMADA* ✅
                 
                 with col2:
                     if st.button("❌ Rechazar", key=f"rech_{sol['id']}", use_container_width=True):
-                        row_num = find_row_by_id(worksheet, sol['id'])
-                        if row_num:
-                            fecha_respuesta = datetime.now().isoformat()
-                            worksheet.update(f'H{row_num}', [['rechazada']])
-                            worksheet.update(f'J{row_num}', [[fecha_respuesta]])
-                            worksheet.update(f'K{row_num}', [[comentario]])
+                        actualizar_solicitud(sol['id'], 'rechazada', comentario)
                         st.warning("Solicitud rechazada")
                         st.rerun()
                 
@@ -1789,7 +1629,7 @@ elif pagina == 'gastos':
                     <div class="list-item">
                         <div class="list-item-content">
                             <div class="list-item-title">{gv['concepto']}</div>
-                            <div class="list-item-subtitle">{gv['fecha']} • {gv['categoria']}</div>
+                            <div class="list-item-subtitle">{formato_fecha(gv['fecha'])} • {gv['categoria']}</div>
                         </div>
                         <div class="list-item-value">€{gv['monto']}</div>
                     </div>
@@ -1836,23 +1676,9 @@ elif pagina == 'proyecciones':
         gastos_fijos = gastos_fijos_df['monto'].sum() if len(gastos_fijos_df) > 0 else 0
         gastos_mes = gastos_var + gastos_fijos
 
-        # Calcular costo de insumos de las citas
+        # Calcular costo de insumos de las citas (ya viene en la vista de citas)
         if len(citas_mes) > 0:
-            servicios_df = get_servicios()
-            if len(servicios_df) > 0 and 'costo_insumos' in servicios_df.columns:
-                try:
-                    citas_con_costo = citas_mes.merge(
-                        servicios_df[['id', 'costo_insumos']],
-                        left_on='servicio_id',
-                        right_on='id',
-                        how='left',
-                        suffixes=('', '_srv')
-                    )
-                    if 'costo_insumos' in citas_con_costo.columns:
-                        costo_insumos = citas_con_costo['costo_insumos'].fillna(0).sum()
-                        gastos_mes += costo_insumos
-                except Exception:
-                    pass
+            gastos_mes += pd.to_numeric(citas_mes['costo_insumos'], errors='coerce').fillna(0).sum()
 
         beneficio_mes = ingresos_mes - gastos_mes
 
@@ -1882,20 +1708,7 @@ elif pagina == 'proyecciones':
     gastos_actual = gastos_var_actual_total + gastos_fijos_total
 
     if len(citas_actual) > 0:
-        servicios_df = get_servicios()
-        if len(servicios_df) > 0 and 'costo_insumos' in servicios_df.columns:
-            try:
-                citas_con_costo = citas_actual.merge(
-                    servicios_df[['id', 'costo_insumos']],
-                    left_on='servicio_id',
-                    right_on='id',
-                    how='left',
-                    suffixes=('', '_srv')
-                )
-                if 'costo_insumos' in citas_con_costo.columns:
-                    gastos_actual += citas_con_costo['costo_insumos'].fillna(0).sum()
-            except Exception:
-                pass
+        gastos_actual += pd.to_numeric(citas_actual['costo_insumos'], errors='coerce').fillna(0).sum()
 
     beneficio_actual = ingresos_actual - gastos_actual
 
@@ -2109,10 +1922,81 @@ elif pagina == 'config':
         </div>
         """, unsafe_allow_html=True)
     
+    # Sincronización del almacenamiento local con Google Sheets
+    repo = get_repositorio()
+    if not usa_sheets():
+        st.markdown('<h3 class="section-title" style="margin-top: 24px;">☁️ Google Sheets</h3>', unsafe_allow_html=True)
+        st.caption("Los datos se guardan en local. Sincroniza para actualizar BeautyBox_Database.")
+        if st.button("☁️ Sincronizar con Google Sheets", use_container_width=True):
+            try:
+                tablas = sincronizar(repo, get_repositorio_sheets())
+                st.success(f"✅ {len(tablas)} tablas sincronizadas")
+            except Exception as e:
+                st.error(f"❌ Error al sincronizar: {e}")
+    
+    # Rendimiento de los últimos reruns
+    st.markdown('<h3 class="section-title" style="margin-top: 24px;">⏱️ Rendimiento</h3>', unsafe_allow_html=True)
+    n_trazas = st.slider("Últimos reruns", min_value=5, max_value=instrumentacion.MAX_TRAZAS, value=10)
+    trazas = instrumentacion.ultimas(n_trazas)
+    if len(trazas) == 0:
+        st.caption("Todavía no hay reruns registrados en este proceso.")
+    else:
+        resumen = pd.DataFrame([{
+            'inicio': t['inicio'][11:],
+            'página': t['pagina'],
+            'total ms': t['ms'],
+            'página ms': sum(e['ms'] or 0 for e in t['eventos'] if e['tipo'] == 'pagina'),
+            'lecturas ms': sum(e['ms'] or 0 for e in t['eventos'] if e['tipo'] == 'lectura' and e['nivel'] <= 1),
+            'API': t['llamadas_api'],
+            'aciertos': t['aciertos_cache'],
+            'fallos': t['fallos_cache'],
+            'filas leídas': t['filas_leidas'],
+        } for t in trazas])
+        st.dataframe(resumen, hide_index=True, use_container_width=True)
+        
+        elegida = st.selectbox("Detalle del rerun", options=range(len(trazas)),
+                               format_func=lambda i: f"{trazas[i]['inicio'][11:]} · {trazas[i]['pagina']} · {trazas[i]['ms']} ms")
+        eventos = pd.DataFrame(trazas[elegida]['eventos'])
+        if len(eventos) > 0:
+            eventos['nombre'] = ['  ' * nivel + nombre for nivel, nombre in zip(eventos['nivel'], eventos['nombre'])]
+            columnas = [c for c in ['nombre', 'tipo', 'ms', 'llamadas_api', 'cache', 'filas'] if c in eventos.columns]
+            st.dataframe(eventos[columnas], hide_index=True, use_container_width=True)
+        if instrumentacion.archivo_trazas():
+            st.caption(f"Historial completo en {instrumentacion.archivo_trazas()}")
+    
+    if usa_sheets():
+        cuota = get_limitador().cuota()
+        st.caption(f"Cuota de Google Sheets: {cuota['lecturas']}/{cuota['lecturas_max']} lecturas y "
+                   f"{cuota['escrituras']}/{cuota['escrituras_max']} escrituras disponibles · "
+                   f"{cuota['reintentos']} reintentos · {cuota['segundos_en_cola']:.1f} s en cola")
+        n_envios_pendientes = len(repo.pendientes())
+        if n_envios_pendientes:
+            st.caption(f"📤 {n_envios_pendientes} cambios guardados en local, pendientes de enviar a Google Sheets")
+        fallidos = repo.fallidos()
+        if fallidos:
+            n_cambios = sum(len(cambios) for _, cambios, _ in fallidos)
+            st.warning(f"⚠️ {n_cambios} cambios no se pudieron enviar a Google Sheets y no aparecen en los datos. "
+                       f"Último error: {fallidos[-1][2]}")
+            if st.button("📤 Reintentar envío", use_container_width=True):
+                repo.reintentar_fallidos()
+                st.rerun()
+    
+    notificador = get_notificador()
+    avisos_fallidos = notificador.cola.fallidos() if notificador is not None else []
+    if avisos_fallidos:
+        st.warning(f"⚠️ {len(avisos_fallidos)} avisos por email de solicitudes no se pudieron enviar. "
+                   f"Último error: {avisos_fallidos[-1][2]}")
+        if st.button("📧 Reintentar avisos", use_container_width=True):
+            notificador.reintentar_fallidos()
+            st.rerun()
+    
     # Botón refrescar
     st.markdown("---")
     if st.button("🔄 Actualizar Datos", use_container_width=True):
-        st.cache_data.clear()
+        if usa_sheets():
+            get_repositorio_sheets().olvidar_hojas()
+        # Los lectores compartidos se recalculan solos al cambiar la versión de sus tablas
+        get_snapshot().invalidar()
         st.rerun()
     
     # Info
@@ -2123,6 +2007,8 @@ elif pagina == 'config':
     </div>
     """, unsafe_allow_html=True)
 
+instrumentacion.cerrar(evento_pagina)
+
 # ============================================
 # NAVEGACIÓN INFERIOR CON BOTONES
 # ============================================
@@ -2177,3 +2063,5 @@ if pagina not in ['registrar']:
         if st.button("⚙️\nConfig", key="nav_config", use_container_width=True):
             st.session_state.pagina = 'config'
             st.rerun()
+
+instrumentacion.terminar_rerun()
@@ -0,0 +1,21 @@
+"""
+Capa de datos de BeautyBox Málaga.
+
+app.py y las páginas acceden a los datos a través de un Repositorio
+(Google Sheets o SQLite local) en lugar de usar gspread directamente.
+"""
+
+from beautybox.esquema import ESQUEMAS, headers
+from beautybox.repositorio import Repositorio, config_almacenamiento, sincronizar
+from beautybox.sheets import SheetsRepositorio
+from beautybox.sqlite_local import SQLiteRepositorio
+
+__all__ = [
+    'ESQUEMAS',
+    'Repositorio',
+    'SQLiteRepositorio',
+    'SheetsRepositorio',
+    'config_almacenamiento',
+    'headers',
+    'sincronizar',
+]
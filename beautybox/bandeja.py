@@ -0,0 +1,372 @@
+"""
+Bandeja de salida: las escrituras se guardan primero en local y se envían después.
+
+Con Google Sheets lento o caído, guardar una cita o una solicitud ya no
+espera a la API ni se pierde. RepositorioDiferido anota cada lote de
+escrituras en un SQLite local (BandejaSalida), avisa al momento a quien
+mantiene copias en memoria (al_cambiar) y un hilo lo envía al repositorio
+real en segundo plano: los lotes que se acumulan se envían juntos (en
+Sheets, un solo batch_update) y los fallos se reintentan cada vez más
+espaciados. Mientras esperan, SnapshotTablas los superpone a lo que lee de
+la fuente (ver pendientes()), así que la app ve sus propias escrituras. Un
+lote que sigue fallando tras MAX_INTENTOS se aparta (fallidos()) y
+Configuración lo muestra y ofrece volver a enviarlo.
+
+Los ids se asignan al anotar, con los bloques reservados de siempre (ver
+ids.py); el hilo tiene siempre reservado el bloque siguiente de cada tabla,
+así que insertar no necesita la API salvo si se arranca con ella caída. Un lote que falla
+puede haber llegado a escribirse (p. ej. si se cortó la respuesta): al
+reintentarlo se comprueba qué ids ya están en la hoja para no duplicar
+filas. Varios procesos pueden compartir el fichero: cada envío toma los
+lotes con un turno que caduca si el proceso muere.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from itertools import takewhile
+
+from beautybox.esquema import ESQUEMAS, a_nativo
+from beautybox.ids import como_id
+from beautybox.lotes import Cambio
+from beautybox.repositorio import Repositorio
+
+# Segundos que se esperan tras una escritura para enviar juntas las de una ráfaga
+AGRUPAR = 0.3
+
+# Lotes como mucho por envío
+MAX_LOTES = 50
+
+# Reintentos: espera inicial, máxima (se dobla en cada fallo) e intentos antes de descartar un lote
+ESPERA_INICIAL = 2
+ESPERA_MAXIMA = 300
+MAX_INTENTOS = 20
+
+# Segundos que un proceso se reserva los lotes que está enviando
+TURNO = 120
+
+registro = logging.getLogger(__name__)
+
+
+def a_json(cambios):
+    return json.dumps([[c.tabla, c.tipo, a_nativo(c.id),
+                        None if c.valores is None else {k: a_nativo(v) for k, v in c.valores.items()}]
+                       for c in cambios], default=str)
+
+
+def de_json(texto):
+    return [Cambio(*cambio) for cambio in json.loads(texto)]
+
+
+class BandejaSalida:
+    """Lotes de escrituras pendientes de enviar, en un SQLite (WAL) local"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.dueno = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._conexion = sqlite3.connect(ruta, timeout=10, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            # Un lote anotado ya no se pierde aunque se vaya la luz
+            self._conexion.execute('PRAGMA synchronous=FULL')
+            self._conexion.execute('''
+                CREATE TABLE IF NOT EXISTS lotes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cambios TEXT NOT NULL,
+                    tablas TEXT NOT NULL,
+                    creado_en REAL NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    siguiente_en REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    dueno TEXT,
+                    hasta REAL NOT NULL DEFAULT 0,
+                    fallido INTEGER NOT NULL DEFAULT 0
+                )''')
+
+    def _transaccion(self, funcion):
+        with self._lock:
+            self._conexion.execute('BEGIN IMMEDIATE')
+            try:
+                resultado = funcion(self._conexion)
+                self._conexion.execute('COMMIT')
+                return resultado
+            except sqlite3.Error:
+                self._conexion.execute('ROLLBACK')
+                raise
+
+    def anotar(self, cambios):
+        """Guardar un lote de Cambio; devuelve su número"""
+        tablas = ','.join(sorted({cambio.tabla for cambio in cambios}))
+        with self._lock:
+            cursor = self._conexion.execute('INSERT INTO lotes (cambios, tablas, creado_en) VALUES (?, ?, ?)',
+                                            [a_json(cambios), tablas, time.time()])
+            return cursor.lastrowid
+
+    def pendientes(self, tabla=None):
+        """Cambios por enviar en el orden en que se hicieron (solo los de `tabla` si se da)"""
+        with self._lock:
+            filas = self._conexion.execute('SELECT cambios, tablas FROM lotes WHERE NOT fallido ORDER BY seq').fetchall()
+        return [cambio for texto, tablas in filas if tabla is None or tabla in tablas.split(',')
+                for cambio in de_json(texto) if tabla is None or cambio.tabla == tabla]
+
+    def __len__(self):
+        with self._lock:
+            return self._conexion.execute('SELECT COUNT(*) FROM lotes WHERE NOT fallido').fetchone()[0]
+
+    def fallidos(self):
+        """Lotes descartados tras MAX_INTENTOS: [(seq, [Cambio], error)]"""
+        with self._lock:
+            filas = self._conexion.execute('SELECT seq, cambios, error FROM lotes WHERE fallido ORDER BY seq').fetchall()
+        return [(seq, de_json(texto), error) for seq, texto, error in filas]
+
+    def recuperar(self):
+        """Volver a poner en cola los lotes descartados; devuelve sus Cambio"""
+        def recuperar(conexion):
+            filas = conexion.execute('SELECT cambios FROM lotes WHERE fallido ORDER BY seq').fetchall()
+            # Conservan sus intentos: se envían como dudosos y, si vuelven a fallar, se descartan otra vez
+            conexion.execute('UPDATE lotes SET fallido = 0, siguiente_en = 0 WHERE fallido')
+            return [cambio for (texto,) in filas for cambio in de_json(texto)]
+        return self._transaccion(recuperar)
+
+    def tomar(self, maximo=MAX_LOTES, segundos=TURNO):
+        """Reservar los primeros lotes para enviarlos: [(seq, [Cambio], dudoso)].
+
+        dudoso: el lote ya se intentó enviar (aquí, en un envío que se cortó
+        sin llegar a apuntar el resultado, o en un proceso que murió) y puede
+        estar escrito.
+
+        Nada si el primero está esperando su reintento o lo está enviando otro
+        proceso: los lotes se envían en orden. Tras un fallo se envía solo el
+        primero, para que un lote que no entra no retenga a los demás.
+        """
+        def tomar(conexion):
+            ahora = time.time()
+            filas = conexion.execute('SELECT seq, cambios, intentos, siguiente_en, dueno, hasta FROM lotes '
+                                     'WHERE NOT fallido ORDER BY seq LIMIT ?', [maximo]).fetchall()
+            if not filas:
+                return []
+            _, _, intentos, siguiente_en, dueno, hasta = filas[0]
+            if siguiente_en > ahora or (dueno != self.dueno and hasta > ahora):
+                return []
+            if intentos:
+                filas = filas[:1]
+            else:
+                filas = list(takewhile(lambda f: not f[2] and (f[4] == self.dueno or f[5] <= ahora), filas))
+            conexion.executemany('UPDATE lotes SET dueno = ?, hasta = ? WHERE seq = ?',
+                                 [(self.dueno, ahora + segundos, f[0]) for f in filas])
+            return [(seq, de_json(texto), bool(intentos) or dueno is not None)
+                    for seq, texto, intentos, _, dueno, _ in filas]
+        return self._transaccion(tomar)
+
+    def espera(self):
+        """Segundos hasta que el primer lote se pueda enviar (0 si ya), o None si no hay ninguno"""
+        with self._lock:
+            fila = self._conexion.execute('SELECT siguiente_en, dueno, hasta FROM lotes WHERE NOT fallido '
+                                          'ORDER BY seq LIMIT 1').fetchone()
+        if fila is None:
+            return None
+        siguiente_en, dueno, hasta = fila
+        if dueno != self.dueno:
+            siguiente_en = max(siguiente_en, hasta)
+        return max(siguiente_en - time.time(), 0)
+
+    def enviados(self, seqs):
+        with self._lock:
+            self._conexion.executemany('DELETE FROM lotes WHERE seq = ?', [(seq,) for seq in seqs])
+
+    def reintentar(self, seqs, error):
+        """Devolver los lotes a la cola con la espera del siguiente intento; devuelve los descartados"""
+        def reintentar(conexion):
+            ahora, descartados = time.time(), []
+            for seq in seqs:
+                intentos = conexion.execute('SELECT intentos FROM lotes WHERE seq = ?', [seq]).fetchone()[0] + 1
+                espera = min(ESPERA_INICIAL * 2 ** (intentos - 1), ESPERA_MAXIMA)
+                fallido = intentos >= MAX_INTENTOS
+                if fallido:
+                    descartados.append(seq)
+                conexion.execute('UPDATE lotes SET intentos = ?, siguiente_en = ?, error = ?, dueno = NULL, '
+                                 'hasta = 0, fallido = ? WHERE seq = ?',
+                                 [intentos, ahora + espera, error, int(fallido), seq])
+            return descartados
+        return self._transaccion(reintentar)
+
+
+class RepositorioDiferido(Repositorio):
+    """Repositorio que anota las escrituras en una BandejaSalida y las envía a `destino` en segundo plano.
+
+    Las lecturas van directamente a `destino`. Las escrituras devuelven al
+    momento: actualizar y eliminar no pueden saber si la fila existe y
+    devuelven siempre True (al enviarlas, las de filas que ya no están se
+    descartan).
+    """
+
+    def __init__(self, destino, bandeja):
+        super().__init__()
+        self.destino = destino
+        self.bandeja = bandeja
+        # versiones_escritas se queda vacío: al anotar todavía no hay versión
+        # nueva. Tras cada envío se llama a las funciones de al_enviar con
+        # {tabla: versión escrita por destino} de las tablas enviadas
+        self.al_enviar = []
+        self._despertar = threading.Event()
+        self._enviando = threading.Lock()
+        self._hilo = None
+
+    def arrancar(self):
+        """Lanzar el hilo que envía la bandeja (también lo que quedó de una ejecución anterior)"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._enviar_siempre, name='bandeja', daemon=True)
+            self._hilo.start()
+
+    def preparar(self):
+        self.destino.preparar()
+
+    def leer(self, tabla, desde=None, hasta=None):
+        return self.destino.leer(tabla, desde, hasta)
+
+    def leer_varias(self, tablas):
+        return self.destino.leer_varias(tablas)
+
+    def leer_columnas(self, pedidos):
+        return self.destino.leer_columnas(pedidos)
+
+    def revision(self):
+        return self.destino.revision()
+
+    def versiones(self):
+        return self.destino.versiones()
+
+    def sondear(self, tablas):
+        return self.destino.sondear(tablas)
+
+    def leer_colas(self, desde):
+        return self.destino.leer_colas(desde)
+
+    def siguiente_id(self, tabla):
+        return self.destino.siguiente_id(tabla)
+
+    def pendientes(self, tabla=None):
+        return self.bandeja.pendientes(tabla)
+
+    def fallidos(self):
+        return self.bandeja.fallidos()
+
+    def reintentar_fallidos(self):
+        """Volver a enviar los lotes descartados (y superponerlos otra vez a las copias en memoria)"""
+        tablas = {cambio.tabla for cambio in self.bandeja.recuperar()}
+        if tablas:
+            self._notificar(tablas, [Cambio(tabla, 'reemplazar', None, None) for tabla in tablas])
+            self._despertar.set()
+
+    def insertar(self, tabla, valores):
+        valores = dict(valores)
+        with self.lote() as lote:
+            if not valores.get('id'):
+                valores['id'] = self.siguiente_id(tabla)
+            lote.cambios.append(Cambio(tabla, 'insertar', valores['id'], valores))
+        return valores['id']
+
+    def actualizar(self, tabla, id_valor, cambios):
+        with self.lote() as lote:
+            lote.cambios.append(Cambio(tabla, 'actualizar', id_valor, dict(cambios)))
+        return True
+
+    def eliminar(self, tabla, id_valor):
+        with self.lote() as lote:
+            lote.cambios.append(Cambio(tabla, 'eliminar', id_valor, None))
+        return True
+
+    def _enviar_lote(self, lote):
+        self.bandeja.anotar(lote.cambios)
+        self._despertar.set()
+
+    def reemplazar(self, tabla, df):
+        """Se envía al momento, después de lo que haya en la bandeja"""
+        self.enviar_pendientes()
+        self.destino.reemplazar(tabla, df)
+        self._notificar([tabla], [Cambio(tabla, 'reemplazar', None, None)])
+
+    def _enviar_siempre(self):
+        espera_error = ESPERA_INICIAL
+        while True:
+            try:
+                espera = self.enviar_pendientes()
+                self.anticipar_ids()
+                espera_error = ESPERA_INICIAL
+            except Exception:
+                # Un fallo de la propia bandeja (p. ej. el SQLite bloqueado) no puede parar el hilo:
+                # los lotes tomados quedan reservados hasta TURNO y se reenvían como dudosos
+                registro.exception('Error al enviar la bandeja de salida; se reintenta en %s s', espera_error)
+                espera, espera_error = espera_error, min(espera_error * 2, ESPERA_MAXIMA)
+            if self._despertar.wait(espera):
+                self._despertar.clear()
+                time.sleep(AGRUPAR)
+
+    def enviar_pendientes(self):
+        """Enviar a destino todo lo que se pueda ahora; devuelve los segundos hasta el siguiente intento"""
+        with self._enviando:
+            while True:
+                lotes = self.bandeja.tomar()
+                if not lotes:
+                    return self.bandeja.espera()
+                if not self._enviar(lotes):
+                    return self.bandeja.espera()
+
+    def _enviar(self, lotes):
+        seqs = [seq for seq, _, _ in lotes]
+        cambios = [cambio for _, lote, _ in lotes for cambio in lote]
+        try:
+            # Un lote ya intentado puede haber llegado a escribirse
+            existentes = self._ids_existentes(cambios) if any(dudoso for _, _, dudoso in lotes) else {}
+            perdidas = set()
+            with self.destino.lote():
+                for cambio in cambios:
+                    if cambio.tipo == 'insertar':
+                        if como_id(cambio.id) not in existentes.get(cambio.tabla, ()):
+                            self.destino.insertar(cambio.tabla, cambio.valores)
+                    elif cambio.tipo == 'actualizar':
+                        if not self.destino.actualizar(cambio.tabla, cambio.id, cambio.valores):
+                            perdidas.add(cambio.tabla)
+                    else:
+                        self.destino.eliminar(cambio.tabla, cambio.id)
+        except Exception as e:
+            descartados = self.bandeja.reintentar(seqs, str(e) or type(e).__name__)
+            if descartados:
+                # Las copias en memoria tienen escrituras que no llegarán: se vuelven a leer
+                tablas = {c.tabla for seq, lote, _ in lotes if seq in descartados for c in lote}
+                self._notificar(tablas, [Cambio(tabla, 'reemplazar', None, None) for tabla in tablas])
+            return False
+        self.bandeja.enviados(seqs)
+        if perdidas:
+            # La app ya aplicó cambios a filas que no existían en la hoja
+            self._notificar(perdidas, [Cambio(tabla, 'reemplazar', None, None) for tabla in perdidas])
+        tablas = {cambio.tabla for cambio in cambios} - perdidas
+        versiones = {t: self.destino.versiones_escritas[t] for t in tablas if t in self.destino.versiones_escritas}
+        for funcion in self.al_enviar:
+            funcion(versiones)
+        return True
+
+    def anticipar_ids(self):
+        """Tener reservado el siguiente bloque de ids de cada tabla (ver AsignadorIds.anticipar)"""
+        ids = getattr(self.destino, 'ids', None)
+        if ids is None:
+            return
+        for tabla in ESQUEMAS:
+            try:
+                ids.anticipar(tabla)
+            except Exception:
+                # Sin API se vuelve a intentar en la siguiente vuelta
+                return
+
+    def _ids_existentes(self, cambios):
+        """Ids que ya están en destino de las tablas con inserciones: {tabla: set}"""
+        tablas = {cambio.tabla for cambio in cambios if cambio.tipo == 'insertar'}
+        if not tablas:
+            return {}
+        leidas = self.destino.leer_columnas({tabla: (['id'], None) for tabla in tablas})
+        return {tabla: {como_id(v) for v in df['id']} for tabla, df in leidas.items()}
@@ -0,0 +1,49 @@
+"""
+Invalidación de caché por tabla.
+
+Cada lector cacheado declara qué hojas lee con @lee_tablas(...) y, cuando el
+repositorio escribe en una hoja, solo se limpian los lectores que dependen
+de ella. Añadir un gasto variable ya no obliga a volver a descargar
+clientes, servicios ni categorías.
+"""
+
+import threading
+
+# tabla -> {nombre del lector: función cacheada}
+_LECTORES = {}
+_lock = threading.Lock()
+
+
+def lee_tablas(*tablas):
+    """Declarar las tablas que lee una función cacheada (incluidas las que lee a través de otros lectores).
+
+    Va por encima de @cache_compartida:
+
+        @lee_tablas('servicios', 'categorias')
+        @cache_compartida(versiones('servicios', 'categorias'))
+        def get_servicios(): ...
+    """
+    def decorador(funcion):
+        # Streamlit vuelve a ejecutar el script en cada interacción: se
+        # registra por nombre para sustituir la versión anterior
+        clave = f'{funcion.__module__}.{funcion.__qualname__}'
+        with _lock:
+            for tabla in tablas:
+                _LECTORES.setdefault(tabla, {})[clave] = funcion
+        return funcion
+    return decorador
+
+
+def lectores(*tablas):
+    """Funciones cacheadas que leen alguna de las tablas"""
+    with _lock:
+        funciones = {}
+        for tabla in tablas:
+            funciones.update(_LECTORES.get(tabla, {}))
+    return list(funciones.values())
+
+
+def invalidar(*tablas):
+    """Limpiar solo la caché de los lectores que dependen de estas tablas"""
+    for funcion in lectores(*tablas):
+        funcion.clear()
@@ -0,0 +1,173 @@
+"""
+Citas indexadas por fecha.
+
+La tabla de citas se guarda una sola vez, ordenada por fecha y con un
+DatetimeIndex; cada consulta por rango es un searchsorted sobre el índice y
+un slice, sin volver a descargar ni a filtrar la tabla entera.
+
+VistaCitas mantiene la vista "citas enriquecidas" (nombres de cliente,
+servicio y categoría y costo de insumos) materializada sobre el snapshot y
+la actualiza fila a fila con cada escritura de la app.
+
+citas_entre() y con_nombres() resuelven las citas de un rango sin la tabla
+completa, con proyecciones del snapshot, para cuando aún no está cargada.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Columnas de citas que usa el dashboard (citas de hoy y resumen del mes)
+COLUMNAS_RESUMEN = ['id', 'fecha', 'hora', 'cliente_id', 'servicio_id', 'precio_cobrado', 'propina']
+
+# Proyecciones con las que con_nombres() resuelve los nombres
+PROYECCION_NOMBRES = {
+    'clientes': (['id', 'nombre'], None),
+    'servicios': (['id', 'nombre', 'activo'], None),
+}
+
+
+class CitasPorFecha:
+    """Citas ordenadas por fecha para consultas por rango en tiempo logarítmico"""
+
+    def __init__(self, df):
+        df = df.copy()
+        df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce')
+        validas = df['fecha'].notna()
+        # Las citas sin fecha válida nunca entran en un rango, pero siguen en todas()
+        self._sin_fecha = df[~validas]
+        df = df[validas].sort_values('fecha', kind='stable')
+        self.df = df.set_index(pd.DatetimeIndex(df['fecha']).rename(None))
+
+    def __len__(self):
+        return len(self.df) + len(self._sin_fecha)
+
+    def rango(self, desde, hasta):
+        """Citas con desde <= fecha <= hasta (ambos incluidos), en orden ascendente"""
+        inicio = self.df.index.searchsorted(pd.Timestamp(desde), side='left')
+        fin = self.df.index.searchsorted(pd.Timestamp(hasta), side='right')
+        return self.df.iloc[inicio:fin]
+
+    def todas(self):
+        if len(self._sin_fecha) == 0:
+            return self.df
+        return pd.concat([self.df, self._sin_fecha.set_index(pd.DatetimeIndex(self._sin_fecha['fecha']).rename(None))])
+
+
+class VistaCitas:
+    """Citas con cliente_nombre, servicio_nombre, categoria_nombre y costo_insumos ya resueltos"""
+
+    FUENTES = ('citas', 'clientes', 'servicios', 'categorias')
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.version = 0
+        self._df = None
+        self._cargas = None
+        self._por_fecha = (None, None)
+        self._lock = threading.RLock()
+
+    def _estado_fuentes(self):
+        return tuple(self.snapshot.carga(t) for t in self.FUENTES)
+
+    def _busquedas(self):
+        """Series id -> valor para cada columna derivada"""
+        def por_id(df, columnas):
+            if len(df) == 0:
+                return {col: pd.Series(dtype=object) for col in columnas}
+            df = df.drop_duplicates('id', keep='last').set_index('id')
+            return {col: df[col] for col in columnas}
+
+        servicios = self.snapshot.tabla('servicios', copiar=False)
+        if len(servicios) > 0:
+            servicios = servicios[servicios['activo'] == 1]
+        return {
+            'clientes': por_id(self.snapshot.tabla('clientes', copiar=False), ['nombre']),
+            'servicios': por_id(servicios, ['nombre', 'categoria_id', 'costo_insumos']),
+            'categorias': por_id(self.snapshot.tabla('categorias', copiar=False), ['nombre']),
+        }
+
+    def _enriquecer(self, citas, busquedas):
+        df = citas.copy()
+        servicios = busquedas['servicios']
+        df['cliente_nombre'] = df['cliente_id'].map(busquedas['clientes']['nombre'])
+        df['servicio_nombre'] = df['servicio_id'].map(servicios['nombre'])
+        df['categoria_id'] = df['servicio_id'].map(servicios['categoria_id'])
+        df['costo_insumos'] = df['servicio_id'].map(servicios['costo_insumos'])
+        df['categoria_nombre'] = df['categoria_id'].map(busquedas['categorias']['nombre'])
+        return df
+
+    def df(self):
+        """La vista completa (no debe modificarse); se reconstruye si alguna fuente se recargó"""
+        with self._lock:
+            self.snapshot.asegurar(self.FUENTES)
+            if self._df is None or self._estado_fuentes() != self._cargas:
+                citas = self.snapshot.tabla('citas', copiar=False)
+                self._df = self._enriquecer(citas, self._busquedas())
+                self._cargas = self._estado_fuentes()
+                self.version += 1
+            return self._df
+
+    def por_fecha(self):
+        """La vista indexada por fecha, reutilizada mientras no cambie"""
+        with self._lock:
+            df = self.df()
+            if self._por_fecha[0] != self.version:
+                self._por_fecha = (self.version, CitasPorFecha(df))
+            return self._por_fecha[1]
+
+    def aplicar(self, cambios):
+        """Actualizar solo las filas afectadas por las escrituras (tras aplicarlas al snapshot)"""
+        with self._lock:
+            cambios = [c for c in cambios if c.tabla in self.FUENTES]
+            if self._df is None or not cambios:
+                return
+            if any(c.tipo == 'reemplazar' for c in cambios) or self._estado_fuentes() != self._cargas:
+                self._df = None
+                return
+            busquedas = self._busquedas()
+            citas = self.snapshot.tabla('citas', copiar=False)
+            columnas_citas = list(citas.columns)
+            df = self._df
+            for cambio in cambios:
+                if cambio.tabla == 'citas':
+                    afectadas = df['id'] == cambio.id
+                    nuevas = self._enriquecer(citas[citas['id'] == cambio.id], busquedas)
+                else:
+                    columna = {'clientes': 'cliente_id', 'servicios': 'servicio_id',
+                               'categorias': 'categoria_id'}[cambio.tabla]
+                    afectadas = df[columna] == cambio.id
+                    if not afectadas.any():
+                        continue
+                    nuevas = self._enriquecer(df.loc[afectadas, columnas_citas], busquedas)
+                df = pd.concat([df[~afectadas], nuevas]).sort_index() if len(nuevas) else df[~afectadas]
+            # Si el snapshot tuvo que recargar alguna fuente, la próxima lectura reconstruye
+            self._df = df if self._estado_fuentes() == self._cargas else None
+            self.version += 1
+
+
+def citas_entre(snapshot, desde, hasta, columnas=COLUMNAS_RESUMEN):
+    """Citas con desde <= fecha <= hasta leyendo solo las columnas pedidas.
+
+    Primero la columna fecha, para saber qué filas caen en el rango, y
+    después solo esas filas.
+    """
+    desde, hasta = pd.Timestamp(desde), pd.Timestamp(hasta)
+    fechas = snapshot.proyectar({'citas': (['fecha'], None)})['citas']['fecha']
+    en_rango = ((fechas >= desde) & (fechas <= hasta)).to_numpy(dtype=bool, na_value=False)
+    citas = snapshot.proyectar({'citas': (columnas, np.flatnonzero(en_rango).tolist())})['citas']
+    # Si la hoja cambió entre las dos lecturas alguna fila puede haber salido del rango
+    return citas[(citas['fecha'] >= desde) & (citas['fecha'] <= hasta)]
+
+
+def con_nombres(snapshot, citas):
+    """Añadir cliente_nombre y servicio_nombre leyendo solo id y nombre de clientes y servicios"""
+    datos = snapshot.proyectar(PROYECCION_NOMBRES)
+    clientes = datos['clientes'].drop_duplicates('id', keep='last').set_index('id')
+    servicios = datos['servicios']
+    servicios = servicios[servicios['activo'] == 1].drop_duplicates('id', keep='last').set_index('id')
+    citas = citas.copy()
+    citas['cliente_nombre'] = citas['cliente_id'].map(clientes['nombre'])
+    citas['servicio_nombre'] = citas['servicio_id'].map(servicios['nombre'])
+    return citas
@@ -0,0 +1,154 @@
+"""
+Conexión compartida por app.py y las páginas.
+
+Las funciones están cacheadas con st.cache_resource, así que todas las
+páginas y sesiones del proceso reutilizan el mismo cliente y repositorio.
+"""
+
+import gspread
+import streamlit as st
+from google.oauth2.service_account import Credentials
+
+from beautybox.bandeja import BandejaSalida, RepositorioDiferido
+from beautybox.cache import invalidar
+from beautybox.citas import VistaCitas
+from beautybox.cuota import LimitadorSheets
+from beautybox.disco import CacheCompartida, CacheDisco
+from beautybox.duplicados import IndiceSolicitudes
+from beautybox.instrumentacion import contar_llamadas
+from beautybox.notificaciones import ColaAvisos, Notificador, config_email
+from beautybox.repositorio import config_almacenamiento
+from beautybox.sheets import SheetsRepositorio
+from beautybox.sheets_falso import cliente_compartido
+from beautybox.snapshot import SnapshotTablas
+from beautybox.sqlite_local import SQLiteRepositorio
+
+
+@st.cache_resource
+def get_limitador():
+    """Limitador de cuota de la API de Sheets, compartido por todo el proceso"""
+    return LimitadorSheets()
+
+
+@st.cache_resource
+def get_google_connection():
+    """Conectar a Google Sheets"""
+    # Backend 'sheets_falso': la misma ruta de código contra un Sheets en memoria
+    if config_almacenamiento(st.secrets)['backend'] == 'sheets_falso':
+        return get_limitador().envolver(contar_llamadas(cliente_compartido()))
+    try:
+        scopes = [
+            'https://www.googleapis.com/auth/spreadsheets',
+            'https://www.googleapis.com/auth/drive'
+        ]
+        credentials = Credentials.from_service_account_info(
+            st.secrets["gcp_service_account"],
+            scopes=scopes
+        )
+        client = gspread.authorize(credentials)
+        # El contador va por dentro: cada reintento cuenta como una llamada más
+        return get_limitador().envolver(contar_llamadas(client))
+    except Exception as e:
+        st.error(f"Error conectando a Google Sheets: {e}")
+        st.info("Asegúrate de configurar las credenciales en Streamlit Secrets")
+        st.stop()
+
+
+@st.cache_resource
+def get_spreadsheet():
+    """Obtener el spreadsheet de BeautyBox"""
+    client = get_google_connection()
+    try:
+        spreadsheet = client.open("BeautyBox_Database")
+        return spreadsheet
+    except gspread.SpreadsheetNotFound:
+        st.error("No se encontró el spreadsheet 'BeautyBox_Database'")
+        st.stop()
+
+
+@st.cache_resource
+def get_repositorio():
+    """Repositorio de datos según [almacenamiento] en los secrets (sheets por defecto)"""
+    config = config_almacenamiento(st.secrets)
+    if config['backend'] == 'sqlite':
+        repo = SQLiteRepositorio(config['ruta_sqlite'])
+    else:
+        repo = SheetsRepositorio(get_spreadsheet())
+    # Hojas, headers y categorías por defecto se comprueban una sola vez por proceso
+    repo.preparar()
+    # Contra Google Sheets las escrituras se guardan antes en la bandeja de salida
+    # local y se envían en segundo plano (el Sheets falso empieza vacío en cada proceso)
+    if config['backend'] == 'sheets' and config['bandeja']:
+        repo = RepositorioDiferido(repo, BandejaSalida(config['bandeja']))
+        repo.arrancar()
+    # Tras cada escritura se limpian solo los lectores de las tablas tocadas
+    repo.al_escribir.append(invalidar)
+    return repo
+
+
+@st.cache_resource
+def get_snapshot():
+    """Snapshot de todas las tablas, compartido por las sesiones del proceso"""
+    repo = get_repositorio()
+    config = config_almacenamiento(st.secrets)
+    # Copia en disco solo contra Google Sheets: SQLite ya es local y el Sheets
+    # falso empieza vacío en cada proceso
+    disco = None
+    if config['backend'] == 'sheets' and config['cache_compartida']:
+        disco = CacheCompartida(config['cache_compartida'])
+    elif config['backend'] == 'sheets' and config['ruta_cache']:
+        disco = CacheDisco(config['ruta_cache'])
+    snapshot = SnapshotTablas(repo, disco=disco)
+    # aplicar() sube la versión de las tablas tocadas: los lectores de
+    # @cache_compartida ven que su resultado es de una versión anterior y lo
+    # vuelven a calcular sobre las tablas ya actualizadas
+    repo.al_cambiar.append(snapshot.aplicar)
+    if isinstance(repo, RepositorioDiferido):
+        # Lo enviado desde la bandeja ya estaba en las tablas: no hace falta releerlo
+        repo.al_enviar.append(snapshot.confirmar)
+    # Tras un reinicio se sirve lo guardado en disco mientras se comprueba la hoja
+    snapshot.calentar()
+    return snapshot
+
+
+@st.cache_resource
+def get_vista_citas():
+    """Vista de citas enriquecidas, mantenida al día con cada escritura"""
+    snapshot = get_snapshot()
+    vista = VistaCitas(snapshot)
+    # Se registra después del snapshot: parte de sus tablas ya actualizadas
+    get_repositorio().al_cambiar.append(vista.aplicar)
+    return vista
+
+
+@st.cache_resource
+def get_notificador():
+    """Avisos por email en segundo plano ([email] en los secrets), o None si no está configurado"""
+    config = config_email(st.secrets)
+    if config is None:
+        return None
+    notificador = Notificador(ColaAvisos(config['cola']), config)
+    notificador.arrancar()
+    return notificador
+
+
+@st.cache_resource
+def get_indice_solicitudes():
+    """Solicitudes recientes del formulario público, para no guardar las repetidas"""
+    return IndiceSolicitudes()
+
+
+def get_repositorio_sheets():
+    """Repositorio de Google Sheets, destino de la sincronización del backend local"""
+    repo = get_repositorio()
+    if isinstance(repo, RepositorioDiferido):
+        repo = repo.destino
+    if isinstance(repo, SheetsRepositorio):
+        return repo
+    return SheetsRepositorio(get_spreadsheet())
+
+
+def usa_sheets():
+    """Si los datos se guardan en Google Sheets (directamente o a través de la bandeja de salida)"""
+    repo = get_repositorio()
+    return isinstance(getattr(repo, 'destino', repo), SheetsRepositorio)
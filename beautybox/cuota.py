@@ -0,0 +1,153 @@
+"""
+Cuota de la API de Google Sheets.
+
+Google permite unas 60 lecturas y 60 escrituras por minuto y usuario; al
+pasarse responde 429 y gspread lanza APIError. El limitador se engancha al
+http_client del cliente de gspread (como la instrumentación) y:
+
+- reparte cada petición contra un cubo de tokens de lecturas o de
+  escrituras; cerca del límite la petición espera su token en lugar de
+  llegar a Google y volver con 429,
+- reintenta con espera exponencial con jitter los 429 y, solo en las
+  lecturas, los 5xx y los errores de conexión. Una escritura (batch_update
+  no es idempotente) solo se repite si el fallo demuestra que no se aplicó
+  (429 o no se llegó a conectar); si no, el error llega a quien escribe, que
+  sabe comprobar si se aplicó (la bandeja de salida reenvía el lote como
+  dudoso),
+- informa de cuánta cuota queda para mostrarlo en Configuración.
+
+Las peticiones ya se agrupan antes de llegar aquí: las escrituras de un lote
+salen en un solo batch_update y el snapshot lee todas las tablas en un solo
+values_batch_get.
+"""
+
+import functools
+import random
+import threading
+import time
+
+import requests
+from gspread.exceptions import APIError
+
+LECTURAS_POR_MINUTO = 60
+ESCRITURAS_POR_MINUTO = 60
+REINTENTOS = 5
+ESPERA_BASE = 1.0     # segundos antes del primer reintento
+ESPERA_MAXIMA = 32.0  # tope de la espera entre reintentos
+
+
+class CuboTokens:
+    """Cubo de tokens: `por_minuto` tokens de capacidad que se rellenan de forma continua"""
+
+    def __init__(self, por_minuto, reloj=time.monotonic, dormir=time.sleep):
+        self.capacidad = por_minuto
+        self.ritmo = por_minuto / 60.0  # tokens por segundo
+        self._tokens = float(por_minuto)
+        self._reloj = reloj
+        self._dormir = dormir
+        self._ultimo = reloj()
+        self._lock = threading.Lock()
+
+    def _rellenar(self):
+        ahora = self._reloj()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.ritmo)
+        self._ultimo = ahora
+
+    def restantes(self):
+        with self._lock:
+            self._rellenar()
+            return self._tokens
+
+    def tomar(self):
+        """Tomar un token, esperando si hace falta; devuelve los segundos esperados"""
+        esperado = 0.0
+        while True:
+            with self._lock:
+                self._rellenar()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return esperado
+                espera = (1 - self._tokens) / self.ritmo
+            self._dormir(espera)
+            esperado += espera
+
+
+def es_reintentable(error, tipo='lectura'):
+    """Si se puede repetir la petición: las escrituras solo si seguro que no se aplicaron"""
+    if isinstance(error, APIError):
+        return error.code == 429 or (tipo == 'lectura' and error.code >= 500)
+    if tipo == 'escritura':
+        return isinstance(error, requests.exceptions.ConnectTimeout)
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class LimitadorSheets:
+    """Throttling y reintentos de las peticiones de un cliente de gspread"""
+
+    def __init__(self, lecturas=LECTURAS_POR_MINUTO, escrituras=ESCRITURAS_POR_MINUTO,
+                 reintentos=REINTENTOS, espera_base=ESPERA_BASE, espera_maxima=ESPERA_MAXIMA,
+                 reloj=time.monotonic, dormir=time.sleep):
+        self.cubos = {
+            'lectura': CuboTokens(lecturas, reloj, dormir),
+            'escritura': CuboTokens(escrituras, reloj, dormir),
+        }
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._dormir = dormir
+        self.estadisticas = {'peticiones': 0, 'reintentos': 0, 'segundos_en_cola': 0.0, 'errores': 0}
+        self._lock = threading.Lock()
+
+    def _anotar(self, clave, valor=1):
+        with self._lock:
+            self.estadisticas[clave] += valor
+
+    def espera(self, intento):
+        """Espera antes del reintento `intento` (1, 2, ...): exponencial con jitter completo"""
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** (intento - 1)))
+
+    def ejecutar(self, tipo, funcion, *args, **kwargs):
+        """Ejecutar una petición de tipo 'lectura' o 'escritura' respetando la cuota"""
+        cubo = self.cubos[tipo]
+        intento = 0
+        while True:
+            self._anotar('segundos_en_cola', cubo.tomar())
+            self._anotar('peticiones')
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                intento += 1
+                if not es_reintentable(e, tipo) or intento > self.reintentos:
+                    self._anotar('errores')
+                    raise
+                self._anotar('reintentos')
+                self._dormir(self.espera(intento))
+
+    def envolver(self, cliente):
+        """Pasar todas las peticiones del cliente por el limitador"""
+        http = cliente.http_client
+        # Si el cliente ya estaba envuelto (p. ej. tras st.cache_resource.clear()) solo se cambia el limitador
+        if getattr(http, '_limitador', None) is None:
+            peticion = http.request
+
+            @functools.wraps(peticion)
+            def limitada(*args, **kwargs):
+                method = kwargs.get('method', args[0] if args else 'GET')
+                tipo = 'lectura' if method.upper() == 'GET' else 'escritura'
+                return http._limitador.ejecutar(tipo, peticion, *args, **kwargs)
+
+            http.request = limitada
+        http._limitador = self
+        return cliente
+
+    def cuota(self):
+        """Tokens que quedan de cada tipo y estadísticas acumuladas"""
+        with self._lock:
+            estadisticas = dict(self.estadisticas)
+        return {
+            'lecturas': int(self.cubos['lectura'].restantes()),
+            'lecturas_max': self.cubos['lectura'].capacidad,
+            'escrituras': int(self.cubos['escritura'].restantes()),
+            'escrituras_max': self.cubos['escritura'].capacidad,
+            **estadisticas,
+        }
@@ -0,0 +1,203 @@
+"""
+Copia en disco de las tablas tipadas, para no arrancar en frío.
+
+Tras cada carga desde Google Sheets el snapshot guarda cada tabla en un
+fichero Feather (Arrow, se lee con memory-map) junto con la revisión de la
+hoja de la que viene. Al arrancar el proceso se sirven esas copias al
+momento y se concilian con Sheets en segundo plano (ver
+SnapshotTablas.calentar).
+
+Cada tabla es un único fichero que se escribe aparte y se sustituye con
+os.replace, así que otro proceso nunca lee uno a medias. Los metadatos van
+en el propio esquema Arrow: revisión y versión compartida de la copia,
+momento de la última lectura completa y de la última comprobación contra
+la fuente, y una huella de ESQUEMAS y TIPOS para descartar copias de una
+versión anterior del código.
+
+CacheCompartida es la variante para varios procesos de Streamlit en la
+misma máquina: las copias van en un único SQLite en modo WAL junto con las
+versiones compartidas leídas de la fuente y unos turnos con caducidad, de
+modo que solo un proceso pide cada tabla a Sheets y los demás usan su copia.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import pyarrow as pa
+from pyarrow import feather
+
+from beautybox.esquema import ESQUEMAS, TIPOS
+
+CLAVE_METADATOS = b'beautybox'
+HUELLA_ESQUEMA = hashlib.sha1(json.dumps([ESQUEMAS, TIPOS], sort_keys=True).encode()).hexdigest()[:12]
+
+
+class Copia(namedtuple('Copia', 'df revision sello leida_en cargada_en')):
+    """Tabla guardada: revisión y versión compartida de la fuente y momentos (epoch)
+    de la última lectura completa y de la última comprobación contra la fuente"""
+
+
+def a_arrow(df, revision=None, sello=None, leida_en=None, cargada_en=None):
+    """Tabla Arrow de df con los metadatos de la copia en su esquema"""
+    ahora = time.time()
+    metadatos = {'revision': revision, 'sello': sello, 'leida_en': leida_en or ahora,
+                 'cargada_en': cargada_en or ahora, 'esquema': HUELLA_ESQUEMA}
+    # Feather solo admite el índice por defecto
+    arrow = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    return arrow.replace_schema_metadata({
+        **(arrow.schema.metadata or {}),
+        CLAVE_METADATOS: json.dumps(metadatos).encode(),
+    })
+
+
+def de_arrow(arrow):
+    """Copia de una tabla Arrow escrita con a_arrow, o None si es de otro esquema"""
+    metadatos = json.loads((arrow.schema.metadata or {}).get(CLAVE_METADATOS, b'{}'))
+    if metadatos.get('esquema') != HUELLA_ESQUEMA:
+        return None
+    leida_en = metadatos.get('leida_en', 0)
+    return Copia(arrow.to_pandas(), metadatos.get('revision'), metadatos.get('sello'),
+                 leida_en, metadatos.get('cargada_en', leida_en))
+
+
+class CacheDisco:
+    """Tablas tipadas en ficheros Feather dentro de un directorio"""
+
+    # Solo la usa el proceso que la escribe (ver CacheCompartida)
+    compartida = False
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def _fichero(self, tabla):
+        return os.path.join(self.ruta, f'{tabla}.feather')
+
+    def guardar(self, tabla, df, revision=None, sello=None, leida_en=None, cargada_en=None):
+        """Escribir la tabla con sus metadatos (ver Copia).
+
+        Devuelve False si no se pudo escribir (disco lleno, de solo lectura...).
+        """
+        try:
+            os.makedirs(self.ruta, exist_ok=True)
+            temporal = f'{self._fichero(tabla)}.{os.getpid()}.tmp'
+            feather.write_feather(a_arrow(df, revision, sello, leida_en, cargada_en), temporal)
+            os.replace(temporal, self._fichero(tabla))
+            return True
+        except (OSError, pa.ArrowException):
+            return False
+
+    def cargar(self, tabla):
+        """Copia guardada de la tabla, o None si no hay una válida"""
+        try:
+            return de_arrow(feather.read_table(self._fichero(tabla), memory_map=True))
+        except (OSError, ValueError, pa.ArrowException):
+            return None
+
+    def borrar(self, *tablas):
+        """Eliminar las copias de las tablas (sin argumentos, todas)"""
+        for tabla in tablas or ESQUEMAS:
+            try:
+                os.remove(self._fichero(tabla))
+            except OSError:
+                pass
+
+
+class CacheCompartida:
+    """Copias, versiones y turnos en un SQLite (WAL) que comparten los procesos de la máquina"""
+
+    compartida = True
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        # Identifica los turnos de esta instancia frente a los de otros procesos
+        self.dueno = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        # Sin transacción implícita: las que hacen falta se abren con BEGIN IMMEDIATE
+        self._conexion = sqlite3.connect(ruta, timeout=10, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute('CREATE TABLE IF NOT EXISTS copias (tabla TEXT PRIMARY KEY, datos BLOB)')
+            self._conexion.execute('CREATE TABLE IF NOT EXISTS versiones '
+                                   '(tabla TEXT PRIMARY KEY, sello TEXT, comprobada_en REAL)')
+            self._conexion.execute('CREATE TABLE IF NOT EXISTS turnos (clave TEXT PRIMARY KEY, dueno TEXT, hasta REAL)')
+
+    def guardar(self, tabla, df, revision=None, sello=None, leida_en=None, cargada_en=None):
+        try:
+            salida = pa.BufferOutputStream()
+            feather.write_feather(a_arrow(df, revision, sello, leida_en, cargada_en), salida)
+            with self._lock:
+                self._conexion.execute('INSERT OR REPLACE INTO copias (tabla, datos) VALUES (?, ?)',
+                                       [tabla, salida.getvalue().to_pybytes()])
+            return True
+        except (sqlite3.Error, pa.ArrowException):
+            return False
+
+    def cargar(self, tabla):
+        try:
+            with self._lock:
+                fila = self._conexion.execute('SELECT datos FROM copias WHERE tabla = ?', [tabla]).fetchone()
+            if fila is None:
+                return None
+            return de_arrow(feather.read_table(pa.BufferReader(fila[0])))
+        except (sqlite3.Error, ValueError, pa.ArrowException):
+            return None
+
+    def borrar(self, *tablas):
+        with self._lock:
+            for tabla in tablas or ESQUEMAS:
+                self._conexion.execute('DELETE FROM copias WHERE tabla = ?', [tabla])
+
+    def versiones(self, vigencia):
+        """Versiones compartidas que algún proceso leyó hace menos de `vigencia` segundos, o None"""
+        with self._lock:
+            filas = self._conexion.execute('SELECT tabla, sello, comprobada_en FROM versiones').fetchall()
+        if not filas or time.time() - min(f[2] for f in filas) > vigencia:
+            return None
+        return {tabla: sello for tabla, sello, _ in filas}
+
+    def guardar_versiones(self, versiones):
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute('BEGIN IMMEDIATE')
+            try:
+                self._conexion.execute('DELETE FROM versiones')
+                self._conexion.executemany('INSERT INTO versiones (tabla, sello, comprobada_en) VALUES (?, ?, ?)',
+                                           [(tabla, sello, ahora) for tabla, sello in versiones.items()])
+                self._conexion.execute('COMMIT')
+            except sqlite3.Error:
+                self._conexion.execute('ROLLBACK')
+                raise
+
+    def anunciar_versiones(self, versiones):
+        """Anotar versiones escritas por este proceso sin dar por comprobadas las demás"""
+        with self._lock:
+            self._conexion.executemany('UPDATE versiones SET sello = ? WHERE tabla = ?',
+                                       [(sello, tabla) for tabla, sello in versiones.items()])
+
+    def tomar_turno(self, clave, segundos):
+        """Reservar `clave` durante unos segundos; False si la tiene otro proceso"""
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute('BEGIN IMMEDIATE')
+            try:
+                fila = self._conexion.execute('SELECT dueno, hasta FROM turnos WHERE clave = ?', [clave]).fetchone()
+                libre = fila is None or fila[0] == self.dueno or fila[1] < ahora
+                if libre:
+                    self._conexion.execute('INSERT OR REPLACE INTO turnos (clave, dueno, hasta) VALUES (?, ?, ?)',
+                                           [clave, self.dueno, ahora + segundos])
+                self._conexion.execute('COMMIT')
+                return libre
+            except sqlite3.Error:
+                self._conexion.execute('ROLLBACK')
+                raise
+
+    def soltar_turno(self, clave):
+        with self._lock:
+            self._conexion.execute('DELETE FROM turnos WHERE clave = ? AND dueno = ?', [clave, self.dueno])
@@ -0,0 +1,93 @@
+"""
+Solicitudes repetidas del formulario público de reservas.
+
+Un doble toque en "Enviar Solicitud" o volver a enviarla porque la primera
+tardaba creaba filas repetidas en 'solicitudes' (y otro email). Cada
+formulario lleva una clave de envío (la página la guarda en session_state)
+y además se recuerdan durante VENTANA segundos las solicitudes por
+teléfono + servicio + preferencia: una repetición devuelve el id de la
+primera sin escribir nada.
+
+El índice vive en la memoria del proceso (st.cache_resource): las
+repeticiones de una misma sesión de Streamlit llegan siempre al mismo
+proceso.
+"""
+
+import re
+import threading
+import time
+
+# Segundos durante los que una solicitud igual se considera repetida
+VENTANA = 600
+
+
+def normalizar_telefono(telefono):
+    """Solo los dígitos, sin el prefijo de España (+34 / 0034)"""
+    digitos = re.sub(r'\D', '', str(telefono))
+    if digitos.startswith('0034'):
+        digitos = digitos[4:]
+    elif digitos.startswith('34') and len(digitos) == 11:
+        digitos = digitos[2:]
+    return digitos
+
+
+def firma_solicitud(telefono, servicio, preferencia):
+    return (normalizar_telefono(telefono), str(servicio).strip().casefold(), str(preferencia).strip().casefold())
+
+
+class _EnCurso:
+    """Solicitud que se está creando: sus repeticiones esperan a que termine"""
+
+    def __init__(self):
+        self.hecha = threading.Event()
+        self.id = None
+
+
+class IndiceSolicitudes:
+    """Solicitudes recientes por clave de envío y por teléfono + servicio + preferencia"""
+
+    def __init__(self, ventana=VENTANA):
+        self.ventana = ventana
+        self._por_clave = {}  # clave -> (id o _EnCurso, momento)
+        self._por_firma = {}  # firma -> (id o _EnCurso, momento)
+        # Solo para consultar y reservar: crear() va fuera y los demás envíos no lo esperan
+        self._lock = threading.Lock()
+
+    def _olvidar_viejas(self, ahora):
+        for indice in (self._por_clave, self._por_firma):
+            for clave in [c for c, (valor, momento) in indice.items()
+                          if ahora - momento > self.ventana and not isinstance(valor, _EnCurso)]:
+                del indice[clave]
+
+    def registrar(self, clave, telefono, servicio, preferencia, crear):
+        """Id de la solicitud y si es nueva: la de la ventana si es una repetición; si no, la que devuelve crear()"""
+        firma = firma_solicitud(telefono, servicio, preferencia)
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._olvidar_viejas(ahora)
+                anterior = self._por_clave.get(clave) or self._por_firma.get(firma)
+                if anterior is None:
+                    # Reservar la solicitud: una repetición que llegue mientras se crea la espera
+                    en_curso = _EnCurso()
+                    self._por_clave[clave] = self._por_firma[firma] = (en_curso, ahora)
+                    break
+            if not isinstance(anterior[0], _EnCurso):
+                return anterior[0], False
+            anterior[0].hecha.wait()
+            if anterior[0].id is not None:
+                return anterior[0].id, False
+            # La primera falló y ya no está reservada: se vuelve a intentar
+        try:
+            solicitud_id = crear()
+        except BaseException:
+            # Si crear() falla no queda nada registrado y se puede volver a intentar
+            with self._lock:
+                del self._por_clave[clave], self._por_firma[firma]
+            en_curso.hecha.set()
+            raise
+        with self._lock:
+            self._por_clave[clave] = self._por_firma[firma] = (solicitud_id, ahora)
+        en_curso.id = solicitud_id
+        en_curso.hecha.set()
+        return solicitud_id, True
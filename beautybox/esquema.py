@@ -0,0 +1,196 @@
+"""
+Esquema de las hojas de BeautyBox_Database.
+
+Cada tabla declara sus columnas en el orden en que aparecen en la hoja y el
+tipo con el que se guardan en el almacenamiento local SQLite. TIPOS declara
+además el dtype compacto con el que se tienen en memoria: las tablas se
+parsean una sola vez al cargarlas y las páginas ya no convierten fechas ni
+números en cada render.
+"""
+
+from datetime import date, time
+
+import pandas as pd
+
+ESQUEMAS = {
+    'categorias': {
+        'id': 'INTEGER',
+        'nombre': 'TEXT',
+        'descripcion': 'TEXT',
+        'created_at': 'TEXT',
+    },
+    'servicios': {
+        'id': 'INTEGER',
+        'nombre': 'TEXT',
+        'categoria_id': 'INTEGER',
+        'precio': 'REAL',
+        'duracion_minutos': 'INTEGER',
+        'costo_insumos': 'REAL',
+        'activo': 'INTEGER',
+        'descripcion': 'TEXT',
+        'created_at': 'TEXT',
+    },
+    'clientes': {
+        'id': 'INTEGER',
+        'nombre': 'TEXT',
+        'telefono': 'TEXT',
+        'email': 'TEXT',
+        'fecha_primera_visita': 'TEXT',
+        'canal_adquisicion': 'TEXT',
+        'notas': 'TEXT',
+        'created_at': 'TEXT',
+    },
+    'citas': {
+        'id': 'INTEGER',
+        'fecha': 'TEXT',
+        'hora': 'TEXT',
+        'cliente_id': 'INTEGER',
+        'servicio_id': 'INTEGER',
+        'precio_cobrado': 'REAL',
+        'propina': 'REAL',
+        'canal_origen': 'TEXT',
+        'metodo_pago': 'TEXT',
+        'notas': 'TEXT',
+        'created_at': 'TEXT',
+    },
+    'gastos_fijos': {
+        'id': 'INTEGER',
+        'concepto': 'TEXT',
+        'monto': 'REAL',
+        'frecuencia': 'TEXT',
+        'activo': 'INTEGER',
+        'notas': 'TEXT',
+        'created_at': 'TEXT',
+    },
+    'gastos_variables': {
+        'id': 'INTEGER',
+        'fecha': 'TEXT',
+        'concepto': 'TEXT',
+        'monto': 'REAL',
+        'categoria': 'TEXT',
+        'notas': 'TEXT',
+        'created_at': 'TEXT',
+    },
+    'solicitudes': {
+        'id': 'INTEGER',
+        'nombre': 'TEXT',
+        'telefono': 'TEXT',
+        'email': 'TEXT',
+        'servicio_solicitado': 'TEXT',
+        'preferencia_horario': 'TEXT',
+        'mensaje': 'TEXT',
+        'estado': 'TEXT',
+        'fecha_solicitud': 'TEXT',
+        'fecha_respuesta': 'TEXT',
+        'notas_admin': 'TEXT',
+    },
+}
+
+# Columnas con dtype en memoria; las que no aparecen quedan como vienen de la hoja.
+#   id        int32 (Int32 si hay huecos)
+#   entero    int32 (Int32 si hay huecos)
+#   dinero    float32
+#   categoria category
+#   fecha     datetime64
+#   hora      timedelta64 (hora del día como desplazamiento desde las 00:00)
+TIPOS = {
+    'categorias': {'id': 'id'},
+    'servicios': {
+        'id': 'id', 'categoria_id': 'id', 'precio': 'dinero', 'duracion_minutos': 'entero',
+        'costo_insumos': 'dinero', 'activo': 'entero',
+    },
+    'clientes': {'id': 'id', 'canal_adquisicion': 'categoria'},
+    'citas': {
+        'id': 'id', 'fecha': 'fecha', 'hora': 'hora', 'cliente_id': 'id', 'servicio_id': 'id',
+        'precio_cobrado': 'dinero', 'propina': 'dinero', 'canal_origen': 'categoria',
+        'metodo_pago': 'categoria',
+    },
+    'gastos_fijos': {'id': 'id', 'monto': 'dinero', 'frecuencia': 'categoria', 'activo': 'entero'},
+    'gastos_variables': {'id': 'id', 'fecha': 'fecha', 'monto': 'dinero', 'categoria': 'categoria'},
+    'solicitudes': {'id': 'id', 'estado': 'categoria'},
+}
+
+# Tablas con columna 'fecha' que admiten consultas por rango
+TABLAS_CON_FECHA = ('citas', 'gastos_variables')
+
+# Categorías con las que se siembra una base de datos nueva (id, nombre, descripcion)
+CATEGORIAS_POR_DEFECTO = [
+    (1, 'Pestañas', 'Extensiones y tratamientos de pestañas'),
+    (2, 'Cejas', 'Diseño, laminado y micropigmentación'),
+    (3, 'Uñas', 'Manicura y pedicura'),
+    (4, 'Otros', 'Otros servicios'),
+]
+
+
+def headers(tabla):
+    """Columnas de una tabla en el orden de la hoja"""
+    return list(ESQUEMAS[tabla])
+
+
+def _entero(serie):
+    numeros = pd.to_numeric(serie, errors='coerce')
+    return numeros.astype('int32') if numeros.notna().all() else numeros.astype('Int32')
+
+
+def _hora(serie):
+    texto = serie.astype(str).str.strip()
+    # '10:00' -> '10:00:00' para que to_timedelta lo entienda
+    texto = texto.where(texto.str.count(':') != 1, texto + ':00')
+    return pd.to_timedelta(texto, errors='coerce')
+
+
+_CONVERSORES = {
+    'id': _entero,
+    'entero': _entero,
+    'dinero': lambda serie: pd.to_numeric(serie, errors='coerce').astype('float32'),
+    'categoria': lambda serie: serie.astype('category'),
+    'fecha': lambda serie: pd.to_datetime(serie, errors='coerce'),
+    'hora': _hora,
+}
+
+
+def tipar(tabla, df):
+    """Convertir las columnas de una tabla recién cargada a sus dtypes de TIPOS"""
+    for col, tipo in TIPOS.get(tabla, {}).items():
+        if col in df.columns:
+            df[col] = _CONVERSORES[tipo](df[col])
+    return df
+
+
+def formato_fecha(valor):
+    """'AAAA-MM-DD' de una fecha (Timestamp, date o texto); '' si no hay fecha"""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ''
+    if isinstance(valor, date):
+        return valor.strftime('%Y-%m-%d')
+    return str(valor)[:10]
+
+
+def formato_hora(valor):
+    """'HH:MM' de una hora (timedelta, time o texto); '' si no hay hora"""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ''
+    if isinstance(valor, pd.Timedelta):
+        minutos = int(valor.total_seconds()) // 60
+        return f'{minutos // 60:02d}:{minutos % 60:02d}'
+    return str(valor)[:5]
+
+
+def a_nativo(valor):
+    """Convertir escalares de numpy/pandas a tipos nativos serializables"""
+    if valor is None or valor is pd.NaT:
+        return ''
+    if isinstance(valor, pd.Timestamp):
+        return str(valor.date()) if valor == valor.normalize() else valor.isoformat()
+    if isinstance(valor, pd.Timedelta):
+        return str(valor).split(' days ')[-1]
+    if isinstance(valor, (date, time)):
+        return str(valor)
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return valor
+
+
+def a_fila(tabla, valores):
+    """Convertir un dict de valores en una fila ordenada según los headers"""
+    return [a_nativo(valores.get(col, '')) for col in ESQUEMAS[tabla]]
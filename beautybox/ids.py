@@ -0,0 +1,114 @@
+"""
+Asignación de ids sin leer la hoja completa.
+
+El último id entregado de cada tabla se guarda en un contador persistente
+(la hoja '_meta' en Google Sheets), que se avanza de forma atómica. Cada
+proceso reserva bloques de ids de una vez y los reparte en memoria, así que
+insertar cuesta lo mismo con 100 citas que con 100.000 y dos sesiones, del
+mismo proceso o de otro, nunca reciben el mismo id.
+
+Si se reinicia el proceso, los ids reservados sin usar se pierden: los ids
+siguen siendo únicos pero pueden tener huecos.
+"""
+
+import threading
+
+TAMANO_BLOQUE = 10
+
+
+class AsignadorIds:
+    """Reparte ids de bloques reservados con `reservar(tabla, cantidad) -> primer_id`"""
+
+    def __init__(self, reservar, tamano_bloque=TAMANO_BLOQUE):
+        self._reservar = reservar
+        self.tamano_bloque = tamano_bloque
+        self._bloques = {}  # tabla -> [siguiente, limite)
+        self._anticipados = {}  # tabla -> primer id del bloque ya reservado para después
+        self._reservas = {}  # tabla -> lock de las reservas de esa tabla (una a la vez)
+        self._generacion = 0  # sube con olvidar(): una reserva en curso de antes se descarta
+        self._lock = threading.Lock()
+
+    def _lock_reserva(self, tabla):
+        with self._lock:
+            return self._reservas.setdefault(tabla, threading.Lock())
+
+    def _tomar(self, tabla):
+        """Siguiente id de los bloques ya reservados, o None si hace falta reservar"""
+        siguiente, limite = self._bloques.get(tabla, (0, 0))
+        if siguiente >= limite:
+            siguiente = self._anticipados.pop(tabla, None)
+            if siguiente is None:
+                return None
+            limite = siguiente + self.tamano_bloque
+        self._bloques[tabla] = (siguiente + 1, limite)
+        return siguiente
+
+    def siguiente(self, tabla):
+        with self._lock:
+            siguiente = self._tomar(tabla)
+        if siguiente is not None:
+            return siguiente
+        # La reserva va fuera de _lock (las demás tablas no esperan a la API)
+        # pero detrás del lock de la tabla, también el de anticipar(): la
+        # reserva lee y escribe el contador y dos a la vez darían el mismo bloque
+        with self._lock_reserva(tabla):
+            while True:
+                with self._lock:
+                    siguiente = self._tomar(tabla)
+                    generacion = self._generacion
+                if siguiente is not None:
+                    return siguiente
+                primero = self._reservar(tabla, self.tamano_bloque)
+                with self._lock:
+                    # Si entretanto se reemplazó la tabla, el bloque puede chocar con sus ids
+                    if generacion == self._generacion:
+                        self._bloques[tabla] = (primero + 1, primero + self.tamano_bloque)
+                        return primero
+
+    def _anticipar_hace_falta(self, tabla):
+        siguiente, limite = self._bloques.get(tabla, (0, 0))
+        return tabla not in self._anticipados and limite - siguiente <= self.tamano_bloque // 2
+
+    def anticipar(self, tabla):
+        """Reservar ya el bloque siguiente si al actual le queda menos de la mitad.
+
+        Así insertar no tiene que esperar a la reserva (ni fallar si la API no responde).
+        """
+        with self._lock:
+            if not self._anticipar_hace_falta(tabla):
+                return
+        # Las inserciones con ids en el bloque actual no esperan a esta reserva
+        with self._lock_reserva(tabla):
+            with self._lock:
+                if not self._anticipar_hace_falta(tabla):
+                    return
+                generacion = self._generacion
+            primero = self._reservar(tabla, self.tamano_bloque)
+            with self._lock:
+                if generacion == self._generacion:
+                    self._anticipados[tabla] = primero
+
+    def olvidar(self, tabla=None):
+        """Descartar los bloques reservados (p. ej. tras reemplazar una tabla)"""
+        with self._lock:
+            self._generacion += 1
+            if tabla is None:
+                self._bloques.clear()
+                self._anticipados.clear()
+            else:
+                self._bloques.pop(tabla, None)
+                self._anticipados.pop(tabla, None)
+
+
+def como_id(valor):
+    """Normalizar un valor de la columna id ('12', 12.0, numpy.int64...) a int, o None"""
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def max_id(valores):
+    """Mayor id numérico de una lista de valores de la columna id"""
+    ids = [como_id(valor) for valor in valores]
+    return max((i for i in ids if i is not None), default=0)
@@ -0,0 +1,80 @@
+"""
+Índice en memoria id -> número de fila de cada hoja.
+
+Se construye con una lectura de la columna A (solo ids) en lugar de
+descargar la hoja entera, y la app lo mantiene al día cuando ella misma
+anexa o borra filas. Pasado `vigencia` segundos se considera que alguien
+pudo editar la hoja a mano y se vuelve a leer la columna de ids.
+"""
+
+import threading
+import time
+
+from beautybox.ids import como_id
+
+VIGENCIA = 120
+
+
+class IndiceFilas:
+    """Mapa id -> fila de una hoja; `leer_ids()` devuelve la columna A sin el header"""
+
+    def __init__(self, leer_ids, vigencia=VIGENCIA):
+        self._leer_ids = leer_ids
+        self.vigencia = vigencia
+        self._filas = None
+        self._ultima_fila = 1
+        self._cargado_en = 0.0
+        self._lock = threading.Lock()
+
+    def _caducado(self):
+        return self._filas is None or time.monotonic() - self._cargado_en > self.vigencia
+
+    def _reconstruir(self):
+        valores = self._leer_ids()
+        self._filas = {}
+        for fila, valor in enumerate(valores, start=2):
+            id_valor = como_id(valor)
+            if id_valor is not None:
+                self._filas[id_valor] = fila
+        self._ultima_fila = len(valores) + 1
+        self._cargado_en = time.monotonic()
+
+    def fila(self, id_valor, verificar=False):
+        """Fila del id o None. Con `verificar` se relee siempre la columna de ids"""
+        id_valor = como_id(id_valor)
+        with self._lock:
+            recien_leido = verificar or self._caducado()
+            if recien_leido:
+                self._reconstruir()
+            fila = self._filas.get(id_valor)
+            if fila is None and not recien_leido:
+                # Puede ser una fila añadida desde otra sesión o a mano
+                self._reconstruir()
+                fila = self._filas.get(id_valor)
+            return fila
+
+    def anexado(self, ids):
+        """Registrar filas anexadas por la app al final de la hoja"""
+        with self._lock:
+            if self._filas is None:
+                return
+            for id_valor in ids:
+                self._ultima_fila += 1
+                id_valor = como_id(id_valor)
+                if id_valor is not None:
+                    self._filas[id_valor] = self._ultima_fila
+
+    def borrado(self, fila):
+        """Registrar una fila borrada: las de debajo suben una posición"""
+        with self._lock:
+            if self._filas is None:
+                return
+            self._filas = {
+                id_valor: f - 1 if f > fila else f
+                for id_valor, f in self._filas.items() if f != fila
+            }
+            self._ultima_fila -= 1
+
+    def invalidar(self):
+        with self._lock:
+            self._filas = None
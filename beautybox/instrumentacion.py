@@ -0,0 +1,278 @@
+"""
+Instrumentación de la app: qué se hace en cada rerun y cuánto tarda.
+
+Cada rerun de app.py abre una traza (iniciar_rerun) y la cierra al final
+(terminar_rerun). Mientras tanto se apuntan eventos:
+
+- las funciones get_* / insertar_* / actualizar_* / eliminar_* (@medido,
+  o @cache_compartida de este módulo, que además distingue aciertos y
+  fallos de caché),
+- find_row_by_id del repositorio de Sheets,
+- la rama de la página que se está mostrando,
+- cada petición a la API de Sheets y las filas leídas del almacenamiento.
+
+Las últimas trazas del proceso se guardan en memoria para la página de
+Configuración y se añaden a un JSONL local que rota al pasar de MAX_BYTES.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+# Trazas que se guardan en memoria (de todas las sesiones del proceso)
+MAX_TRAZAS = 50
+# Archivo JSONL de trazas ('' desactiva la escritura) y tamaño a partir del que rota
+ARCHIVO_POR_DEFECTO = 'beautybox_trazas.jsonl'
+MAX_BYTES = 1_000_000
+
+TRAZAS = deque(maxlen=MAX_TRAZAS)
+_local = threading.local()
+_lock_archivo = threading.Lock()
+
+
+def archivo_trazas():
+    return os.environ.get('BEAUTYBOX_TRAZAS', ARCHIVO_POR_DEFECTO)
+
+
+def _traza():
+    return getattr(_local, 'traza', None)
+
+
+def iniciar_rerun(pagina):
+    """Abrir la traza de un rerun (cierra la anterior si quedó abierta por st.rerun/st.stop)"""
+    if _traza() is not None:
+        terminar_rerun(interrumpida=True)
+    _local.traza = {
+        'inicio': datetime.now().isoformat(timespec='seconds'),
+        'pagina': pagina,
+        'ms': None,
+        'llamadas_api': 0,
+        'aciertos_cache': 0,
+        'fallos_cache': 0,
+        'filas_leidas': 0,
+        'eventos': [],
+        '_t0': time.perf_counter(),
+    }
+    _local.pila = []
+
+
+def terminar_rerun(interrumpida=False):
+    """Cerrar la traza en curso, guardarla en memoria y en el JSONL"""
+    traza = _traza()
+    if traza is None:
+        return None
+    while _local.pila:
+        _cerrar(_local.pila[-1], interrumpido=True)
+    traza['ms'] = round((time.perf_counter() - traza.pop('_t0')) * 1000, 1)
+    if interrumpida:
+        traza['interrumpida'] = True
+    _local.traza = None
+    TRAZAS.append(traza)
+    _escribir(traza)
+    return traza
+
+
+def _escribir(traza):
+    ruta = archivo_trazas()
+    if not ruta:
+        return
+    linea = json.dumps(traza, ensure_ascii=False, default=str) + '\n'
+    try:
+        with _lock_archivo:
+            if os.path.exists(ruta) and os.path.getsize(ruta) + len(linea) > MAX_BYTES:
+                os.replace(ruta, ruta + '.1')
+            with open(ruta, 'a', encoding='utf-8') as f:
+                f.write(linea)
+    except OSError:
+        # Sin disco escribible (p. ej. Streamlit Cloud de solo lectura) se queda en memoria
+        pass
+
+
+def abrir(nombre, tipo='funcion'):
+    """Abrir un evento en la traza en curso (None si no hay traza en este hilo)"""
+    traza = _traza()
+    if traza is None:
+        return None
+    evento = {
+        'nombre': nombre,
+        'tipo': tipo,
+        'nivel': len(_local.pila),
+        'ms': None,
+        'llamadas_api': 0,
+        '_t0': time.perf_counter(),
+    }
+    traza['eventos'].append(evento)
+    _local.pila.append(evento)
+    return evento
+
+
+def _cerrar(evento, interrumpido=False):
+    evento['ms'] = round((time.perf_counter() - evento.pop('_t0')) * 1000, 2)
+    if interrumpido:
+        evento['interrumpido'] = True
+    _local.pila.remove(evento)
+
+
+def cerrar(evento, **datos):
+    """Cerrar un evento devuelto por abrir() con datos extra (filas, cache...)"""
+    if evento is None or '_t0' not in evento:
+        return
+    evento.update(datos)
+    _cerrar(evento)
+
+
+@contextmanager
+def medir(nombre, tipo='funcion'):
+    evento = abrir(nombre, tipo)
+    try:
+        yield evento
+    finally:
+        cerrar(evento)
+
+
+def _filas(resultado):
+    return len(resultado) if hasattr(resultado, '__len__') and hasattr(resultado, 'columns') else None
+
+
+def _tipo_por_nombre(nombre):
+    if nombre.startswith(('get_', 'buscar_', 'find_')):
+        return 'lectura'
+    if nombre.startswith(('insertar_', 'actualizar_', 'eliminar_')):
+        return 'escritura'
+    return 'funcion'
+
+
+def medido(funcion=None, nombre=None, tipo=None):
+    """Decorador: apuntar duración, llamadas a la API y filas devueltas de cada llamada"""
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+        tipo_evento = tipo or _tipo_por_nombre(etiqueta)
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            evento = abrir(etiqueta, tipo_evento)
+            resultado = None
+            try:
+                resultado = funcion(*args, **kwargs)
+                return resultado
+            finally:
+                cerrar(evento, filas=_filas(resultado))
+        return envoltura
+    return decorador(funcion) if funcion is not None else decorador
+
+
+@st.cache_resource(show_spinner=False)
+def _resultados_compartidos(clave_funcion):
+    """Resultados de una función con @cache_compartida: (lock, {argumentos: (versión, resultado)}).
+
+    Como el snapshot, son del proceso y se descartan con st.cache_resource.clear():
+    un snapshot nuevo vuelve a numerar sus versiones desde el principio.
+    """
+    return threading.Lock(), {}
+
+
+def cache_compartida(versiones):
+    """Caché con medición: cada llamada es un evento y se anota si fue acierto o fallo.
+
+    El resultado se guarda una sola vez en memoria del proceso y no se
+    serializa ni se copia por llamada: todas las sesiones reciben una
+    copia superficial (con Copy-on-Write comparte los arrays) del mismo
+    DataFrame. versiones() devuelve la versión de los datos de los que
+    depende; el resultado se recalcula solo cuando cambia:
+
+        @lee_tablas('clientes')
+        @cache_compartida(lambda: get_snapshot().versiones(['clientes']))
+        def get_clientes(): ...
+    """
+    def decorador(funcion):
+        # Streamlit vuelve a ejecutar el script (y este decorador) en cada
+        # rerun: los resultados se guardan por nombre fuera del script
+        clave_funcion = f'{funcion.__module__}.{funcion.__qualname__}'
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            evento = abrir(funcion.__name__, 'lectura')
+            resultado = None
+            try:
+                version = versiones()
+                clave = (args, tuple(sorted(kwargs.items())))
+                lock, resultados = _resultados_compartidos(clave_funcion)
+                with lock:
+                    guardado = resultados.get(clave)
+                    acierto = guardado is not None and guardado[0] == version
+                    if not acierto:
+                        guardado = (version, funcion(*args, **kwargs))
+                        # Lo calculado con versiones anteriores ya no se va a servir
+                        for vieja in [c for c, (v, _) in resultados.items() if v != version]:
+                            del resultados[vieja]
+                        resultados[clave] = guardado
+                resultado = guardado[1]
+                if evento is not None:
+                    evento['cache'] = 'acierto' if acierto else 'fallo'
+                cache(acierto)
+                # Quien la reciba puede añadir o cambiar columnas sin tocar la compartida
+                return resultado.copy(deep=False) if hasattr(resultado, 'columns') else resultado
+            finally:
+                cerrar(evento, filas=_filas(resultado))
+
+        def limpiar():
+            lock, resultados = _resultados_compartidos(clave_funcion)
+            with lock:
+                resultados.clear()
+
+        envoltura.clear = limpiar
+        return envoltura
+    return decorador
+
+
+def cache(acierto):
+    """Apuntar un acierto o un fallo de caché en la traza en curso"""
+    traza = _traza()
+    if traza is not None:
+        traza['aciertos_cache' if acierto else 'fallos_cache'] += 1
+
+
+def filas_leidas(n):
+    """Apuntar filas leídas del almacenamiento (Sheets o SQLite)"""
+    traza = _traza()
+    if traza is not None:
+        traza['filas_leidas'] += n
+
+
+def llamada_api(*_):
+    """Apuntar una petición a la API de Sheets en la traza y en los eventos abiertos"""
+    traza = _traza()
+    if traza is None:
+        return
+    traza['llamadas_api'] += 1
+    for evento in _local.pila:
+        evento['llamadas_api'] += 1
+
+
+def contar_llamadas(cliente):
+    """Enganchar llamada_api al http_client de un cliente de gspread (o del falso)"""
+    http = cliente.http_client
+    if getattr(http, '_contado', False):
+        return cliente
+    peticion = http.request
+
+    @functools.wraps(peticion)
+    def contada(*args, **kwargs):
+        llamada_api()
+        return peticion(*args, **kwargs)
+
+    http.request = contada
+    http._contado = True
+    return cliente
+
+
+def ultimas(n=10):
+    """Las n trazas más recientes, de la más nueva a la más antigua"""
+    return list(TRAZAS)[-n:][::-1]
@@ -0,0 +1,103 @@
+"""
+Lotes de escritura.
+
+Una acción del usuario (guardar una cita, confirmar una solicitud...) puede
+tocar varias filas y varias hojas. Dentro de `with repo.lote():` las
+escrituras se acumulan aquí y al salir el backend las envía juntas: en
+Google Sheets es una sola llamada a Spreadsheet.batch_update.
+"""
+
+from collections import namedtuple
+
+from beautybox.esquema import a_nativo, headers
+
+
+class Cambio(namedtuple('Cambio', 'tabla tipo id valores')):
+    """Cambio de una fila tal como lo hizo la app.
+
+    tipo es 'insertar' (valores = fila completa), 'actualizar' (valores =
+    columnas modificadas), 'eliminar' (valores = None) o 'reemplazar' (la
+    tabla entera cambió; id y valores son None). Quien mantiene copias de los
+    datos en memoria puede aplicarlos en lugar de volver a leer la hoja.
+    """
+
+
+class LoteEscrituras:
+    """Escrituras pendientes agrupadas y fusionadas por tabla y fila"""
+
+    def __init__(self):
+        self.actualizaciones = {}  # (tabla, fila) -> {columna: valor}
+        self.anexos = {}           # tabla -> [dict de valores]
+        self.borrados = {}         # tabla -> set de filas
+        self.ids = {}              # (tabla, fila) -> id de la fila actualizada o borrada
+        self.cambios = []          # [Cambio] en el orden en que se hicieron
+
+    def vacio(self):
+        return not (self.actualizaciones or self.anexos or self.borrados or self.cambios)
+
+    def tablas(self):
+        """Tablas que modifica el lote"""
+        tablas = {tabla for tabla, _ in self.actualizaciones}
+        tablas.update(self.anexos, self.borrados)
+        tablas.update(cambio.tabla for cambio in self.cambios)
+        return tablas
+
+    def anexo_pendiente(self, tabla, id_valor):
+        """Fila todavía no enviada con ese id (insertada en este mismo lote)"""
+        for valores in self.anexos.get(tabla, []):
+            if valores.get('id') == id_valor:
+                return valores
+        return None
+
+    def anexar(self, tabla, valores):
+        self.anexos.setdefault(tabla, []).append(dict(valores))
+
+    def actualizar(self, tabla, fila, cambios, id_valor=None):
+        # Varias actualizaciones de la misma fila se fusionan; gana la última
+        self.actualizaciones.setdefault((tabla, fila), {}).update(cambios)
+        self.ids[(tabla, fila)] = id_valor
+
+    def borrar(self, tabla, fila, id_valor=None):
+        self.borrados.setdefault(tabla, set()).add(fila)
+        self.actualizaciones.pop((tabla, fila), None)
+        self.ids[(tabla, fila)] = id_valor
+
+    def mover_filas(self, tabla, filas):
+        """Cambiar los números de fila de una tabla ({fila vieja: fila nueva o None si ya no existe})"""
+        actualizaciones = {}
+        for (t, fila), cambios in self.actualizaciones.items():
+            nueva = filas.get(fila, fila) if t == tabla else fila
+            if nueva is not None:
+                actualizaciones[(t, nueva)] = cambios
+        self.actualizaciones = actualizaciones
+        if tabla in self.borrados:
+            self.borrados[tabla] = {filas.get(f, f) for f in self.borrados[tabla]} - {None}
+            if not self.borrados[tabla]:
+                del self.borrados[tabla]
+        self.ids = {(t, filas.get(f, f) if t == tabla else f): id_valor
+                    for (t, f), id_valor in self.ids.items()
+                    if t != tabla or filas.get(f, f) is not None}
+
+    def quitar_anexo(self, tabla, id_valor):
+        self.anexos[tabla] = [v for v in self.anexos.get(tabla, []) if v.get('id') != id_valor]
+        if not self.anexos[tabla]:
+            del self.anexos[tabla]
+
+    def tramos(self):
+        """Actualizaciones como tramos de columnas contiguas: (tabla, fila, col_inicio, [valores])"""
+        for (tabla, fila), cambios in sorted(self.actualizaciones.items()):
+            for col, valores in rangos_contiguos(tabla, cambios):
+                yield tabla, fila, col, valores
+
+
+def rangos_contiguos(tabla, cambios):
+    """Agrupar columnas modificadas en tramos contiguos: [(col_inicio, [valores])]"""
+    columnas = headers(tabla)
+    posiciones = sorted((columnas.index(col) + 1, a_nativo(valor)) for col, valor in cambios.items())
+    tramos = []
+    for pos, valor in posiciones:
+        if tramos and tramos[-1][0] + len(tramos[-1][1]) == pos:
+            tramos[-1][1].append(valor)
+        else:
+            tramos.append((pos, [valor]))
+    return tramos
@@ -0,0 +1,351 @@
+"""
+Avisos por email de las solicitudes de la página pública, en segundo plano.
+
+Antes, al pulsar "Enviar Solicitud" la clienta esperaba a que se abriera
+una conexión SMTP con Gmail, se hiciera login y se enviara el email, y si
+algo fallaba el aviso se perdía. Ahora la página solo anota el aviso en una
+cola persistente (ColaAvisos, un SQLite local) y un hilo (Notificador) lo
+envía:
+
+- Reutiliza una misma conexión SMTP mientras haya avisos (se comprueba con
+  NOOP antes de usarla y se cierra tras un rato sin trabajo).
+- Espera AGRUPAR segundos desde el primer aviso: si en ese tiempo llegan
+  más, se envía un solo email de resumen con todas las solicitudes.
+- Si el envío falla, los avisos vuelven a la cola y se reintentan cada vez
+  más espaciados. Tras MAX_INTENTOS se apartan (fallidos()) y Configuración
+  los muestra y ofrece volver a enviarlos.
+
+El servidor se configura en [email] de los secrets (servidor, puerto, ssl;
+por defecto Gmail con SSL). BEAUTYBOX_SMTP=host:puerto envía a un servidor
+local sin SSL ni login (p. ej. `pip install aiosmtpd` y `python -m aiosmtpd
+-n -l localhost:1025`, que muestra los emails en la consola) para probar sin
+Gmail.
+"""
+
+import json
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from html import escape
+
+RUTA_COLA_POR_DEFECTO = 'beautybox_avisos.db'
+
+# Segundos desde el primer aviso pendiente hasta enviarlo (los que lleguen antes van en el mismo resumen)
+AGRUPAR = 5
+
+# Reintentos: espera inicial, máxima (se dobla en cada fallo) e intentos antes de descartar un aviso
+ESPERA_INICIAL = 5
+ESPERA_MAXIMA = 600
+MAX_INTENTOS = 12
+
+# Segundos sin avisos tras los que se cierra la conexión SMTP
+INACTIVA = 60
+
+# Timeout de la conexión SMTP y segundos que un proceso se reserva los avisos que envía
+TIMEOUT_SMTP = 20
+TURNO = 120
+
+registro = logging.getLogger(__name__)
+
+
+def config_email(secrets=None):
+    """Configuración de [email] en los secrets, o None si no hay remitente, destinatario y servidor"""
+    seccion = {}
+    if secrets is not None:
+        try:
+            seccion = dict(secrets.get('email', {}))
+        except Exception:
+            seccion = {}
+    config = {
+        'remitente': seccion.get('sender', ''),
+        'password': seccion.get('app_password', ''),
+        'destinatario': seccion.get('recipient', ''),
+        'servidor': seccion.get('servidor', 'smtp.gmail.com'),
+        'puerto': int(seccion.get('puerto', 465)),
+        'ssl': bool(seccion.get('ssl', True)),
+        'cola': os.environ.get('BEAUTYBOX_AVISOS') or seccion.get('cola', RUTA_COLA_POR_DEFECTO),
+    }
+    if os.environ.get('BEAUTYBOX_SMTP'):
+        servidor, _, puerto = os.environ['BEAUTYBOX_SMTP'].partition(':')
+        config.update(servidor=servidor, puerto=int(puerto or 25), ssl=False, password='')
+    elif not config['password']:
+        return None
+    if not (config['remitente'] and config['destinatario']):
+        return None
+    return config
+
+
+class ColaAvisos:
+    """Avisos pendientes de enviar (dicts con los datos de una solicitud), en un SQLite (WAL) local"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.dueno = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._conexion = sqlite3.connect(ruta, timeout=10, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute('''
+                CREATE TABLE IF NOT EXISTS avisos (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    datos TEXT NOT NULL,
+                    creado_en REAL NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    siguiente_en REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    dueno TEXT,
+                    hasta REAL NOT NULL DEFAULT 0,
+                    fallido INTEGER NOT NULL DEFAULT 0
+                )''')
+
+    def anotar(self, datos):
+        with self._lock:
+            return self._conexion.execute('INSERT INTO avisos (datos, creado_en) VALUES (?, ?)',
+                                          [json.dumps(datos, default=str), time.time()]).lastrowid
+
+    def __len__(self):
+        with self._lock:
+            return self._conexion.execute('SELECT COUNT(*) FROM avisos WHERE NOT fallido').fetchone()[0]
+
+    def _libres(self, conexion, ahora):
+        return conexion.execute('SELECT seq, datos, creado_en, siguiente_en FROM avisos WHERE NOT fallido '
+                                'AND (dueno IS NULL OR dueno = ? OR hasta <= ?) ORDER BY seq',
+                                [self.dueno, ahora]).fetchall()
+
+    @staticmethod
+    def _listo_en(fila, agrupar):
+        # Un aviso nuevo espera a agrupar; uno que falló, además, a su reintento
+        return max(fila[2] + agrupar, fila[3])
+
+    def espera(self, agrupar):
+        """Segundos hasta que haya avisos listos para enviar (0 si ya), o None si no hay ninguno"""
+        with self._lock:
+            filas = self._libres(self._conexion, time.time())
+        if not filas:
+            return None
+        return max(min(self._listo_en(f, agrupar) for f in filas) - time.time(), 0)
+
+    def tomar(self, agrupar, segundos=TURNO):
+        """Reservar los avisos libres que no esperan un reintento si alguno ya está listo: [(seq, datos)]
+
+        Los que aún no han esperado `agrupar` van en el mismo resumen.
+        """
+        with self._lock:
+            self._conexion.execute('BEGIN IMMEDIATE')
+            try:
+                ahora = time.time()
+                filas = [f for f in self._libres(self._conexion, ahora) if f[3] <= ahora]
+                if not any(self._listo_en(f, agrupar) <= ahora for f in filas):
+                    filas = []
+                self._conexion.executemany('UPDATE avisos SET dueno = ?, hasta = ? WHERE seq = ?',
+                                           [(self.dueno, ahora + segundos, f[0]) for f in filas])
+                self._conexion.execute('COMMIT')
+            except sqlite3.Error:
+                self._conexion.execute('ROLLBACK')
+                raise
+        return [(seq, json.loads(datos)) for seq, datos, _, _ in filas]
+
+    def enviados(self, seqs):
+        with self._lock:
+            self._conexion.executemany('DELETE FROM avisos WHERE seq = ?', [(seq,) for seq in seqs])
+
+    def fallidos(self):
+        """Avisos descartados tras MAX_INTENTOS: [(seq, datos, error)]"""
+        with self._lock:
+            filas = self._conexion.execute('SELECT seq, datos, error FROM avisos WHERE fallido ORDER BY seq').fetchall()
+        return [(seq, json.loads(datos), error) for seq, datos, error in filas]
+
+    def reintentar_fallidos(self):
+        """Volver a poner en cola los avisos descartados; devuelve cuántos"""
+        with self._lock:
+            # Conservan sus intentos: si vuelven a fallar se descartan otra vez
+            return self._conexion.execute('UPDATE avisos SET fallido = 0, siguiente_en = 0 WHERE fallido').rowcount
+
+    def reintentar(self, seqs, error):
+        """Devolver los avisos a la cola con la espera del siguiente intento"""
+        ahora = time.time()
+        with self._lock:
+            for seq in seqs:
+                fila = self._conexion.execute('SELECT intentos FROM avisos WHERE seq = ?', [seq]).fetchone()
+                if fila is None:
+                    continue
+                intentos = fila[0] + 1
+                espera = min(ESPERA_INICIAL * 2 ** (intentos - 1), ESPERA_MAXIMA)
+                self._conexion.execute('UPDATE avisos SET intentos = ?, siguiente_en = ?, error = ?, dueno = NULL, '
+                                       'hasta = 0, fallido = ? WHERE seq = ?',
+                                       [intentos, ahora + espera, error, int(intentos >= MAX_INTENTOS), seq])
+
+
+def _fecha(datos):
+    return datetime.fromisoformat(datos['fecha']).strftime('%d/%m/%Y %H:%M')
+
+
+def texto_solicitud(datos):
+    return f"""
+Nueva Solicitud de Cita - BeautyBox Málaga
+
+👤 Cliente: {datos['nombre']}
+📱 Teléfono: {datos['telefono']}
+📧 Email: {datos['email'] if datos['email'] else 'No proporcionado'}
+💅 Servicio: {datos['servicio']}
+🕐 Preferencia: {datos['preferencia']}
+💬 Mensaje: {datos['mensaje'] if datos['mensaje'] else 'Sin mensaje'}
+
+📅 Fecha de solicitud: {_fecha(datos)}
+"""
+
+
+def html_solicitud(datos):
+    """Tarjetas de una solicitud (los datos vienen del formulario público: se escapan)"""
+    d = {clave: escape(str(valor)) for clave, valor in datos.items()}
+    return f"""
+                <div style="background: #F8F9FA; border-radius: 12px; padding: 16px; margin-bottom: 16px;">
+                    <p style="margin: 8px 0;"><strong>👤 Cliente:</strong> {d['nombre']}</p>
+                    <p style="margin: 8px 0;"><strong>📱 Teléfono:</strong> <a href="tel:{d['telefono']}">{d['telefono']}</a></p>
+                    <p style="margin: 8px 0;"><strong>📧 Email:</strong> {d['email'] if d['email'] else 'No proporcionado'}</p>
+                </div>
+
+                <div style="background: #F8F9FA; border-radius: 12px; padding: 16px; margin-bottom: 16px;">
+                    <p style="margin: 8px 0;"><strong>💅 Servicio:</strong> {d['servicio']}</p>
+                    <p style="margin: 8px 0;"><strong>🕐 Preferencia:</strong> {d['preferencia']}</p>
+                    <p style="margin: 8px 0;"><strong>💬 Mensaje:</strong> {d['mensaje'] if d['mensaje'] else 'Sin mensaje'}</p>
+                    <p style="margin: 8px 0; color: #8E8E93; font-size: 12px;">Solicitud recibida: {_fecha(datos)}</p>
+                </div>
+"""
+
+
+def mensaje_avisos(avisos, remitente, destinatario):
+    """Email de una solicitud o, si hay varias, un resumen con todas"""
+    if len(avisos) == 1:
+        asunto, titulo = f"Nueva Solicitud de Cita - {avisos[0]['nombre']}", '🔔 Nueva Solicitud'
+    else:
+        asunto, titulo = f'{len(avisos)} Nuevas Solicitudes de Cita', f'🔔 {len(avisos)} Nuevas Solicitudes'
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = asunto
+    msg['From'] = remitente
+    msg['To'] = destinatario
+
+    texto = '\n'.join(texto_solicitud(datos) for datos in avisos)
+    texto += '\nAbre la app para confirmar o rechazar.\n'
+    html = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; background-color: #FDF8F7; padding: 20px;">
+            <div style="max-width: 480px; margin: 0 auto; background: white; border-radius: 20px; padding: 24px; box-shadow: 0 4px 20px rgba(0,0,0,0.08);">
+                <div style="text-align: center; margin-bottom: 20px;">
+                    <h1 style="color: #c48b9f; margin: 0;">{titulo}</h1>
+                    <p style="color: #8E8E93; margin: 5px 0;">BeautyBox Málaga</p>
+                </div>
+{''.join(html_solicitud(datos) for datos in avisos)}
+                <div style="text-align: center; padding: 16px; background: linear-gradient(135deg, #d4a5a5 0%, #c48b9f 100%); border-radius: 12px;">
+                    <p style="color: white; margin: 0; font-weight: 600;">📲 Abre la app para confirmar o rechazar</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+    msg.attach(MIMEText(texto, 'plain'))
+    msg.attach(MIMEText(html, 'html'))
+    return msg
+
+
+class Notificador:
+    """Envía en segundo plano los avisos de una ColaAvisos con una conexión SMTP reutilizada"""
+
+    def __init__(self, cola, config):
+        self.cola = cola
+        self.config = config
+        self._smtp = None
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    def arrancar(self):
+        """Lanzar el hilo que envía la cola (también lo que quedó de una ejecución anterior)"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._enviar_siempre, name='avisos', daemon=True)
+            self._hilo.start()
+
+    def avisar(self, nombre, telefono, email, servicio, preferencia, mensaje):
+        """Anotar el aviso de una solicitud nueva; vuelve al momento"""
+        self.cola.anotar({'nombre': nombre, 'telefono': telefono, 'email': email, 'servicio': servicio,
+                          'preferencia': preferencia, 'mensaje': mensaje, 'fecha': datetime.now().isoformat()})
+        self._despertar.set()
+
+    def reintentar_fallidos(self):
+        """Volver a enviar los avisos descartados"""
+        if self.cola.reintentar_fallidos():
+            self._despertar.set()
+
+    def _enviar_siempre(self):
+        espera_error = ESPERA_INICIAL
+        while True:
+            try:
+                espera = self.enviar_pendientes()
+                espera_error = ESPERA_INICIAL
+            except Exception:
+                # Un fallo de la propia cola (p. ej. el SQLite bloqueado) no puede parar el hilo:
+                # los avisos tomados quedan reservados hasta TURNO y se vuelven a enviar
+                registro.exception('Error al enviar los avisos; se reintenta en %s s', espera_error)
+                self._cerrar()
+                espera, espera_error = espera_error, min(espera_error * 2, ESPERA_MAXIMA)
+            # Sin trabajo a la vista la conexión no se deja abierta: se despierta a tiempo de cerrarla
+            cerrar = self._smtp is not None and (espera is None or espera > INACTIVA)
+            if not self._despertar.wait(INACTIVA if cerrar else espera) and cerrar:
+                self._cerrar()
+            self._despertar.clear()
+
+    def enviar_pendientes(self, agrupar=None):
+        """Enviar lo que esté listo; devuelve los segundos hasta que haya más, o None si la cola está vacía"""
+        agrupar = AGRUPAR if agrupar is None else agrupar
+        avisos = self.cola.tomar(agrupar)
+        if avisos:
+            seqs = [seq for seq, _ in avisos]
+            try:
+                self._enviar([datos for _, datos in avisos])
+            except Exception as e:
+                # Cualquier fallo al componer o enviar el email (no solo de SMTP o de red)
+                # devuelve los avisos a la cola en lugar de dejarlos reservados
+                registro.warning('No se pudieron enviar %s avisos: %r', len(seqs), e)
+                self._cerrar()
+                self.cola.reintentar(seqs, str(e) or type(e).__name__)
+            else:
+                self.cola.enviados(seqs)
+        return self.cola.espera(agrupar)
+
+    def _enviar(self, avisos):
+        msg = mensaje_avisos(avisos, self.config['remitente'], self.config['destinatario'])
+        self._conexion().sendmail(self.config['remitente'], self.config['destinatario'], msg.as_string())
+
+    def _conexion(self):
+        """La conexión SMTP abierta si sigue viva; si no, una nueva"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._cerrar()
+        clase = smtplib.SMTP_SSL if self.config['ssl'] else smtplib.SMTP
+        smtp = clase(self.config['servidor'], self.config['puerto'], timeout=TIMEOUT_SMTP)
+        try:
+            if self.config['password']:
+                smtp.login(self.config['remitente'], self.config['password'])
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        return smtp
+
+    def _cerrar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
@@ -0,0 +1,208 @@
+"""
+Capa de repositorio: interfaz común para los backends de almacenamiento.
+
+Las funciones get_* / insertar_* de la app hablan con un Repositorio y no con
+gspread directamente. Hay dos implementaciones:
+
+- SheetsRepositorio: Google Sheets (BeautyBox_Database), el backend original.
+- SQLiteRepositorio: base de datos local indexada, con sincronización hacia
+  Google Sheets para que la dueña siga viendo los datos en su hoja.
+
+Con backend 'sheets_falso' se usa SheetsRepositorio sobre el Sheets en
+memoria de sheets_falso (pruebas y benchmarks sin credenciales).
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from beautybox.esquema import CATEGORIAS_POR_DEFECTO, ESQUEMAS, TABLAS_CON_FECHA, headers
+from beautybox.lotes import LoteEscrituras
+
+BACKEND_POR_DEFECTO = 'sheets'
+RUTA_SQLITE_POR_DEFECTO = 'beautybox.db'
+RUTA_CACHE_POR_DEFECTO = '.beautybox_cache'
+RUTA_BANDEJA_POR_DEFECTO = 'beautybox_bandeja.db'
+
+
+class Repositorio:
+    """Interfaz común de almacenamiento"""
+
+    def __init__(self):
+        # El repositorio se comparte entre sesiones (st.cache_resource);
+        # cada hilo de Streamlit tiene su propio lote en curso
+        self._local = threading.local()
+        # Funciones llamadas tras cada escritura: al_cambiar recibe la lista de
+        # Cambio fila a fila y al_escribir los nombres de las tablas tocadas
+        self.al_cambiar = []
+        self.al_escribir = []
+        # tabla -> última versión compartida que ha escrito este proceso (ver versiones())
+        self.versiones_escritas = {}
+
+    def preparar(self):
+        """Crear lo que falte del esquema y sembrar los datos por defecto (una vez por proceso)"""
+
+    def lote_actual(self):
+        return getattr(self._local, 'lote', None)
+
+    @contextmanager
+    def lote(self):
+        """Agrupar las escrituras de una acción; se envían juntas al salir del bloque.
+
+        Si el bloque lanza una excepción no se escribe nada. Los lotes
+        anidados se unen al exterior.
+        """
+        if self.lote_actual() is not None:
+            yield self.lote_actual()
+            return
+        lote = LoteEscrituras()
+        self._local.lote = lote
+        try:
+            yield lote
+        finally:
+            self._local.lote = None
+        if not lote.vacio():
+            self._enviar_lote(lote)
+            self._notificar(lote.tablas(), lote.cambios)
+
+    def _notificar(self, tablas, cambios):
+        # Primero se actualizan las copias en memoria y después se limpian
+        # las cachés que se recalculan a partir de ellas
+        for funcion in self.al_cambiar:
+            funcion(cambios)
+        for funcion in self.al_escribir:
+            funcion(*tablas)
+
+    def _enviar_lote(self, lote):
+        """Enviar al almacenamiento las escrituras acumuladas en un lote"""
+        raise NotImplementedError
+
+    def leer(self, tabla, desde=None, hasta=None):
+        """Todas las filas de una tabla como DataFrame (opcionalmente por rango de fecha)"""
+        raise NotImplementedError
+
+    def leer_varias(self, tablas):
+        """Varias tablas completas de una vez: {tabla: DataFrame}"""
+        return {tabla: self.leer(tabla) for tabla in tablas}
+
+    def leer_columnas(self, pedidos):
+        """Solo algunas columnas (y opcionalmente algunas filas) de varias tablas.
+
+        pedidos es {tabla: (columnas, filas)}; filas son posiciones desde 0 en
+        el orden de la tabla, o None para todas. Devuelve {tabla: DataFrame}.
+        """
+        return {tabla: proyectar(self.leer(tabla), columnas, filas)
+                for tabla, (columnas, filas) in pedidos.items()}
+
+    def revision(self):
+        """Marca que cambia con cualquier escritura en el almacenamiento (None si no se puede saber)"""
+        return None
+
+    def versiones(self):
+        """Versión compartida de cada tabla, que sube con cada escritura de cualquier proceso
+        de la app: {tabla: versión}. None si el backend no la guarda"""
+        return None
+
+    def sondear(self, tablas):
+        """Columna id de cada tabla, en el orden de las filas, para detectar cambios
+        sin leerlas enteras: {tabla: [id, ...]}. None si el backend no lo soporta"""
+        return None
+
+    def leer_colas(self, desde):
+        """Filas añadidas al final de cada tabla: {tabla: filas ya leídas} -> {tabla: DataFrame}"""
+        return {tabla: self.leer(tabla).iloc[n:] for tabla, n in desde.items()}
+
+    def pendientes(self, tabla=None):
+        """Cambios ya aceptados que todavía no están en el almacenamiento (ver bandeja.py)"""
+        return []
+
+    def fallidos(self):
+        """Lotes de cambios que no se pudieron enviar al almacenamiento: [(seq, [Cambio], error)]"""
+        return []
+
+    def insertar(self, tabla, valores):
+        """Insertar una fila y devolver su id"""
+        raise NotImplementedError
+
+    def actualizar(self, tabla, id_valor, cambios):
+        """Actualizar columnas de la fila con ese id. Devuelve False si no existe"""
+        raise NotImplementedError
+
+    def eliminar(self, tabla, id_valor):
+        """Borrar la fila con ese id. Devuelve False si no existe"""
+        raise NotImplementedError
+
+    def siguiente_id(self, tabla):
+        """Siguiente id libre de una tabla"""
+        raise NotImplementedError
+
+    def reemplazar(self, tabla, df):
+        """Sustituir todo el contenido de una tabla (usado al sincronizar)"""
+        raise NotImplementedError
+
+
+def categorias_por_defecto():
+    """Filas de CATEGORIAS_POR_DEFECTO listas para insertar"""
+    creado = datetime.now().isoformat()
+    return [{'id': cat_id, 'nombre': nombre, 'descripcion': descripcion, 'created_at': creado}
+            for cat_id, nombre, descripcion in CATEGORIAS_POR_DEFECTO]
+
+
+def dataframe_vacio(tabla):
+    return pd.DataFrame(columns=headers(tabla))
+
+
+def proyectar(df, columnas, filas=None):
+    """Las columnas pedidas de df y, si se dan, solo las filas en esas posiciones"""
+    df = df[list(columnas)]
+    if filas is not None:
+        df = df.iloc[[f for f in filas if f < len(df)]]
+    return df
+
+
+def filtrar_por_fecha(df, tabla, desde=None, hasta=None):
+    """Filtrar por la columna 'fecha' como hacía get_citas originalmente"""
+    if tabla not in TABLAS_CON_FECHA or not (desde and hasta) or len(df) == 0:
+        return df
+    if not pd.api.types.is_datetime64_any_dtype(df['fecha']):
+        # assign: df puede ser la tabla compartida del snapshot
+        df = df.assign(fecha=pd.to_datetime(df['fecha']))
+    return df[(df['fecha'] >= pd.to_datetime(desde)) &
+              (df['fecha'] <= pd.to_datetime(hasta))]
+
+
+def sincronizar(origen, destino, tablas=None):
+    """Copiar tablas completas de un repositorio a otro (p. ej. SQLite → Sheets)"""
+    tablas = tablas or list(ESQUEMAS)
+    for tabla in tablas:
+        destino.reemplazar(tabla, origen.leer(tabla))
+    return tablas
+
+
+def config_almacenamiento(secrets=None):
+    """Leer el backend configurado.
+
+    Prioridad: variables de entorno BEAUTYBOX_BACKEND / BEAUTYBOX_SQLITE /
+    BEAUTYBOX_CACHE_DISCO / BEAUTYBOX_CACHE_COMPARTIDA / BEAUTYBOX_BANDEJA y
+    después la sección [almacenamiento] de los secrets de Streamlit.
+    ruta_cache vacía desactiva la copia en disco; con cache_compartida (p. ej.
+    '.beautybox_cache/compartida.db') la copia la comparten todos los procesos
+    de la máquina y sustituye a la de ruta_cache. bandeja vacía hace que las
+    escrituras vayan directamente a Google Sheets, sin bandeja de salida.
+    """
+    seccion = {}
+    if secrets is not None:
+        try:
+            seccion = dict(secrets.get('almacenamiento', {}))
+        except Exception:
+            seccion = {}
+    return {
+        'backend': os.environ.get('BEAUTYBOX_BACKEND') or seccion.get('backend', BACKEND_POR_DEFECTO),
+        'ruta_sqlite': os.environ.get('BEAUTYBOX_SQLITE') or seccion.get('ruta_sqlite', RUTA_SQLITE_POR_DEFECTO),
+        'ruta_cache': os.environ.get('BEAUTYBOX_CACHE_DISCO', seccion.get('ruta_cache', RUTA_CACHE_POR_DEFECTO)),
+        'cache_compartida': os.environ.get('BEAUTYBOX_CACHE_COMPARTIDA', seccion.get('cache_compartida', '')),
+        'bandeja': os.environ.get('BEAUTYBOX_BANDEJA', seccion.get('bandeja', RUTA_BANDEJA_POR_DEFECTO)),
+    }
@@ -0,0 +1,520 @@
+"""
+Backend de Google Sheets (BeautyBox_Database).
+"""
+
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import gspread
+import pandas as pd
+from gspread.utils import fill_gaps, numericise_all, rowcol_to_a1
+
+from beautybox.esquema import ESQUEMAS, a_fila, a_nativo, headers
+from beautybox.ids import AsignadorIds, como_id, max_id
+from beautybox.indice import IndiceFilas
+from beautybox.instrumentacion import medido
+from beautybox.lotes import Cambio
+from beautybox.repositorio import Repositorio, categorias_por_defecto, dataframe_vacio, filtrar_por_fecha
+
+# Hoja auxiliar con el último id reservado y la versión de cada tabla
+HOJA_META = '_meta'
+HEADERS_META = ['tabla', 'ultimo_id', 'version']
+
+# Veces que se vuelve a leer el contador de ids si otro proceso lo movió a la vez
+MAX_INTENTOS_RESERVA = 8
+
+# Hojas que se leen a la vez cuando no hay values_batch_get (el limitador sigue repartiendo la cuota)
+MAX_HILOS_LECTURA = 4
+
+# Rangos de filas por tabla en una lectura proyectada (los rangos van en la URL del GET)
+MAX_TRAMOS = 40
+
+
+def get_or_create_worksheet(spreadsheet, name, headers):
+    """Obtener o crear una hoja con los headers especificados"""
+    try:
+        worksheet = spreadsheet.worksheet(name)
+    except gspread.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(title=name, rows=1000, cols=20)
+        worksheet.append_row(headers)
+    return worksheet
+
+
+def registros_de_valores(valores):
+    """Convertir una matriz de valores (header + filas) en registros como get_all_records"""
+    if not valores:
+        return []
+    columnas = valores[0]
+    filas = fill_gaps(valores[1:], cols=len(columnas)) if len(valores) > 1 else []
+    return [dict(zip(columnas, numericise_all(fila, default_blank=''))) for fila in filas]
+
+
+def letra_columna(n):
+    """Letra A1 de la columna n (desde 1)"""
+    return rowcol_to_a1(1, n).rstrip('0123456789')
+
+
+def tramos(posiciones, maximo=MAX_TRAMOS):
+    """Posiciones agrupadas en como mucho `maximo` tramos [(inicio, fin), ...] (fin incluido).
+
+    Si salen más tramos se unen los separados por los huecos más pequeños,
+    leyendo alguna fila de más.
+    """
+    resultado = []
+    for p in sorted(set(posiciones)):
+        if resultado and p == resultado[-1][1] + 1:
+            resultado[-1] = (resultado[-1][0], p)
+        else:
+            resultado.append((p, p))
+    if len(resultado) > maximo:
+        huecos = sorted(range(1, len(resultado)), key=lambda i: resultado[i][0] - resultado[i - 1][1])
+        cortes = sorted(huecos[len(resultado) - maximo:])
+        inicios = [0] + cortes
+        finales = [c - 1 for c in cortes] + [len(resultado) - 1]
+        resultado = [(resultado[i][0], resultado[j][1]) for i, j in zip(inicios, finales)]
+    return resultado
+
+
+def celda(valor):
+    """CellData de la API de Sheets, sin interpretar el valor (como RAW)"""
+    valor = a_nativo(valor)
+    if isinstance(valor, bool):
+        return {'userEnteredValue': {'boolValue': valor}}
+    if isinstance(valor, (int, float)) and not (isinstance(valor, float) and math.isnan(valor)):
+        return {'userEnteredValue': {'numberValue': valor}}
+    if isinstance(valor, float):
+        valor = ''
+    return {'userEnteredValue': {'stringValue': str(valor)}}
+
+
+def fila_celdas(valores):
+    return {'values': [celda(v) for v in valores]}
+
+
+class SheetsRepositorio(Repositorio):
+    """Repositorio sobre un gspread.Spreadsheet.
+
+    Todas las escrituras pasan por un lote: una operación suelta es un lote de
+    una sola escritura y `with repo.lote():` junta las de una acción completa
+    en una única llamada a Spreadsheet.batch_update.
+
+    Las hojas se comprueban una sola vez (preparar) y sus Worksheet se
+    guardan para toda la vida del proceso: las lecturas y escrituras
+    normales no hacen ninguna petición de metadatos.
+
+    Cada lote escribe además, en el mismo batch_update, un sello nuevo en la
+    columna version de '_meta' para cada tabla tocada. Otros procesos leen
+    esa columna (versiones) para saber qué tablas han cambiado.
+    """
+
+    def __init__(self, spreadsheet, tamano_bloque_ids=None, lectura_por_lotes=None):
+        super().__init__()
+        self.spreadsheet = spreadsheet
+        if lectura_por_lotes is None:
+            lectura_por_lotes = hasattr(spreadsheet, 'values_batch_get')
+        self.lectura_por_lotes = lectura_por_lotes
+        # get_lastUpdateTime necesita la API de Drive; si no hay permiso se deja de pedir
+        self.usar_revision = hasattr(spreadsheet, 'get_lastUpdateTime')
+        self.ids = AsignadorIds(self._reservar_ids)
+        self.indices = {}
+        self._hojas = None  # título -> Worksheet, tras preparar()
+        self._filas_meta = {}  # tabla -> fila de '_meta', tras preparar()
+        self._lock_hojas = threading.Lock()
+        if tamano_bloque_ids:
+            self.ids.tamano_bloque = tamano_bloque_ids
+
+    def preparar(self):
+        """Comprobar todas las hojas y sus headers de una vez, crear lo que falte y sembrar categorías.
+
+        Como mucho hace cuatro peticiones, solo la primera vez: la lista de
+        hojas, las dos primeras filas de las que ya existen ('_meta' entera),
+        un batch_update con las hojas, headers, filas de '_meta' y categorías
+        que falten y, si se crearon hojas, otra vez la lista para guardar sus
+        Worksheet.
+        """
+        with self._lock_hojas:
+            if self._hojas is not None:
+                return
+            hojas = {ws.title: ws for ws in self.spreadsheet.worksheets()}
+            tablas = [*ESQUEMAS, HOJA_META]
+            existentes = [tabla for tabla in tablas if tabla in hojas]
+            primeras = {}
+            if existentes:
+                respuesta = self.spreadsheet.values_batch_get(
+                    [f"'{tabla}'!A:C" if tabla == HOJA_META else f"'{tabla}'!1:2" for tabla in existentes])
+                primeras = {tabla: rango.get('values', [])
+                            for tabla, rango in zip(existentes, respuesta.get('valueRanges', []))}
+            ids = {tabla: hoja.id for tabla, hoja in hojas.items()}
+            requests = []
+            for tabla in tablas:
+                if tabla not in ids:
+                    ids[tabla] = max(ids.values(), default=-1) + 1
+                    requests.append({'addSheet': {'properties': {
+                        'sheetId': ids[tabla],
+                        'title': tabla,
+                        'gridProperties': {'rowCount': 1000, 'columnCount': 20},
+                    }}})
+                filas = primeras.get(tabla, [])
+                columnas = HEADERS_META if tabla == HOJA_META else headers(tabla)
+                # '_meta' de antes de la columna version también se completa
+                if not filas or not filas[0] or (tabla == HOJA_META and len(filas[0]) < len(columnas)):
+                    requests.append({'updateCells': {
+                        'range': {'sheetId': ids[tabla], 'startRowIndex': 0, 'endRowIndex': 1,
+                                  'startColumnIndex': 0, 'endColumnIndex': len(columnas)},
+                        'rows': [fila_celdas(columnas)],
+                        'fields': 'userEnteredValue',
+                    }})
+            # Una fila de '_meta' por tabla, para que cada lote sepa dónde escribir su versión
+            filas_meta = {}
+            for i, fila in enumerate(primeras.get(HOJA_META, [])[1:], start=2):
+                if fila and fila[0] in ESQUEMAS:
+                    filas_meta.setdefault(fila[0], i)
+            faltan = [tabla for tabla in ESQUEMAS if tabla not in filas_meta]
+            if faltan:
+                # appendCells escribe tras la última fila con datos
+                siguiente = max(len(primeras.get(HOJA_META, [])), 1) + 1
+                filas_meta.update({tabla: siguiente + i for i, tabla in enumerate(faltan)})
+                requests.append({'appendCells': {
+                    'sheetId': ids[HOJA_META],
+                    'rows': [fila_celdas([tabla, '', '']) for tabla in faltan],
+                    'fields': 'userEnteredValue',
+                }})
+            if len(primeras.get('categorias', [])) < 2:
+                requests.append({'appendCells': {
+                    'sheetId': ids['categorias'],
+                    'rows': [fila_celdas(a_fila('categorias', valores)) for valores in categorias_por_defecto()],
+                    'fields': 'userEnteredValue',
+                }})
+            if requests:
+                self.spreadsheet.batch_update({'requests': requests})
+                if len(hojas) < len(ids):
+                    hojas = {ws.title: ws for ws in self.spreadsheet.worksheets()}
+            self._filas_meta = filas_meta
+            self._hojas = hojas
+
+    def olvidar_hojas(self):
+        """Volver a comprobar las hojas en el próximo acceso (p. ej. si se borró una a mano)"""
+        with self._lock_hojas:
+            self._hojas = None
+
+    def worksheet(self, tabla):
+        self.preparar()
+        hoja = self._hojas.get(tabla)
+        if hoja is None:
+            # Hoja fuera del esquema: se busca o se crea como antes y se guarda
+            hoja = self._hojas[tabla] = get_or_create_worksheet(self.spreadsheet, tabla, headers(tabla))
+        return hoja
+
+    def leer(self, tabla, desde=None, hasta=None):
+        data = self.worksheet(tabla).get_all_records()
+        df = pd.DataFrame(data) if data else dataframe_vacio(tabla)
+        return filtrar_por_fecha(df, tabla, desde, hasta)
+
+    def leer_varias(self, tablas):
+        """Todas las tablas pedidas en una sola llamada a values_batch_get (o en paralelo si no la hay)"""
+        tablas = list(tablas)
+        if not tablas:
+            return {}
+        self.preparar()
+        if not self.lectura_por_lotes:
+            return self._leer_en_paralelo(tablas)
+        respuesta = self.spreadsheet.values_batch_get([f"'{tabla}'" for tabla in tablas])
+        resultado = {}
+        for tabla, rango in zip(tablas, respuesta.get('valueRanges', [])):
+            data = registros_de_valores(rango.get('values', []))
+            resultado[tabla] = pd.DataFrame(data) if data else dataframe_vacio(tabla)
+        return resultado
+
+    def revision(self):
+        """modifiedTime del archivo en Drive (una petición pequeña)"""
+        if not self.usar_revision:
+            return None
+        try:
+            return self.spreadsheet.get_lastUpdateTime()
+        except gspread.exceptions.APIError as e:
+            if e.code in (403, 404):
+                self.usar_revision = False
+            return None
+
+    def versiones(self):
+        """Columna version de '_meta' (una petición pequeña): {tabla: sello}"""
+        self.preparar()
+        respuesta = self.spreadsheet.values_batch_get([f"'{HOJA_META}'!A2:C"])
+        filas = respuesta.get('valueRanges', [{}])[0].get('values', [])
+        versiones = {}
+        for fila in filas:
+            # Manda la primera fila de cada tabla (puede haber otra con el contador de ids)
+            if fila and fila[0] in ESQUEMAS:
+                versiones.setdefault(fila[0], fila[2] if len(fila) > 2 else '')
+        return versiones
+
+    def _sellar(self, tablas):
+        """updateCells que ponen un sello de versión nuevo a las tablas en '_meta'"""
+        requests = []
+        for tabla in tablas:
+            fila = self._filas_meta.get(tabla)
+            if fila is None:
+                continue
+            # Un sello único basta: quien lee solo compara si ha cambiado
+            sello = uuid.uuid4().hex[:12]
+            self.versiones_escritas[tabla] = sello
+            requests.append({'updateCells': {
+                'range': {'sheetId': self.worksheet(HOJA_META).id, 'startRowIndex': fila - 1, 'endRowIndex': fila,
+                          'startColumnIndex': 2, 'endColumnIndex': 3},
+                'rows': [fila_celdas([sello])],
+                'fields': 'userEnteredValue',
+            }})
+        return requests
+
+    def sondear(self, tablas):
+        """La columna A (id) de todas las tablas en un solo values_batch_get"""
+        tablas = list(tablas)
+        self.preparar()
+        respuesta = self.spreadsheet.values_batch_get([f"'{tabla}'!A2:A" for tabla in tablas])
+        return {tabla: [fila[0] if fila else '' for fila in rango.get('values', [])]
+                for tabla, rango in zip(tablas, respuesta.get('valueRanges', []))}
+
+    def leer_colas(self, desde):
+        """El header y las filas a partir de la n+1 de cada tabla, en un solo values_batch_get"""
+        rangos = []
+        for tabla, n in desde.items():
+            ultima_columna = letra_columna(len(headers(tabla)))
+            rangos += [f"'{tabla}'!1:1", f"'{tabla}'!A{n + 2}:{ultima_columna}"]
+        valores = self.spreadsheet.values_batch_get(rangos).get('valueRanges', [])
+        resultado = {}
+        for i, tabla in enumerate(desde):
+            cabecera, filas = valores[2 * i].get('values', []), valores[2 * i + 1].get('values', [])
+            data = registros_de_valores(cabecera + filas) if filas else []
+            resultado[tabla] = pd.DataFrame(data) if data else dataframe_vacio(tabla)
+        return resultado
+
+    def leer_columnas(self, pedidos):
+        """Rangos A1 de solo lo pedido, todas las tablas en un solo values_batch_get.
+
+        Sin filas se pide cada columna entera ('citas'!B2:B); con filas, un
+        rango por tramo de filas consecutivas (como mucho MAX_TRAMOS) entre
+        la primera y la última columna pedidas. Las columnas se ubican con el header de esquema.py.
+        """
+        self.preparar()
+        rangos, partes = [], []
+        for tabla, (columnas, filas) in pedidos.items():
+            indices = [headers(tabla).index(col) + 1 for col in columnas]
+            if filas is None:
+                for i in indices:
+                    rangos.append(f"'{tabla}'!{letra_columna(i)}2:{letra_columna(i)}")
+                partes.append((tabla, columnas, None))
+            else:
+                primera, ultima = min(indices), max(indices)
+                bloques = tramos(filas)
+                for inicio, fin in bloques:
+                    rangos.append(f"'{tabla}'!{letra_columna(primera)}{inicio + 2}:{letra_columna(ultima)}{fin + 2}")
+                partes.append((tabla, columnas, (bloques, set(filas), [i - primera for i in indices])))
+        valores = self.spreadsheet.values_batch_get(rangos).get('valueRanges', []) if rangos else []
+        valores = iter(valores)
+        resultado = {}
+        for tabla, columnas, por_filas in partes:
+            if por_filas is None:
+                # Cada columna llega sin las celdas vacías del final: se igualan las longitudes
+                por_columna = [[fila[0] if fila else '' for fila in next(valores).get('values', [])]
+                               for _ in columnas]
+                n = max((len(c) for c in por_columna), default=0)
+                matriz = [[c[i] if i < len(c) else '' for c in por_columna] for i in range(n)]
+            else:
+                bloques, pedidas, desplazamientos = por_filas
+                matriz = []
+                for inicio, fin in bloques:
+                    leidas = next(valores).get('values', [])
+                    for i in range(fin - inicio + 1):
+                        if inicio + i not in pedidas:
+                            continue
+                        fila = leidas[i] if i < len(leidas) else []
+                        matriz.append([fila[d] if d < len(fila) else '' for d in desplazamientos])
+            data = registros_de_valores([list(columnas)] + matriz) if matriz else []
+            resultado[tabla] = pd.DataFrame(data) if data else pd.DataFrame(columns=list(columnas))
+        return resultado
+
+    def _leer_en_paralelo(self, tablas):
+        """Una petición por hoja, como mucho MAX_HILOS_LECTURA a la vez"""
+        with ThreadPoolExecutor(max_workers=min(MAX_HILOS_LECTURA, len(tablas)),
+                                thread_name_prefix='leer_hoja') as hilos:
+            futuros = {tabla: hilos.submit(self.leer, tabla) for tabla in tablas}
+            return {tabla: futuro.result() for tabla, futuro in futuros.items()}
+
+    def siguiente_id(self, tabla):
+        return self.ids.siguiente(tabla)
+
+    def _reservar_ids(self, tabla, cantidad, minimo=0):
+        """Avanzar el contador de '_meta' y devolver el primer id del bloque.
+
+        El contador de una tabla es la primera fila de '_meta' con su nombre
+        y la columna ultimo_id no vacía. Se avanza con un findReplace del
+        valor leído al nuevo: batch_update lo aplica de forma atómica y, si
+        otro proceso movió el contador entretanto, no cambia nada y se vuelve
+        a leer. La primera vez que se usa una tabla se anexa su fila de
+        contador (una anexión nunca pisa a otra) partiendo del mayor id de
+        su columna A. `minimo` sube el contador si la tabla ya tiene ids mayores.
+        """
+        meta = self.worksheet(HOJA_META)
+        for intento in range(MAX_INTENTOS_RESERVA):
+            if intento:
+                time.sleep(random.uniform(0, 0.1 * intento))
+            fila_meta, actual = None, None
+            for i, fila in enumerate(meta.get_all_values()[1:], start=2):
+                # preparar() crea la fila de cada tabla con ultimo_id vacío
+                if fila and fila[0] == tabla and len(fila) > 1 and str(fila[1]).strip():
+                    fila_meta, actual = i, str(fila[1]).strip()
+                    break
+            if fila_meta is None:
+                # Si dos procesos anexan a la vez, manda la primera fila y la otra se ignora
+                ultimo = max(max_id(self.worksheet(tabla).col_values(1)[1:]), minimo)
+                meta.append_row([tabla, ultimo, ''])
+                continue
+            ultimo = max(max_id([actual]), minimo)
+            if ultimo + cantidad == max_id([actual]):
+                return ultimo + 1
+            respuesta = self.spreadsheet.batch_update({'requests': [{'findReplace': {
+                'find': actual,
+                'replacement': str(ultimo + cantidad),
+                'matchCase': True,
+                'matchEntireCell': True,
+                'range': {'sheetId': meta.id, 'startRowIndex': fila_meta - 1, 'endRowIndex': fila_meta,
+                          'startColumnIndex': 1, 'endColumnIndex': 2},
+            }}]})
+            cambiadas = respuesta.get('replies', [{}])[0].get('findReplace', {}).get('occurrencesChanged', 0)
+            if cambiadas:
+                return ultimo + 1
+        raise RuntimeError(f"No se pudo reservar ids de '{tabla}': el contador de '{HOJA_META}' no deja de cambiar")
+
+    def indice(self, tabla):
+        """Índice id -> fila de una hoja (se crea vacío y se carga al primer uso)"""
+        return self.indices.setdefault(
+            tabla, IndiceFilas(lambda: self.worksheet(tabla).col_values(1)[1:]))
+
+    @medido
+    def find_row_by_id(self, tabla, id_valor, verificar=False):
+        return self.indice(tabla).fila(id_valor, verificar=verificar)
+
+    def insertar(self, tabla, valores):
+        valores = dict(valores)
+        with self.lote() as lote:
+            if not valores.get('id'):
+                valores['id'] = self.siguiente_id(tabla)
+            lote.anexar(tabla, valores)
+            lote.cambios.append(Cambio(tabla, 'insertar', valores['id'], valores))
+        return valores['id']
+
+    def actualizar(self, tabla, id_valor, cambios):
+        with self.lote() as lote:
+            pendiente = lote.anexo_pendiente(tabla, id_valor)
+            if pendiente is not None:
+                pendiente.update(cambios)
+            else:
+                row_num = self.find_row_by_id(tabla, id_valor)
+                if not row_num:
+                    return False
+                lote.actualizar(tabla, row_num, cambios, id_valor)
+            lote.cambios.append(Cambio(tabla, 'actualizar', id_valor, dict(cambios)))
+        return True
+
+    def eliminar(self, tabla, id_valor):
+        with self.lote() as lote:
+            if lote.anexo_pendiente(tabla, id_valor) is not None:
+                lote.quitar_anexo(tabla, id_valor)
+            else:
+                # Borrar es destructivo: se comprueba la fila con una lectura de la columna de ids
+                row_num = self.find_row_by_id(tabla, id_valor, verificar=True)
+                if not row_num:
+                    return False
+                lote.borrar(tabla, row_num, id_valor)
+            lote.cambios.append(Cambio(tabla, 'eliminar', id_valor, None))
+        return True
+
+    def _comprobar_filas(self, lote):
+        """Comprobar que las filas a actualizar siguen teniendo su id (un solo values_batch_get).
+
+        El índice se fía de sus números de fila hasta VIGENCIA segundos, pero
+        si otro proceso o alguien a mano borró una fila, las de debajo han
+        subido y updateCells pisaría el registro vecino. Si algún id no
+        coincide, las filas de esa tabla se vuelven a buscar con la columna
+        de ids recién leída; las que ya no existen se quitan del lote.
+        """
+        filas = sorted(lote.actualizaciones)
+        if not filas:
+            return
+        respuesta = self.spreadsheet.values_batch_get([f"'{tabla}'!A{fila}" for tabla, fila in filas])
+        movidas = set()
+        for (tabla, fila), rango in zip(filas, respuesta.get('valueRanges', [])):
+            valores = rango.get('values', [])
+            if como_id(valores[0][0] if valores and valores[0] else None) != como_id(lote.ids.get((tabla, fila))):
+                movidas.add(tabla)
+        for tabla in movidas:
+            indice = self.indice(tabla)
+            indice.invalidar()
+            lote.mover_filas(tabla, {fila: indice.fila(id_valor)
+                                     for (t, fila), id_valor in lote.ids.items() if t == tabla})
+
+    def _enviar_lote(self, lote):
+        self._comprobar_filas(lote)
+        # Orden: actualizaciones con los números de fila originales, borrados
+        # de abajo arriba para no desplazar filas pendientes y, al final, anexos
+        hojas = {tabla: self.worksheet(tabla).id for tabla in lote.tablas()}
+        requests = []
+        for tabla, fila, col, valores in lote.tramos():
+            requests.append({'updateCells': {
+                'range': {
+                    'sheetId': hojas[tabla],
+                    'startRowIndex': fila - 1,
+                    'endRowIndex': fila,
+                    'startColumnIndex': col - 1,
+                    'endColumnIndex': col - 1 + len(valores),
+                },
+                'rows': [fila_celdas(valores)],
+                'fields': 'userEnteredValue',
+            }})
+        for tabla, filas in lote.borrados.items():
+            for fila in sorted(filas, reverse=True):
+                requests.append({'deleteDimension': {'range': {
+                    'sheetId': hojas[tabla],
+                    'dimension': 'ROWS',
+                    'startIndex': fila - 1,
+                    'endIndex': fila,
+                }}})
+        for tabla, anexos in lote.anexos.items():
+            requests.append({'appendCells': {
+                'sheetId': hojas[tabla],
+                'rows': [fila_celdas(a_fila(tabla, valores)) for valores in anexos],
+                'fields': 'userEnteredValue',
+            }})
+        requests += self._sellar(lote.tablas())
+        try:
+            self.spreadsheet.batch_update({'requests': requests})
+        except Exception:
+            for tabla in lote.tablas():
+                self.indice(tabla).invalidar()
+            raise
+        for tabla, filas in lote.borrados.items():
+            for fila in sorted(filas, reverse=True):
+                self.indice(tabla).borrado(fila)
+        for tabla, anexos in lote.anexos.items():
+            self.indice(tabla).anexado([valores['id'] for valores in anexos])
+
+    def reemplazar(self, tabla, df):
+        worksheet = self.worksheet(tabla)
+        columnas = headers(tabla)
+        datos = df.reindex(columns=columnas)
+        datos = datos.astype(object).where(datos.notna(), '')
+        filas = [[a_nativo(v) for v in fila] for fila in datos.values.tolist()]
+        worksheet.clear()
+        worksheet.update(values=[columnas] + filas, range_name='A1')
+        # El contador de '_meta' no puede quedar por debajo de los ids copiados
+        self._reservar_ids(tabla, 0, minimo=max_id(datos['id'].tolist()))
+        self.ids.olvidar(tabla)
+        self.indice(tabla).invalidar()
+        sellos = self._sellar([tabla])
+        if sellos:
+            self.spreadsheet.batch_update({'requests': sellos})
+        self._notificar([tabla], [Cambio(tabla, 'reemplazar', None, None)])
@@ -0,0 +1,429 @@
+"""
+Google Sheets falso en memoria, para pruebas y benchmarks sin cuenta de servicio.
+
+Imita la parte de gspread que usa la app: Client.open/create/del_spreadsheet,
+Spreadsheet.worksheet/worksheets/add_worksheet/values_batch_get/batch_update/
+get_lastUpdateTime (batch_update con updateCells, appendCells, deleteDimension,
+findReplace y addSheet) y
+Worksheet.get_all_records/get_all_values/col_values/batch_get/append_row(s)/
+update/delete_rows/clear. Las celdas se guardan como texto, igual que las
+devuelve la API con FORMATTED_VALUE.
+
+Cada método cuenta como una petición a la API: se puede añadir latencia, se
+cuentan las llamadas por método y los bytes devueltos, y se simula el error
+429 al pasar de la cuota por minuto o a demanda con fallar().
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, fill_gaps, numericise_all
+
+# Título de la hoja de cálculo que abre la app (conexion.get_spreadsheet)
+TITULO_POR_DEFECTO = 'BeautyBox_Database'
+
+
+class _RespuestaError:
+    """Lo mínimo de requests.Response que necesita gspread.exceptions.APIError"""
+
+    def __init__(self, codigo, mensaje, estado):
+        self.status_code = codigo
+        self._error = {'code': codigo, 'message': mensaje, 'status': estado}
+        self.text = json.dumps({'error': self._error})
+
+    def json(self):
+        return {'error': self._error}
+
+
+def error_api(codigo=429, mensaje='Quota exceeded (simulado)', estado='RESOURCE_EXHAUSTED'):
+    return gspread.exceptions.APIError(_RespuestaError(codigo, mensaje, estado))
+
+
+def formatear(valor):
+    """Texto de una celda tal como lo devuelve la API"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _valor_celda(celda):
+    """Valor de un CellData de batch_update"""
+    valor = celda.get('userEnteredValue', {})
+    for clave in ('stringValue', 'numberValue', 'boolValue', 'formulaValue'):
+        if clave in valor:
+            return formatear(valor[clave])
+    return ''
+
+
+def _recortar(filas):
+    """Quitar celdas y filas vacías del final, como hace la API"""
+    filas = [list(fila) for fila in filas]
+    for fila in filas:
+        while fila and fila[-1] == '':
+            fila.pop()
+    while filas and not filas[-1]:
+        filas.pop()
+    return filas
+
+
+def _separar_rango(rango):
+    """"'hoja'!A1:C" -> ('hoja', 'A1:C'); sin '!' el rango es la hoja entera"""
+    if '!' in rango:
+        hoja, a1 = rango.rsplit('!', 1)
+    else:
+        hoja, a1 = rango, None
+    if hoja.startswith("'") and hoja.endswith("'"):
+        hoja = hoja[1:-1].replace("''", "'")
+    return hoja, a1
+
+
+class HTTPFalso:
+    """Sustituto de gspread.http_client.HTTPClient: cada request es una petición a la API"""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def request(self, method, endpoint, **kwargs):
+        # endpoint es el nombre del método imitado, para contar por método
+        return self.cliente._atender(method, endpoint)
+
+
+class ClienteFalso:
+    """Sustituto de gspread.Client con latencia, contador de llamadas y cuota"""
+
+    def __init__(self, latencia=0.0, cuota_lecturas=None, cuota_escrituras=None):
+        self.latencia = latencia
+        # Peticiones por minuto antes de devolver 429 (None = sin límite)
+        self.cuotas = {'lectura': cuota_lecturas, 'escritura': cuota_escrituras}
+        self.llamadas = Counter()
+        self.bytes_leidos = 0
+        self._ventanas = {'lectura': deque(), 'escritura': deque()}
+        self._fallos = deque()
+        self.http_client = HTTPFalso(self)
+        self._hojas_de_calculo = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def total_llamadas(self):
+        return sum(self.llamadas.values())
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.llamadas.clear()
+            self.bytes_leidos = 0
+            for ventana in self._ventanas.values():
+                ventana.clear()
+
+    def fallar(self, veces=1, codigo=429):
+        """Hacer que las próximas `veces` peticiones fallen con APIError(codigo)"""
+        with self._lock:
+            self._fallos.extend([codigo] * veces)
+
+    def _llamada(self, metodo, tipo):
+        # Como en gspread, todo pasa por http_client.request (ahí se enganchan
+        # el contador de la instrumentación y el limitador de cuota)
+        self.http_client.request('GET' if tipo == 'lectura' else 'POST', metodo)
+
+    def _atender(self, method, metodo):
+        tipo = 'lectura' if method == 'GET' else 'escritura'
+        with self._lock:
+            self.llamadas[metodo] += 1
+            if self._fallos:
+                raise error_api(self._fallos.popleft())
+            cuota = self.cuotas[tipo]
+            if cuota is not None:
+                ahora = time.monotonic()
+                ventana = self._ventanas[tipo]
+                while ventana and ahora - ventana[0] >= 60:
+                    ventana.popleft()
+                if len(ventana) >= cuota:
+                    raise error_api()
+                ventana.append(ahora)
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _leido(self, datos):
+        with self._lock:
+            self.bytes_leidos += len(json.dumps(datos))
+        return datos
+
+    def open(self, title):
+        self._llamada('open', 'lectura')
+        try:
+            return self._hojas_de_calculo[title]
+        except KeyError:
+            raise gspread.SpreadsheetNotFound(title) from None
+
+    def create(self, title):
+        self._llamada('create', 'escritura')
+        hoja = SpreadsheetFalso(self, title, f'falso-{next(self._ids)}')
+        self._hojas_de_calculo[title] = hoja
+        return hoja
+
+    def del_spreadsheet(self, file_id):
+        self._llamada('del_spreadsheet', 'escritura')
+        for title, hoja in list(self._hojas_de_calculo.items()):
+            if hoja.id == file_id:
+                del self._hojas_de_calculo[title]
+
+
+class SpreadsheetFalso:
+    """Sustituto de gspread.Spreadsheet"""
+
+    def __init__(self, cliente, title, id):
+        self.client = cliente
+        self.title = title
+        self.id = id
+        self._hojas = []
+        self._modificado = datetime.now(timezone.utc)
+
+    def _tocar(self):
+        # modifiedTime de Drive: cambia con cada escritura (siempre hacia delante)
+        self._modificado = max(datetime.now(timezone.utc), self._modificado + timedelta(milliseconds=1))
+
+    def _buscar(self, title):
+        for hoja in self._hojas:
+            if hoja.title == title:
+                return hoja
+        raise gspread.WorksheetNotFound(title)
+
+    def _hoja_por_id(self, sheet_id):
+        for hoja in self._hojas:
+            if hoja.id == sheet_id:
+                return hoja
+        raise error_api(400, f'No grid with id: {sheet_id}', 'INVALID_ARGUMENT')
+
+    def _nueva_hoja(self, title, rows=1000, cols=26, sheet_id=None):
+        if any(hoja.title == title for hoja in self._hojas):
+            raise error_api(400, f'A sheet with the name "{title}" already exists.', 'INVALID_ARGUMENT')
+        if sheet_id is None:
+            sheet_id = max((hoja.id for hoja in self._hojas), default=-1) + 1
+        elif any(hoja.id == sheet_id for hoja in self._hojas):
+            raise error_api(400, f'A sheet with the id {sheet_id} already exists.', 'INVALID_ARGUMENT')
+        hoja = WorksheetFalso(self, sheet_id, title, rows, cols)
+        self._hojas.append(hoja)
+        self._tocar()
+        return hoja
+
+    def worksheet(self, title):
+        self.client._llamada('worksheet', 'lectura')
+        return self._buscar(title)
+
+    def worksheets(self):
+        self.client._llamada('worksheets', 'lectura')
+        return list(self._hojas)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.client._llamada('add_worksheet', 'escritura')
+        return self._nueva_hoja(title, rows, cols)
+
+    def del_worksheet(self, worksheet):
+        self.client._llamada('del_worksheet', 'escritura')
+        self._hojas.remove(worksheet)
+        self._tocar()
+
+    def get_lastUpdateTime(self):
+        """modifiedTime del archivo en Drive"""
+        self.client._llamada('get_lastUpdateTime', 'lectura')
+        return self._modificado.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+    def values_batch_get(self, ranges, params=None):
+        self.client._llamada('values_batch_get', 'lectura')
+        rangos = []
+        for rango in ranges:
+            hoja, a1 = _separar_rango(rango)
+            rangos.append({'range': rango, 'majorDimension': 'ROWS',
+                           'values': self._buscar(hoja)._leer(a1)})
+        return self.client._leido({'spreadsheetId': self.id, 'valueRanges': rangos})
+
+    def batch_update(self, body):
+        """updateCells, appendCells, deleteDimension (filas), findReplace (en un rango) y addSheet, todas o ninguna"""
+        self.client._llamada('batch_update', 'escritura')
+        # Se valida todo antes de escribir para que un error no deje cambios a medias
+        nuevas = set()
+        for request in body.get('requests', []):
+            (tipo, datos), = request.items()
+            if tipo == 'addSheet':
+                nuevas.add(datos.get('properties', {}).get('sheetId'))
+                continue
+            if tipo not in ('updateCells', 'appendCells', 'deleteDimension', 'findReplace'):
+                raise error_api(400, f'Request no soportada: {tipo}', 'INVALID_ARGUMENT')
+            sheet_id = datos['sheetId'] if tipo == 'appendCells' else datos['range']['sheetId']
+            if sheet_id not in nuevas:
+                self._hoja_por_id(sheet_id)
+        respuestas = []
+        for request in body.get('requests', []):
+            (tipo, datos), = request.items()
+            if tipo == 'addSheet':
+                propiedades = datos.get('properties', {})
+                grid = propiedades.get('gridProperties', {})
+                hoja = self._nueva_hoja(propiedades['title'], grid.get('rowCount', 1000),
+                                        grid.get('columnCount', 26), propiedades.get('sheetId'))
+                respuestas.append({'addSheet': {'properties': {'sheetId': hoja.id, 'title': hoja.title}}})
+                continue
+            if tipo == 'updateCells':
+                rango = datos['range']
+                filas = [[_valor_celda(c) for c in fila.get('values', [])] for fila in datos['rows']]
+                self._hoja_por_id(rango['sheetId'])._escribir(
+                    rango.get('startRowIndex', 0), rango.get('startColumnIndex', 0), filas)
+            elif tipo == 'appendCells':
+                filas = [[_valor_celda(c) for c in fila.get('values', [])] for fila in datos['rows']]
+                self._hoja_por_id(datos['sheetId'])._anexar(filas)
+            elif tipo == 'findReplace':
+                cambiadas = self._hoja_por_id(datos['range']['sheetId'])._reemplazar(datos)
+                # Como la API, los contadores a cero no vienen en la respuesta
+                respuestas.append({'findReplace': {'occurrencesChanged': cambiadas} if cambiadas else {}})
+                continue
+            else:
+                rango = datos['range']
+                self._hoja_por_id(rango['sheetId'])._borrar_filas(rango['startIndex'], rango['endIndex'])
+            respuestas.append({})
+        return {'spreadsheetId': self.id, 'replies': respuestas}
+
+
+class WorksheetFalso:
+    """Sustituto de gspread.Worksheet"""
+
+    def __init__(self, spreadsheet, id, title, rows, cols):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.id = id
+        self.title = title
+        self._filas_declaradas = rows
+        self.col_count = cols
+        self._valores = []
+
+    @property
+    def row_count(self):
+        return max(self._filas_declaradas, len(self._valores))
+
+    # ----- operaciones internas (sin contar llamadas) -----
+
+    def _leer(self, a1=None):
+        if not a1:
+            return _recortar(self._valores)
+        grid = a1_range_to_grid_range(a1)
+        r0, r1 = grid.get('startRowIndex', 0), grid.get('endRowIndex')
+        c0, c1 = grid.get('startColumnIndex', 0), grid.get('endColumnIndex')
+        return _recortar(fila[c0:c1] for fila in self._valores[r0:r1])
+
+    def _escribir(self, fila0, col0, filas):
+        self.spreadsheet._tocar()
+        for i, valores in enumerate(filas):
+            while len(self._valores) <= fila0 + i:
+                self._valores.append([])
+            fila = self._valores[fila0 + i]
+            if len(fila) < col0 + len(valores):
+                fila.extend([''] * (col0 + len(valores) - len(fila)))
+            fila[col0:col0 + len(valores)] = [formatear(v) for v in valores]
+
+    def _anexar(self, filas):
+        # Como la API: después de la última fila con datos
+        self._valores = _recortar(self._valores)
+        self._escribir(len(self._valores), 0, filas)
+
+    def _reemplazar(self, datos):
+        """findReplace sin regex en datos['range']; devuelve las celdas cambiadas"""
+        rango = datos['range']
+        buscar, nuevo = datos['find'], datos.get('replacement', '')
+        if not datos.get('matchCase'):
+            buscar = buscar.casefold()
+        cambiadas = 0
+        for f in range(rango.get('startRowIndex', 0), min(rango.get('endRowIndex', len(self._valores)), len(self._valores))):
+            fila = self._valores[f]
+            for c in range(rango.get('startColumnIndex', 0), min(rango.get('endColumnIndex', len(fila)), len(fila))):
+                valor = fila[c] if datos.get('matchCase') else fila[c].casefold()
+                if datos.get('matchEntireCell') and valor == buscar:
+                    fila[c] = formatear(nuevo)
+                elif not datos.get('matchEntireCell') and buscar and buscar in valor:
+                    fila[c] = fila[c].replace(datos['find'], nuevo)
+                else:
+                    continue
+                cambiadas += 1
+        if cambiadas:
+            self.spreadsheet._tocar()
+        return cambiadas
+
+    def _borrar_filas(self, inicio, fin):
+        """Borrar filas [inicio, fin) con índices desde 0"""
+        del self._valores[inicio:fin]
+        self.spreadsheet._tocar()
+        self._filas_declaradas = max(self._filas_declaradas - (fin - inicio), 0)
+
+    # ----- API de gspread -----
+
+    def get_all_values(self):
+        self.client._llamada('get_all_values', 'lectura')
+        return self.client._leido(self._leer())
+
+    def get_all_records(self, head=1, default_blank=''):
+        self.client._llamada('get_all_records', 'lectura')
+        valores = self.client._leido(self._leer())
+        if len(valores) < head:
+            return []
+        columnas = valores[head - 1]
+        filas = fill_gaps(valores[head:], cols=len(columnas)) if len(valores) > head else []
+        return [dict(zip(columnas, numericise_all(fila, default_blank=default_blank))) for fila in filas]
+
+    def col_values(self, col):
+        self.client._llamada('col_values', 'lectura')
+        valores = [fila[col - 1] if len(fila) >= col else '' for fila in self._valores]
+        while valores and valores[-1] == '':
+            valores.pop()
+        return self.client._leido(valores)
+
+    def row_values(self, row):
+        self.client._llamada('row_values', 'lectura')
+        fila = _recortar([self._valores[row - 1]]) if row <= len(self._valores) else []
+        return self.client._leido(fila[0] if fila else [])
+
+    def batch_get(self, ranges):
+        self.client._llamada('batch_get', 'lectura')
+        return self.client._leido([self._leer(rango) for rango in ranges])
+
+    def append_row(self, values, value_input_option='RAW', **kwargs):
+        self.client._llamada('append_row', 'escritura')
+        self._anexar([values])
+
+    def append_rows(self, values, value_input_option='RAW', **kwargs):
+        self.client._llamada('append_rows', 'escritura')
+        self._anexar(values)
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self.client._llamada('update', 'escritura')
+        grid = a1_range_to_grid_range(range_name or 'A1')
+        self._escribir(grid.get('startRowIndex', 0), grid.get('startColumnIndex', 0), values)
+
+    def delete_rows(self, start_index, end_index=None):
+        self.client._llamada('delete_rows', 'escritura')
+        self._borrar_filas(start_index - 1, end_index or start_index)
+
+    def clear(self):
+        self.client._llamada('clear', 'escritura')
+        self._valores = []
+        self.spreadsheet._tocar()
+
+
+_cliente_compartido = None
+_lock_compartido = threading.Lock()
+
+
+def cliente_compartido():
+    """Cliente falso del proceso, con BeautyBox_Database ya creada (backend 'sheets_falso')"""
+    global _cliente_compartido
+    with _lock_compartido:
+        if _cliente_compartido is None:
+            _cliente_compartido = ClienteFalso()
+            _cliente_compartido.create(TITULO_POR_DEFECTO)
+            _cliente_compartido.reiniciar_contadores()
+        return _cliente_compartido
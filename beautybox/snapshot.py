@@ -0,0 +1,777 @@
+"""
+Snapshot de BeautyBox_Database en memoria.
+
+Cuando a un lector le falta una tabla (o la suya ha caducado), el snapshot
+recarga de golpe todas las tablas que estén vacías o caducadas con una sola
+llamada al repositorio (values_batch_get en Google Sheets). Así el primer
+render del dashboard es un único viaje de red en lugar de uno por get_*.
+
+El snapshot se comparte entre sesiones. Las escrituras de la propia app se
+aplican fila a fila sobre las tablas cargadas (Cambio), sin volver a
+descargarlas; lo que cambie fuera de la app llega al caducar la tabla (o
+antes, con versiones compartidas: ver más abajo).
+
+Las tablas se guardan con los dtypes compactos de esquema.TIPOS, que se
+mantienen al aplicar cada Cambio.
+
+precargar() lanza la carga en segundo plano al principio del rerun; la
+primera lectura que la necesite espera a que termine en lugar de pedir las
+tablas otra vez.
+
+Antes de volver a leer una tabla caducada se comprueba si ha cambiado con
+una petición pequeña: la revisión del archivo (modifiedTime en Drive) y, si
+cambió, la columna id de las tablas caducadas. Si los ids son los mismos la
+copia sigue valiendo; si solo hay ids nuevos al final se leen solo esas
+filas. Una fila editada a mano en la hoja sin cambiar su id no se ve en los
+ids, así que cada tabla se relee entera al menos cada RECARGA_COMPLETA.
+
+Cada tabla es inmutable: una carga o una escritura publica un DataFrame
+nuevo (y sube su versión) en lugar de modificar el anterior, así que todas
+las sesiones leen el mismo objeto sin copiarlo. Con Copy-on-Write (siempre
+activo desde pandas 3, que pide requirements.txt) tabla() reparte copias
+superficiales que comparten los arrays; quien modifique la suya solo copia
+lo que toque.
+
+proyectar() devuelve solo algunas columnas (y filas) de una tabla: de la
+copia completa si está al día y, si no, leyendo solo esos rangos. Las
+proyecciones leídas se guardan aparte con la misma vigencia que su tabla y
+se descartan con cualquier escritura en ella.
+
+tabla(..., revalidar=True) es stale-while-revalidate: si la copia caducó
+hace menos de OBSOLETAS[tabla] segundos se devuelve al momento y la recarga
+se lanza en segundo plano. Es lo que usa el contador de pendientes, que no
+debe hacer esperar a nadie.
+
+Si el repositorio guarda versiones compartidas por tabla (columna version
+de '_meta' en Sheets, tabla _versiones en SQLite), que cualquier proceso
+de la app sube al escribir, el snapshot las lee en segundo plano como
+mucho cada COMPROBAR_VERSIONES segundos y relee entera cada tabla cuya
+versión no sea la de su copia. Con eso las vigencias suben a VIGENCIA_CON_VERSIONES: el
+plazo solo queda para lo que se edita a mano en la hoja.
+
+Con una CacheDisco (disco.py) cada tabla leída de la fuente se guarda
+también en disco, en segundo plano. calentar() las sirve al arrancar el
+proceso y lanza en segundo plano el sondeo de siempre contra la fuente con
+la revisión guardada: si nada cambió no se vuelve a descargar nada.
+
+Con una CacheCompartida (varios procesos en la misma máquina) las copias y
+las versiones compartidas se reparten entre procesos: antes de ir a la
+fuente se usa la copia que haya guardado otro proceso si sigue valiendo y,
+si no, se toma el turno de la tabla; quien no lo consigue espera a que el
+que lo tiene guarde su lectura. Así cada tabla se descarga una sola vez
+para todos los procesos.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from beautybox import instrumentacion
+from beautybox.disco import Copia
+from beautybox.esquema import ESQUEMAS, a_nativo, tipar
+from beautybox.repositorio import proyectar
+
+# Segundos que se considera fresca cada tabla (los mismos TTL que tenían los get_*)
+VIGENCIAS = {
+    'categorias': 300,
+    'servicios': 300,
+    'gastos_fijos': 300,
+    'clientes': 60,
+    'citas': 60,
+    'gastos_variables': 60,
+    'solicitudes': 30,
+}
+
+# Tablas que no se recargan junto con las demás caducadas: solo se leen enteras
+# cuando se piden (el contador de pendientes se conforma con la columna estado)
+FUERA_DEL_BARRIDO = {'solicitudes'}
+
+# Segundos como mucho entre lecturas completas de una tabla que solo se sondea por ids
+RECARGA_COMPLETA = 600
+
+# Con versiones compartidas: segundos entre comprobaciones y vigencia de las tablas
+COMPROBAR_VERSIONES = 10
+VIGENCIA_CON_VERSIONES = 3600
+
+# Con CacheCompartida: segundos que dura el turno para leer una tabla de la
+# fuente, segundos que se espera al proceso que lo tiene y cada cuánto se mira
+TURNO = 30
+ESPERA_TURNO = 15
+SONDEO_TURNO = 0.2
+
+# Segundos más allá de la vigencia que tabla(..., revalidar=True) sirve la copia caducada
+OBSOLETAS = {
+    'solicitudes': 600,
+}
+
+
+def _con_categorias(df, col, valores):
+    """Añadir a una columna category los valores que aún no tiene como categoría"""
+    nuevas = pd.Index(valores).dropna().difference(df[col].cat.categories)
+    if len(nuevas):
+        df[col] = df[col].cat.add_categories(nuevas)
+
+
+def aplicar_cambio(df, cambio):
+    """Nueva versión de una tabla con un Cambio aplicado (df no se modifica)"""
+    if cambio.tipo == 'eliminar':
+        return df[df['id'] != cambio.id]
+    columnas = df.columns if cambio.tipo == 'insertar' else [c for c in cambio.valores if c in df.columns]
+    fila = tipar(cambio.tabla, pd.DataFrame([{col: a_nativo(cambio.valores.get(col, '')) for col in columnas}]))
+    if cambio.tipo == 'insertar' and len(df) == 0:
+        return fila
+    df = df.copy()
+    categorias = [col for col in columnas if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    for col in categorias:
+        _con_categorias(df, col, fila[col])
+    if cambio.tipo == 'insertar':
+        for col in categorias:
+            fila[col] = fila[col].cat.set_categories(df[col].cat.categories)
+        fila.index = [df.index.max() + 1]
+        return pd.concat([df, fila])
+    mascara = df['id'] == cambio.id
+    for col in columnas:
+        # where() cambia el dtype de la columna si hace falta en lugar de fallar
+        df[col] = df[col].where(~mascara, fila[col].iloc[0])
+    return df
+
+
+def anexar_filas(df, nuevas):
+    """df con las filas ya tipadas de `nuevas` al final, uniendo las categorías"""
+    if len(df) == 0:
+        return nuevas
+    nuevas = nuevas.copy()
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and col in nuevas.columns:
+            categorias = df[col].cat.categories.union(pd.Index(nuevas[col].dropna().unique()))
+            df[col] = df[col].cat.set_categories(categorias)
+            nuevas[col] = pd.Categorical(nuevas[col], categories=categorias)
+    nuevas.index = pd.RangeIndex(df.index.max() + 1, df.index.max() + 1 + len(nuevas))
+    return pd.concat([df, nuevas])
+
+
+def mismos_ids(df, ids):
+    """Cómo es la columna id sondeada respecto a la de df: 'igual', 'cola' (ids nuevos al final) o None"""
+    actuales = df['id'].to_numpy(dtype=float, na_value=np.nan)
+    sondeados = pd.to_numeric(pd.Series(ids, dtype=object), errors='coerce').to_numpy(dtype=float)
+    if len(sondeados) < len(actuales) or not np.array_equal(sondeados[:len(actuales)], actuales, equal_nan=True):
+        return None
+    return 'igual' if len(sondeados) == len(actuales) else 'cola'
+
+
+class SnapshotTablas:
+    """Tablas completas cargadas en bloque desde un repositorio"""
+
+    def __init__(self, repo, vigencias=None, obsoletas=None, disco=None):
+        self.repo = repo
+        self.disco = disco
+        self.vigencias = dict(VIGENCIAS, **(vigencias or {}))
+        self.obsoletas = dict(OBSOLETAS, **(obsoletas or {}))
+        self._tablas = {}  # tabla -> (DataFrame, cargado_en)
+        self._cargas = {}  # tabla -> número de veces que su contenido se ha leído de la fuente
+        self._versiones = {}  # tabla -> versión publicada (sube con cada DataFrame nuevo)
+        self._escrituras = {}  # tabla -> número de cambios aplicados (para descartar precargas viejas)
+        self._revisiones = {}  # tabla -> revisión del almacenamiento de la que viene la copia
+        self._completas = {}  # tabla -> momento de la última lectura completa
+        self._proyecciones = {}  # (tabla, columnas, filas) -> (DataFrame, cargado_en)
+        self._refrescando = set()  # proyecciones con una recarga en segundo plano pendiente
+        self._precarga = None  # (tablas, future) de la precarga en curso
+        self._en_curso = {}  # tabla -> future de la carga síncrona que la está leyendo
+        self._hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precarga')
+        # Las copias a disco van en su propio hilo para no retrasar las precargas
+        self._hilo_disco = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disco')
+        self._por_volcar = set()  # tablas pendientes de guardar en disco
+        self._por_anunciar = {}  # tabla -> versión escrita por este proceso, para la CacheCompartida
+        self._sellos = {}  # tabla -> versión compartida de la que viene la copia
+        self._remotas = None  # últimas versiones compartidas leídas (None: el backend no tiene)
+        self._comprobado_en = None
+        self._comprobacion = None  # future de la lectura de versiones en curso
+        self._cambiadas = set()  # tablas que otro proceso ha escrito desde que se cargaron
+        self._lock = threading.RLock()
+
+    def _vigencia(self, tabla):
+        vigencia = self.vigencias.get(tabla, 60)
+        return max(vigencia, VIGENCIA_CON_VERSIONES) if self._remotas is not None else vigencia
+
+    def _fresca(self, tabla, ahora):
+        entrada = self._tablas.get(tabla)
+        return (entrada is not None and tabla not in self._cambiadas
+                and ahora - entrada[1] <= self._vigencia(tabla))
+
+    def comprobar_versiones(self):
+        """Programar la lectura de las versiones compartidas (como mucho cada COMPROBAR_VERSIONES).
+
+        Se leen en el hilo de las precargas, por delante de la precarga que
+        se lance a continuación: las lecturas comparan con las últimas
+        versiones conocidas y nunca esperan a la fuente por ellas.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            if self._comprobado_en is not None and ahora - self._comprobado_en < COMPROBAR_VERSIONES:
+                return None
+            self._comprobado_en = ahora
+            self._comprobacion = self._hilo.submit(self._comprobar_versiones)
+            return self._comprobacion
+
+    def _esperar_comprobacion(self):
+        """Antes de leer de la fuente: que la lectura de versiones en curso termine, para etiquetar bien lo leído"""
+        comprobacion = self._comprobacion
+        if comprobacion is not None:
+            comprobacion.result()
+
+    def _comprobar_versiones(self):
+        """Leer las versiones compartidas y marcar lo que cambió fuera"""
+        try:
+            remotas = self._versiones_remotas()
+        except Exception:
+            # Sin versiones no se puede confiar en las vigencias largas
+            with self._lock:
+                self._remotas = None
+            return
+        with self._lock:
+            anteriores, self._remotas = self._remotas or {}, remotas
+            if remotas is None:
+                return
+            # Una tabla cargada sin versión (no se pudieron leer) tampoco se sabe al día
+            self._cambiadas.update(t for t, sello in remotas.items()
+                                   if t in self._tablas and self._sellos.get(t) != sello)
+            # Las proyecciones no llevan versión: se descartan las de tablas que otro proceso ha escrito
+            self._descartar_proyecciones({t for t, sello in remotas.items() if t in anteriores
+                                          and anteriores[t] != sello and self.repo.versiones_escritas.get(t) != sello})
+
+    def _versiones_remotas(self):
+        """Versiones de la fuente; con CacheCompartida, un solo proceso las lee por todos"""
+        compartida = self.disco is not None and self.disco.compartida
+        remotas = self.disco.versiones(COMPROBAR_VERSIONES) if compartida else None
+        if remotas is not None:
+            return remotas
+        if compartida and not self.disco.tomar_turno('versiones', TURNO):
+            # Otro proceso las está leyendo: se usan las últimas que haya guardado
+            return self.disco.versiones(float('inf')) or self._remotas
+        try:
+            # Puede que otro proceso las haya guardado mientras se tomaba el turno
+            remotas = self.disco.versiones(COMPROBAR_VERSIONES) if compartida else None
+            if remotas is not None:
+                return remotas
+            with instrumentacion.medir('versiones', 'almacenamiento'):
+                remotas = self.repo.versiones()
+            if compartida and remotas is not None:
+                self.disco.guardar_versiones(remotas)
+            return remotas
+        finally:
+            if compartida:
+                self.disco.soltar_turno('versiones')
+
+    def fresca(self, tabla):
+        """Si la copia completa de la tabla está cargada y al día"""
+        with self._lock:
+            return self._fresca(tabla, time.monotonic())
+
+    def precargar(self, tablas):
+        """Empezar a cargar en segundo plano las tablas que falten o hayan caducado"""
+        self.comprobar_versiones()
+        with self._lock:
+            ahora = time.monotonic()
+            if self._precarga is not None and not self._precarga[1].done():
+                return self._precarga[1]
+            pendientes = [t for t in ESQUEMAS
+                          if not self._fresca(t, ahora) and (t in tablas or t not in FUERA_DEL_BARRIDO)]
+            if not any(t in pendientes for t in tablas):
+                return None
+            escrituras = {t: self._escrituras.get(t, 0) for t in pendientes}
+            futuro = self._hilo.submit(self._cargar_en_segundo_plano, pendientes, escrituras)
+            self._precarga = (set(pendientes), futuro)
+            return futuro
+
+    def calentar(self):
+        """Servir las tablas guardadas en disco y conciliarlas con la fuente en segundo plano"""
+        if self.disco is None:
+            return None
+        with self._lock:
+            ahora, reloj = time.monotonic(), time.time()
+            calentadas = []
+            for tabla in ESQUEMAS:
+                copia = None if tabla in self._tablas else self.disco.cargar(tabla)
+                if copia is None:
+                    continue
+                # Las copias compartidas las mantienen al día los otros procesos: se
+                # sirven según cuándo se comprobaron y no hace falta conciliarlas
+                cargada_en = ahora - max(reloj - copia.cargada_en, 0) if self.disco.compartida else ahora
+                self._guardar_copia(tabla, copia, cargada_en, ahora, reloj)
+                calentadas.append(tabla)
+            if not calentadas or self.disco.compartida:
+                return None
+            # No se registra como precarga: las lecturas no la esperan, sirven la copia del disco
+            escrituras = {t: self._escrituras.get(t, 0) for t in calentadas}
+            return self._hilo.submit(self._cargar_en_segundo_plano, calentadas, escrituras)
+
+    def _volcar(self, tablas, anunciar=None):
+        """Programar la copia a disco de las tablas (se agrupan las que ya estaban pendientes)"""
+        if self.disco is None or not (tablas or anunciar):
+            return
+        pendientes = bool(self._por_volcar or self._por_anunciar)
+        self._por_volcar.update(tablas)
+        self._por_anunciar.update(anunciar or {})
+        if not pendientes:
+            self._hilo_disco.submit(self._volcar_pendientes)
+
+    def _volcar_pendientes(self):
+        with self._lock:
+            ahora, reloj = time.monotonic(), time.time()
+            copias = {}
+            for tabla in self._por_volcar:
+                entrada = self._tablas.get(tabla)
+                if entrada is not None:
+                    # Se guarda cuándo fue la última lectura completa, no cuándo se escribe el fichero
+                    leida_en = reloj - (ahora - self._completas.get(tabla, ahora))
+                    copias[tabla] = Copia(entrada[0], self._revisiones.get(tabla), self._sellos.get(tabla),
+                                          leida_en, reloj - (ahora - entrada[1]))
+            self._por_volcar.clear()
+            anunciar, self._por_anunciar = self._por_anunciar, {}
+        # Las tablas en memoria nunca se modifican en sitio: se escriben fuera del lock
+        for tabla, copia in copias.items():
+            self.disco.guardar(tabla, *copia)
+        # Después de las copias: quien vea la versión nueva ya encuentra la tabla que le corresponde
+        if anunciar:
+            self.disco.anunciar_versiones(anunciar)
+
+    def _cargar_en_segundo_plano(self, tablas, escrituras):
+        revision, lecturas, sellos = self._leer(tablas)
+        with self._lock:
+            self._guardar_lecturas(revision, lecturas, sellos, escrituras)
+
+    def _esperar_precarga(self, tablas):
+        precarga = self._precarga
+        if precarga is None or not precarga[0].intersection(tablas):
+            return
+        try:
+            precarga[1].result()
+        except Exception:
+            # La carga síncrona vuelve a intentarlo y es la que muestra el error
+            pass
+
+    def asegurar(self, tablas, recargar=False):
+        """Cargar las tablas pedidas que falten o hayan caducado, junto con el resto de caducadas.
+
+        La lectura se hace fuera del lock: quien pida una tabla que otro hilo
+        ya está cargando espera a esa carga, y lo que ya está en memoria se
+        sirve sin esperar a ninguna.
+        """
+        self.comprobar_versiones()
+        if not recargar:
+            self._esperar_precarga(tablas)
+        with self._lock:
+            ahora = time.monotonic()
+            pedidas = [t for t in tablas if recargar or not self._fresca(t, ahora)]
+        if pedidas:
+            # Va a esperar a la fuente de todos modos: antes, a las versiones que se estén leyendo
+            self._esperar_comprobacion()
+        with self._lock:
+            ahora = time.monotonic()
+            pedidas = [t for t in tablas if recargar or not self._fresca(t, ahora)]
+            for tabla in tablas:
+                instrumentacion.cache(tabla not in pedidas)
+            if not pedidas:
+                return
+            ajenas = set() if recargar else {self._en_curso[t] for t in pedidas if t in self._en_curso}
+            propias = [t for t in pedidas if recargar or t not in self._en_curso]
+            carga = None
+            if propias:
+                caducadas = [t for t in ESQUEMAS if t not in pedidas and t not in FUERA_DEL_BARRIDO
+                             and not self._fresca(t, ahora) and t not in self._en_curso]
+                carga = self._empezar_carga(propias + caducadas)
+        if carga is not None:
+            self._completar_carga(carga, forzadas=propias if recargar else ())
+        for otra in ajenas:
+            try:
+                otra.result()
+            except Exception:
+                # La carga del otro hilo falló: se intenta aquí, que es la que muestra el error
+                return self.asegurar(tablas)
+
+    def _servible(self, nombre):
+        """La copia en memoria si aún se puede servir caducada (lanzando su recarga), o None"""
+        self.comprobar_versiones()
+        with self._lock:
+            entrada = self._tablas.get(nombre)
+            # Lo que otro proceso ha cambiado no se sirve: se espera a la recarga
+            if entrada is None or nombre in self._cambiadas:
+                return None
+            edad = time.monotonic() - entrada[1]
+            vigencia = self._vigencia(nombre)
+            if edad <= vigencia:
+                return entrada[0]
+            if edad > vigencia + self.obsoletas.get(nombre, 0):
+                return None
+            self.precargar([nombre])
+            return entrada[0]
+
+    def tabla(self, nombre, recargar=False, copiar=True, revalidar=False):
+        """Una tabla completa. Sin copiar se devuelve la versión publicada, que no debe modificarse"""
+        df = self._servible(nombre) if revalidar and not recargar else None
+        if df is not None:
+            return df.copy(deep=False) if copiar else df
+        self.asegurar([nombre], recargar=recargar)
+        with self._lock:
+            entrada = self._tablas.get(nombre)
+        while entrada is None:
+            # Invalidada o escrita mientras se cargaba: se lee otra vez y se guarda lo leído
+            with self._lock:
+                carga = self._empezar_carga([nombre])
+            self._completar_carga(carga, descartar_escritas=False)
+            with self._lock:
+                entrada = self._tablas.get(nombre)
+        df = entrada[0]
+        return df.copy(deep=False) if copiar else df
+
+    def version(self, tabla):
+        """Versión publicada de una tabla (cambia con cada DataFrame nuevo)"""
+        return self._versiones.get(tabla, 0)
+
+    def versiones(self, tablas):
+        """Versiones de varias tablas, cargando antes las que falten o hayan caducado"""
+        self.asegurar(tablas)
+        with self._lock:
+            return tuple(self.version(t) for t in tablas)
+
+    def proyectar(self, pedidos, revalidar=False):
+        """Columnas (y filas) sueltas de varias tablas: {tabla: (columnas, filas)} -> {tabla: DataFrame}.
+
+        Lo que no está en memoria se lee en una sola llamada a repo.leer_columnas.
+        Con revalidar, una proyección caducada dentro de OBSOLETAS se devuelve
+        al momento y se vuelve a leer en segundo plano.
+        """
+        self.comprobar_versiones()
+        # Lo leído por columnas no incluiría las escrituras pendientes de enviar
+        con_pendientes = [t for t in pedidos if self.repo.pendientes(t)]
+        if con_pendientes:
+            self.asegurar(con_pendientes)
+        resultado, faltan = {}, {}
+        with self._lock:
+            ahora = time.monotonic()
+            for tabla, (columnas, filas) in pedidos.items():
+                completa = self._servible(tabla) if revalidar else (
+                    self._tablas[tabla][0] if self._fresca(tabla, ahora) else None)
+                if completa is not None:
+                    resultado[tabla] = proyectar(completa, columnas, filas)
+                    continue
+                clave = (tabla, tuple(columnas), None if filas is None else tuple(filas))
+                entrada = self._proyecciones.get(clave)
+                edad = ahora - entrada[1] if entrada else None
+                vigencia = self._vigencia(tabla)
+                if entrada and edad <= vigencia:
+                    resultado[tabla] = entrada[0]
+                elif entrada and revalidar and edad <= vigencia + self.obsoletas.get(tabla, 0):
+                    resultado[tabla] = entrada[0]
+                    if clave not in self._refrescando:
+                        self._refrescando.add(clave)
+                        self._hilo.submit(self._leer_proyecciones, {clave: (columnas, filas)})
+                else:
+                    faltan[clave] = (columnas, filas)
+        if faltan:
+            self._esperar_comprobacion()
+            with instrumentacion.medir(f"leer_columnas({', '.join(c[0] for c in faltan)})", 'almacenamiento'):
+                leidas = self._leer_proyecciones(faltan)
+            resultado.update(leidas)
+        return resultado
+
+    def _leer_proyecciones(self, pedidos):
+        """Leer y guardar proyecciones {clave: (columnas, filas)}; devuelve {tabla: DataFrame}"""
+        try:
+            escrituras = {clave[0]: self._escrituras.get(clave[0], 0) for clave in pedidos}
+            remotas = self._remotas or {}
+            datos = self.repo.leer_columnas({clave[0]: pedido for clave, pedido in pedidos.items()})
+            instrumentacion.filas_leidas(sum(len(df) for df in datos.values()))
+            resultado = {}
+            with self._lock:
+                ahora = time.monotonic()
+                # Las proyecciones por filas cambian de clave cada día: se olvidan las que ya no se sirven
+                for vieja, (_, cargada_en) in list(self._proyecciones.items()):
+                    if ahora - cargada_en > self._vigencia(vieja[0]) + self.obsoletas.get(vieja[0], 0):
+                        del self._proyecciones[vieja]
+                for clave in pedidos:
+                    df = tipar(clave[0], datos[clave[0]])
+                    resultado[clave[0]] = df
+                    # Si se escribió en la tabla (aquí o en otro proceso) durante la lectura no se guarda
+                    if (self._escrituras.get(clave[0], 0) == escrituras[clave[0]]
+                            and (self._remotas or {}).get(clave[0]) == remotas.get(clave[0])):
+                        self._proyecciones[clave] = (df, ahora)
+            return resultado
+        finally:
+            self._refrescando.difference_update(pedidos)
+
+    def _descartar_proyecciones(self, tablas):
+        for clave in [c for c in self._proyecciones if c[0] in tablas]:
+            del self._proyecciones[clave]
+
+    def carga(self, tabla):
+        """Contador de cargas de una tabla (cambia cuando llegan datos nuevos de la fuente)"""
+        return self._cargas.get(tabla, 0)
+
+    def _empezar_carga(self, tablas):
+        """Registrar (con el lock) una carga síncrona de las tablas; se lee con _completar_carga"""
+        futuro = Future()
+        for tabla in tablas:
+            self._en_curso[tabla] = futuro
+        return futuro, tablas, {t: self._escrituras.get(t, 0) for t in tablas}
+
+    def _completar_carga(self, carga, forzadas=(), descartar_escritas=True):
+        """Leer fuera del lock las tablas de la carga y publicarlas"""
+        futuro, tablas, escrituras = carga
+        try:
+            revision, lecturas, sellos = self._leer(tablas, forzadas)
+            with self._lock:
+                # Lo escrito durante la lectura puede no estar en lo leído
+                self._guardar_lecturas(revision, lecturas, sellos, escrituras if descartar_escritas else None)
+            futuro.set_result(None)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                for tabla in tablas:
+                    if self._en_curso.get(tabla) is futuro:
+                        del self._en_curso[tabla]
+
+    def _sondear(self, copias):
+        """Tablas con copia que no han cambiado ('igual') o solo tienen filas nuevas ('cola')"""
+        if not copias:
+            # La revisión solo hace falta para etiquetar la copia en disco
+            return (self.repo.revision() if self.disco is not None else None), {}
+        revision = self.repo.revision()
+        estados = {t: 'igual' for t in copias if revision is not None and revision == self._revisiones.get(t)}
+        ahora = time.monotonic()
+        sondeables = [t for t in copias
+                      if t not in estados and ahora - self._completas.get(t, 0) <= RECARGA_COMPLETA]
+        if sondeables:
+            with instrumentacion.medir(f"sondear({', '.join(sondeables)})", 'almacenamiento'):
+                ids = self.repo.sondear(sondeables)
+            for tabla in sondeables if ids is not None else []:
+                estado = mismos_ids(copias[tabla], ids[tabla])
+                if estado:
+                    estados[tabla] = estado
+        return revision, estados
+
+    def _leer(self, tablas, forzadas=()):
+        """Leer del repositorio solo lo que haya cambiado: {tabla: (tipo, df, filas_base)}.
+
+        Devuelve también la revisión y las versiones compartidas conocidas antes de leer.
+        """
+        with self._lock:
+            sellos = dict(self._remotas or {})
+            # Lo que otro proceso ha escrito puede ser una fila editada: no basta con sondear los ids
+            copias = {t: self._tablas[t][0] for t in tablas
+                      if t in self._tablas and t not in forzadas and t not in self._cambiadas}
+        if self.disco is None or not self.disco.compartida:
+            return (*self._leer_fuente(tablas, copias, sellos), sellos)
+        lecturas, turnos, esperando = self._de_compartida(tablas, sellos)
+        revision, leidas = self._leer_con_turno(turnos, copias, sellos)
+        lecturas.update(leidas)
+        limite = time.monotonic() + ESPERA_TURNO
+        while esperando:
+            # Se espera sin turnos propios: así nadie queda esperando a quien le espera
+            otras, turnos, esperando = self._esperar_turnos(esperando, sellos, limite)
+            lecturas.update(otras)
+            posterior, leidas = self._leer_con_turno(turnos, copias, sellos)
+            lecturas.update(leidas)
+            # Con varias lecturas vale la revisión de la primera: a lo sumo se relee de más
+            revision = revision if revision is not None else posterior
+        return revision, lecturas, sellos
+
+    def _copia_valida(self, tabla, copia, sellos):
+        """Si la copia de otro proceso se puede usar en lugar de leer la fuente"""
+        edad = time.time() - copia.cargada_en
+        # Sin versiones con que compararla solo vale la vigencia normal
+        if copia.sello is None or not sellos:
+            return edad <= self.vigencias.get(tabla, 60)
+        return copia.sello == sellos.get(tabla) and edad <= self._vigencia(tabla)
+
+    def _de_compartida(self, tablas, sellos):
+        """Copias válidas de la CacheCompartida, turnos tomados y tablas cuyo turno tiene otro proceso"""
+        compartidas, turnos, esperando = {}, [], []
+        for tabla in tablas:
+            copia = self.disco.cargar(tabla)
+            if copia is not None and self._copia_valida(tabla, copia, sellos):
+                compartidas[tabla] = ('compartida', copia, 0)
+            elif self.disco.tomar_turno(f'tabla:{tabla}', TURNO):
+                turnos.append(tabla)
+            else:
+                esperando.append(tabla)
+        return compartidas, turnos, esperando
+
+    def _esperar_turnos(self, esperando, sellos, limite):
+        """Esperar a que otros procesos guarden las tablas, hasta conseguir algún turno.
+
+        Devuelve las copias, los turnos a leer y las tablas por las que hay que seguir esperando.
+        """
+        compartidas, turnos = {}, []
+        esperando = list(esperando)
+        while esperando and not turnos:
+            if time.monotonic() >= limite:
+                # El otro proceso no termina a tiempo: las que falten se leen sin turno
+                return compartidas, esperando, []
+            time.sleep(SONDEO_TURNO)
+            for tabla in list(esperando):
+                # El turno queda libre cuando el otro proceso ha guardado su lectura
+                if not self.disco.tomar_turno(f'tabla:{tabla}', TURNO):
+                    continue
+                esperando.remove(tabla)
+                copia = self.disco.cargar(tabla)
+                if copia is not None and self._copia_valida(tabla, copia, sellos):
+                    compartidas[tabla] = ('compartida', copia, 0)
+                    self.disco.soltar_turno(f'tabla:{tabla}')
+                else:
+                    turnos.append(tabla)
+        return compartidas, turnos, esperando
+
+    def _leer_con_turno(self, turnos, copias, sellos):
+        """Leer de la fuente las tablas con turno y dejarlas en la CacheCompartida antes de soltarlo"""
+        if not turnos:
+            return None, {}
+        try:
+            revision, lecturas = self._leer_fuente(turnos, {t: df for t, df in copias.items() if t in turnos}, sellos)
+            reloj = time.time()
+            for tabla in turnos:
+                if lecturas.get(tabla, ('',))[0] == 'completa':
+                    copia = Copia(lecturas[tabla][1], revision, sellos.get(tabla), reloj, reloj)
+                    self.disco.guardar(tabla, *copia)
+                    lecturas[tabla] = ('compartida', copia, 0)
+            return revision, lecturas
+        finally:
+            for tabla in turnos:
+                self.disco.soltar_turno(f'tabla:{tabla}')
+
+    def _leer_fuente(self, tablas, copias, sellos):
+        revision, estados = self._sondear(copias)
+        lecturas = {t: ('igual', None, len(copias[t])) for t, estado in estados.items() if estado == 'igual'}
+        colas = {t: len(copias[t]) for t, estado in estados.items() if estado == 'cola'}
+        if colas:
+            with instrumentacion.medir(f"leer_colas({', '.join(colas)})", 'almacenamiento'):
+                datos = self.repo.leer_colas(colas)
+            lecturas.update({t: ('cola', df, colas[t]) for t, df in datos.items()})
+        completas = [t for t in tablas if t not in lecturas]
+        if completas:
+            with instrumentacion.medir(f"leer_varias({', '.join(completas)})", 'almacenamiento'):
+                datos = self.repo.leer_varias(completas)
+            lecturas.update({t: ('completa', df, 0) for t, df in datos.items()})
+        instrumentacion.filas_leidas(sum(len(df) for _, df, _ in lecturas.values() if df is not None))
+        # Se tipan aquí, fuera del lock del snapshot
+        return revision, {t: (tipo, tipar(t, df) if df is not None else None, base)
+                          for t, (tipo, df, base) in lecturas.items()}
+
+    def _guardar_lecturas(self, revision, lecturas, sellos, escrituras=None):
+        ahora, reloj = time.monotonic(), time.time()
+        nuevas = []
+        for tabla, (tipo, df, filas_base) in lecturas.items():
+            # Si la app escribió en la tabla durante la lectura, lo leído puede no incluirlo
+            if escrituras is not None and self._escrituras.get(tabla, 0) != escrituras.get(tabla, 0):
+                continue
+            if tipo == 'compartida':
+                # df es una Copia, ya tipada y con su revisión y su versión
+                self._guardar_copia(tabla, df, ahora - max(reloj - df.cargada_en, 0), ahora, reloj)
+                continue
+            if tipo == 'completa':
+                self._guardar(tabla, df, ahora)
+                self._completas[tabla] = ahora
+            else:
+                entrada = self._tablas.get(tabla)
+                if entrada is None or len(entrada[0]) != filas_base:
+                    continue
+                if tipo == 'cola':
+                    self._publicar(tabla, self._superponer(tabla, anexar_filas(entrada[0], df)), ahora)
+                    self._cargas[tabla] = self._cargas.get(tabla, 0) + 1
+                else:
+                    self._tablas[tabla] = (entrada[0], ahora)
+            if revision is not None:
+                self._revisiones[tabla] = revision
+            if tabla in sellos:
+                self._sellos[tabla] = sellos[tabla]
+                # Si se volvió a escribir fuera mientras se leía, sigue marcada
+                if sellos[tabla] == (self._remotas or {}).get(tabla):
+                    self._cambiadas.discard(tabla)
+            if tipo != 'igual':
+                nuevas.append(tabla)
+        self._volcar(nuevas)
+
+    def _guardar_copia(self, tabla, copia, cargada_en, ahora, reloj):
+        """Publicar una Copia del disco o de otro proceso con sus metadatos"""
+        self._publicar(tabla, self._superponer(tabla, copia.df), cargada_en)
+        self._cargas[tabla] = self._cargas.get(tabla, 0) + 1
+        self._completas[tabla] = ahora - max(reloj - copia.leida_en, 0)
+        if copia.revision is not None:
+            self._revisiones[tabla] = copia.revision
+        if copia.sello is not None:
+            self._sellos[tabla] = copia.sello
+            if copia.sello == (self._remotas or {}).get(tabla):
+                self._cambiadas.discard(tabla)
+
+    def _guardar(self, tabla, df, ahora):
+        self._publicar(tabla, self._superponer(tabla, df), ahora)
+        self._cargas[tabla] = self._cargas.get(tabla, 0) + 1
+
+    def _superponer(self, tabla, df):
+        """Aplicar a lo leído las escrituras aceptadas que aún no han llegado a la fuente"""
+        for cambio in self.repo.pendientes(tabla):
+            # Una inserción ya enviada puede estar en lo leído
+            if cambio.tipo == 'insertar' and (df['id'] == cambio.id).any():
+                continue
+            df = aplicar_cambio(df, cambio)
+        return df
+
+    def _publicar(self, tabla, df, cargado_en):
+        """Sustituir la tabla por una nueva versión; la anterior sigue intacta para quien la tenga"""
+        self._tablas[tabla] = (df, cargado_en)
+        self._versiones[tabla] = self._versiones.get(tabla, 0) + 1
+
+    def aplicar(self, cambios):
+        """Aplicar las escrituras de la app a las tablas cargadas"""
+        with self._lock:
+            for cambio in cambios:
+                self._escrituras[cambio.tabla] = self._escrituras.get(cambio.tabla, 0) + 1
+                # La copia ya no corresponde a ninguna revisión de la fuente
+                self._revisiones.pop(cambio.tabla, None)
+                entrada = self._tablas.get(cambio.tabla)
+                if entrada is None:
+                    continue
+                if cambio.tipo == 'reemplazar':
+                    del self._tablas[cambio.tabla]
+                    self._versiones[cambio.tabla] = self.version(cambio.tabla) + 1
+                    if self.disco is not None:
+                        self._hilo_disco.submit(self.disco.borrar, cambio.tabla)
+                    continue
+                # Se conserva la hora de carga: el cambio no dice nada de lo
+                # que otros hayan escrito en la hoja mientras tanto
+                self._publicar(cambio.tabla, aplicar_cambio(entrada[0], cambio), entrada[1])
+                # La copia ya incluye la escritura: la versión nueva es la suya
+                if cambio.tabla in self.repo.versiones_escritas:
+                    self._sellos[cambio.tabla] = self.repo.versiones_escritas[cambio.tabla]
+            tocadas = {cambio.tabla for cambio in cambios}
+            # Las posiciones de las filas pueden haber cambiado
+            self._descartar_proyecciones(tocadas)
+            # Los demás procesos se enteran de la escritura sin esperar a leer las versiones de la fuente
+            anunciar = None
+            if self.disco is not None and self.disco.compartida:
+                anunciar = {t: self.repo.versiones_escritas[t] for t in tocadas if t in self.repo.versiones_escritas}
+            self._volcar([t for t in tocadas if t in self._tablas], anunciar)
+
+    def confirmar(self, versiones):
+        """Adoptar las versiones escritas al enviar cambios que las tablas ya tenían aplicados"""
+        with self._lock:
+            for tabla, sello in versiones.items():
+                if tabla in self._tablas:
+                    self._sellos[tabla] = sello
+            # La copia en disco también pasa a la versión nueva
+            anunciar = versiones if self.disco is not None and self.disco.compartida else None
+            self._volcar([t for t in versiones if t in self._tablas], anunciar)
+
+    def invalidar(self, *tablas):
+        """Descartar tablas (sin argumentos, todas)"""
+        with self._lock:
+            for tabla in tablas or list(self._tablas):
+                if self._tablas.pop(tabla, None) is not None:
+                    self._versiones[tabla] = self.version(tabla) + 1
+            self._descartar_proyecciones(tablas or ESQUEMAS)
@@ -0,0 +1,175 @@
+"""
+Backend local en SQLite.
+
+Guarda las mismas tablas que BeautyBox_Database en un fichero local con
+índices por id y por fecha, de modo que las consultas tardan milisegundos.
+La hoja de Google se mantiene al día con repositorio.sincronizar().
+
+La tabla _versiones lleva un contador por tabla que cada escritura sube en
+su misma transacción; así varios procesos sobre el mismo fichero saben qué
+tablas han cambiado (versiones).
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+from beautybox.esquema import ESQUEMAS, TABLAS_CON_FECHA, a_nativo, headers
+from beautybox.lotes import Cambio
+from beautybox.repositorio import Repositorio, categorias_por_defecto, proyectar
+
+
+class SQLiteRepositorio(Repositorio):
+    """Repositorio sobre un fichero SQLite local"""
+
+    def __init__(self, ruta):
+        super().__init__()
+        self.ruta = ruta
+        # Streamlit atiende cada sesión en un hilo distinto
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._crear_tablas()
+
+    def _en_lote(self):
+        return getattr(self._local, 'cambios', None) is not None
+
+    @contextmanager
+    def lote(self):
+        """Las escrituras del bloque van en una sola transacción"""
+        if self._en_lote():
+            yield None
+            return
+        cambios = []
+        with self._lock, self._conexion:
+            self._local.cambios = cambios
+            try:
+                yield None
+            finally:
+                self._local.cambios = None
+        if cambios:
+            self._notificar({cambio.tabla for cambio in cambios}, cambios)
+
+    def _transaccion(self):
+        """Transacción propia, salvo dentro de un lote (confirma el lote al salir)"""
+        if self._en_lote():
+            return nullcontext()
+        return self._conexion
+
+    def _escrito(self, cambio):
+        """Avisar del cambio ahora o, dentro de un lote, al confirmarlo"""
+        if self._en_lote():
+            self._local.cambios.append(cambio)
+        else:
+            self._notificar([cambio.tabla], [cambio])
+
+    def _crear_tablas(self):
+        with self._lock, self._conexion:
+            for tabla, columnas in ESQUEMAS.items():
+                definicion = ', '.join(
+                    f'{col} {tipo} PRIMARY KEY' if col == 'id' else f'{col} {tipo}'
+                    for col, tipo in columnas.items()
+                )
+                self._conexion.execute(f'CREATE TABLE IF NOT EXISTS {tabla} ({definicion})')
+            for tabla in TABLAS_CON_FECHA:
+                self._conexion.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabla}_fecha ON {tabla} (fecha)')
+            self._conexion.execute('CREATE TABLE IF NOT EXISTS _versiones (tabla TEXT PRIMARY KEY, version INTEGER)')
+
+    def _subir_version(self, tabla):
+        """Subir el contador de la tabla (dentro de la transacción de la escritura)"""
+        self._conexion.execute('INSERT INTO _versiones (tabla, version) VALUES (?, 1) '
+                               'ON CONFLICT (tabla) DO UPDATE SET version = version + 1', [tabla])
+        fila = self._conexion.execute('SELECT version FROM _versiones WHERE tabla = ?', [tabla]).fetchone()
+        self.versiones_escritas[tabla] = fila[0]
+
+    def versiones(self):
+        with self._lock:
+            return dict(self._conexion.execute('SELECT tabla, version FROM _versiones').fetchall())
+
+    def preparar(self):
+        """Sembrar las categorías por defecto si la tabla está vacía (las tablas ya las crea __init__)"""
+        with self._lock:
+            vacia = self._conexion.execute('SELECT 1 FROM categorias LIMIT 1').fetchone() is None
+        if vacia:
+            with self.lote():
+                for valores in categorias_por_defecto():
+                    self.insertar('categorias', valores)
+
+    def leer(self, tabla, desde=None, hasta=None):
+        columnas = ', '.join(headers(tabla))
+        sql = f'SELECT {columnas} FROM {tabla}'
+        params = []
+        filtrar = tabla in TABLAS_CON_FECHA and desde and hasta
+        if filtrar:
+            sql += ' WHERE fecha BETWEEN ? AND ?'
+            params = [str(desde), str(hasta)]
+        sql += ' ORDER BY id'
+        with self._lock:
+            df = pd.read_sql_query(sql, self._conexion, params=params)
+        if filtrar:
+            df['fecha'] = pd.to_datetime(df['fecha'])
+        return df
+
+    def leer_columnas(self, pedidos):
+        """Un SELECT con solo las columnas pedidas por tabla"""
+        resultado = {}
+        for tabla, (columnas, filas) in pedidos.items():
+            sql = f'SELECT {", ".join(columnas)} FROM {tabla} ORDER BY id'
+            with self._lock:
+                df = pd.read_sql_query(sql, self._conexion)
+            resultado[tabla] = proyectar(df, columnas, filas)
+        return resultado
+
+    def siguiente_id(self, tabla):
+        with self._lock:
+            fila = self._conexion.execute(f'SELECT MAX(id) FROM {tabla}').fetchone()
+        return (fila[0] or 0) + 1
+
+    def insertar(self, tabla, valores):
+        valores = {col: a_nativo(v) for col, v in valores.items() if col in ESQUEMAS[tabla]}
+        with self._lock, self._transaccion():
+            if not valores.get('id'):
+                valores['id'] = self.siguiente_id(tabla)
+            columnas = ', '.join(valores)
+            marcas = ', '.join('?' for _ in valores)
+            self._conexion.execute(f'INSERT INTO {tabla} ({columnas}) VALUES ({marcas})',
+                                   list(valores.values()))
+            self._subir_version(tabla)
+        self._escrito(Cambio(tabla, 'insertar', valores['id'], valores))
+        return valores['id']
+
+    def actualizar(self, tabla, id_valor, cambios):
+        asignaciones = ', '.join(f'{col} = ?' for col in cambios)
+        params = [a_nativo(v) for v in cambios.values()] + [a_nativo(id_valor)]
+        with self._lock, self._transaccion():
+            cursor = self._conexion.execute(f'UPDATE {tabla} SET {asignaciones} WHERE id = ?', params)
+            if cursor.rowcount:
+                self._subir_version(tabla)
+        if cursor.rowcount == 0:
+            return False
+        self._escrito(Cambio(tabla, 'actualizar', id_valor, dict(cambios)))
+        return True
+
+    def eliminar(self, tabla, id_valor):
+        with self._lock, self._transaccion():
+            cursor = self._conexion.execute(f'DELETE FROM {tabla} WHERE id = ?', [a_nativo(id_valor)])
+            if cursor.rowcount:
+                self._subir_version(tabla)
+        if cursor.rowcount == 0:
+            return False
+        self._escrito(Cambio(tabla, 'eliminar', id_valor, None))
+        return True
+
+    def reemplazar(self, tabla, df):
+        columnas = headers(tabla)
+        datos = df.reindex(columns=columnas)
+        datos = datos.astype(object).where(datos.notna(), None)
+        filas = [[None if v is None else a_nativo(v) for v in fila] for fila in datos.values.tolist()]
+        marcas = ', '.join('?' for _ in columnas)
+        with self._lock, self._transaccion():
+            self._conexion.execute(f'DELETE FROM {tabla}')
+            self._conexion.executemany(
+                f'INSERT INTO {tabla} ({", ".join(columnas)}) VALUES ({marcas})', filas)
+            self._subir_version(tabla)
+        self._escrito(Cambio(tabla, 'reemplazar', None, None))
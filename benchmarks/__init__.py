@@ -0,0 +1 @@
+"""Benchmarks de rendimiento de la app (no se ejecutan en producción)."""
@@ -0,0 +1,120 @@
+"""
+Datos sintéticos para los benchmarks.
+
+Genera todas las tablas de BeautyBox_Database con un número dado de citas
+(reproducible con una semilla) y las carga en un Sheets falso.
+"""
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from beautybox.esquema import ESQUEMAS
+from beautybox.sheets import SheetsRepositorio
+
+CANALES = ['Instagram', 'WhatsApp', 'Web', 'Recomendación', 'Walk-in']
+METODOS_PAGO = ['Efectivo', 'Tarjeta', 'Bizum']
+CATEGORIAS = ['Pestañas', 'Cejas', 'Uñas', 'Otros']
+
+
+def generar(n_citas, semilla=0, hoy=None):
+    """DataFrames de todas las tablas con n_citas repartidas en ~18 meses"""
+    rng = np.random.default_rng(semilla)
+    hoy = hoy or date.today()
+    creado = datetime.combine(hoy, datetime.min.time()).isoformat()
+    n_servicios = 20
+    n_clientes = max(n_citas // 10, 50)
+
+    categorias = pd.DataFrame({
+        'id': range(1, len(CATEGORIAS) + 1),
+        'nombre': CATEGORIAS,
+        'descripcion': [f'Servicios de {c.lower()}' for c in CATEGORIAS],
+        'created_at': creado,
+    })
+    servicios = pd.DataFrame({
+        'id': range(1, n_servicios + 1),
+        'nombre': [f'Servicio {i}' for i in range(1, n_servicios + 1)],
+        'categoria_id': [(i % len(CATEGORIAS)) + 1 for i in range(n_servicios)],
+        'precio': rng.integers(15, 90, n_servicios),
+        'duracion_minutos': rng.choice([30, 45, 60, 90, 120], n_servicios),
+        'costo_insumos': rng.integers(1, 15, n_servicios),
+        'activo': [0 if i % 10 == 9 else 1 for i in range(n_servicios)],
+        'descripcion': '',
+        'created_at': creado,
+    })
+    clientes = pd.DataFrame({
+        'id': range(1, n_clientes + 1),
+        'nombre': [f'Clienta {i}' for i in range(1, n_clientes + 1)],
+        'telefono': [f'6{n:08d}' for n in rng.integers(0, 10**8, n_clientes)],
+        'email': [f'clienta{i}@ejemplo.com' for i in range(1, n_clientes + 1)],
+        'fecha_primera_visita': str(hoy - timedelta(days=540)),
+        'canal_adquisicion': rng.choice(CANALES, n_clientes),
+        'notas': '',
+        'created_at': creado,
+    })
+    dias = rng.integers(-540, 31, n_citas)
+    citas = pd.DataFrame({
+        'id': range(1, n_citas + 1),
+        'fecha': [str(hoy + timedelta(days=int(d))) for d in dias],
+        'hora': [f'{h:02d}:{m:02d}:00' for h, m in zip(rng.integers(9, 20, n_citas),
+                                                       rng.choice([0, 30], n_citas))],
+        'cliente_id': rng.integers(1, n_clientes + 1, n_citas),
+        'servicio_id': rng.integers(1, n_servicios + 1, n_citas),
+        'precio_cobrado': rng.integers(15, 90, n_citas).astype(float),
+        'propina': rng.choice([0.0, 0.0, 0.0, 2.0, 5.0], n_citas),
+        'canal_origen': rng.choice(CANALES, n_citas),
+        'metodo_pago': rng.choice(METODOS_PAGO, n_citas),
+        'notas': '',
+        'created_at': creado,
+    })
+    gastos_fijos = pd.DataFrame({
+        'id': range(1, 6),
+        'concepto': ['Alquiler', 'Luz', 'Agua', 'Internet', 'Seguro'],
+        'monto': [650.0, 90.0, 30.0, 40.0, 25.0],
+        'frecuencia': 'mensual',
+        'activo': 1,
+        'notas': '',
+        'created_at': creado,
+    })
+    n_gastos = max(n_citas // 20, 10)
+    gastos_variables = pd.DataFrame({
+        'id': range(1, n_gastos + 1),
+        'fecha': [str(hoy + timedelta(days=int(d))) for d in rng.integers(-540, 1, n_gastos)],
+        'concepto': rng.choice(['Tinte', 'Esmaltes', 'Pestañas', 'Limpieza'], n_gastos),
+        'monto': rng.integers(5, 120, n_gastos).astype(float),
+        'categoria': rng.choice(['Insumos', 'Mantenimiento', 'Marketing'], n_gastos),
+        'notas': '',
+        'created_at': creado,
+    })
+    n_solicitudes = 50
+    solicitudes = pd.DataFrame({
+        'id': range(1, n_solicitudes + 1),
+        'nombre': [f'Solicitante {i}' for i in range(1, n_solicitudes + 1)],
+        'telefono': [f'7{n:08d}' for n in rng.integers(0, 10**8, n_solicitudes)],
+        'email': '',
+        'servicio_solicitado': rng.choice(servicios['nombre'], n_solicitudes),
+        'preferencia_horario': f'{hoy + timedelta(days=2)} a las 10:00',
+        'mensaje': '',
+        'estado': rng.choice(['pendiente', 'confirmada', 'rechazada'], n_solicitudes, p=[0.2, 0.5, 0.3]),
+        'fecha_solicitud': creado,
+        'fecha_respuesta': '',
+        'notas_admin': '',
+    })
+    tablas = {
+        'categorias': categorias,
+        'servicios': servicios,
+        'clientes': clientes,
+        'citas': citas,
+        'gastos_fijos': gastos_fijos,
+        'gastos_variables': gastos_variables,
+        'solicitudes': solicitudes,
+    }
+    return {tabla: df[list(ESQUEMAS[tabla])] for tabla, df in tablas.items()}
+
+
+def cargar(spreadsheet, tablas):
+    """Escribir las tablas generadas en una hoja de cálculo (real o falsa)"""
+    repo = SheetsRepositorio(spreadsheet)
+    for tabla, df in tablas.items():
+        repo.reemplazar(tabla, df)
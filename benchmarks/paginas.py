@@ -0,0 +1,165 @@
+"""
+Benchmark de páginas: ejecuta app.py sin navegador (Streamlit AppTest) para
+cada valor de st.session_state.pagina y la página Reservar, contra el Sheets
+falso cargado con datos sintéticos.
+
+Por página y tamaño se mide:
+  - frio_s: primer render con las cachés vacías
+  - rerun_s: media de los reruns siguientes (cachés calientes)
+  - llamadas_api / bytes_leidos: peticiones al Sheets falso y bytes devueltos
+  - memoria_pico_mb: pico de memoria de Python (tracemalloc) en el render en frío
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.paginas                          # 1k, 10k y 100k citas
+    python -m benchmarks.paginas --tamanos 1000 --guardar benchmarks/baseline.json
+    python -m benchmarks.paginas --comparar benchmarks/baseline.json
+
+Con --comparar sale con código 1 si alguna página es más lenta que la base
+por encima de la tolerancia o hace más llamadas a la API.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+os.environ['BEAUTYBOX_BACKEND'] = 'sheets_falso'
+
+import pandas as pd  # noqa: E402
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from beautybox.sheets_falso import TITULO_POR_DEFECTO, cliente_compartido  # noqa: E402
+from benchmarks import datos  # noqa: E402
+
+RAIZ = Path(__file__).resolve().parent.parent
+APP = RAIZ / 'app.py'
+RESERVAR = RAIZ / 'pages' / '1_📅_Reservar.py'
+
+PAGINAS = ['dashboard', 'agenda', 'solicitudes', 'clientes', 'servicios', 'registrar',
+           'gastos', 'proyecciones', 'config', 'reservar']
+TAMANOS = [1_000, 10_000, 100_000]
+RERUNS = 3
+TIMEOUT = 600
+
+
+def preparar(n_citas, semilla=0):
+    """Sheets falso compartido con una BeautyBox_Database nueva de n_citas"""
+    cliente = cliente_compartido()
+    cliente.del_spreadsheet(cliente.open(TITULO_POR_DEFECTO).id)
+    datos.cargar(cliente.create(TITULO_POR_DEFECTO), datos.generar(n_citas, semilla))
+    return cliente
+
+
+def _app(pagina):
+    if pagina == 'reservar':
+        return AppTest.from_file(str(RESERVAR), default_timeout=TIMEOUT)
+    at = AppTest.from_file(str(APP), default_timeout=TIMEOUT)
+    at.session_state['pagina'] = pagina
+    return at
+
+
+def _render(at):
+    inicio = time.perf_counter()
+    at.run()
+    duracion = time.perf_counter() - inicio
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return duracion
+
+
+def medir_pagina(cliente, pagina, reruns=RERUNS):
+    """Métricas de una página: render en frío y reruns con caché"""
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    cliente.reiniciar_contadores()
+    tracemalloc.start()
+    at = _app(pagina)
+    frio = _render(at)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    llamadas, bytes_leidos = cliente.total_llamadas, cliente.bytes_leidos
+    # El render en frío con tracemalloc es más lento: se repite sin él
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    frio = min(frio, _render(_app(pagina)))
+    tiempos = [_render(at) for _ in range(reruns)]
+    return {
+        'frio_s': round(frio, 4),
+        'rerun_s': round(sum(tiempos) / len(tiempos), 4) if tiempos else None,
+        'llamadas_api': llamadas,
+        'llamadas_api_reruns': cliente.total_llamadas - llamadas,
+        'bytes_leidos': bytes_leidos,
+        'memoria_pico_mb': round(pico / 2**20, 1),
+    }
+
+
+def ejecutar(tamanos=TAMANOS, paginas=PAGINAS, reruns=RERUNS):
+    resultados = {}
+    for n in tamanos:
+        cliente = preparar(n)
+        resultados[str(n)] = {}
+        for pagina in paginas:
+            metricas = medir_pagina(cliente, pagina, reruns)
+            resultados[str(n)][pagina] = metricas
+            print(f'{n:>7} {pagina:<13} frío {metricas["frio_s"]:>8.3f}s  rerun {metricas["rerun_s"] or 0:>8.3f}s  '
+                  f'api {metricas["llamadas_api"]:>3}  bytes {metricas["bytes_leidos"]:>10}  '
+                  f'mem {metricas["memoria_pico_mb"]:>7.1f}MB', flush=True)
+    return {
+        'entorno': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'streamlit': st.__version__,
+            'maquina': platform.machine(),
+        },
+        'reruns': reruns,
+        'resultados': resultados,
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Regresiones de actual frente a base (lista de textos)"""
+    regresiones = []
+    for n, paginas in actual['resultados'].items():
+        for pagina, metricas in paginas.items():
+            anterior = base.get('resultados', {}).get(n, {}).get(pagina)
+            if not anterior:
+                continue
+            for clave in ('frio_s', 'rerun_s'):
+                if anterior.get(clave) and metricas[clave] > anterior[clave] * tolerancia:
+                    regresiones.append(f'{n} {pagina} {clave}: {anterior[clave]} -> {metricas[clave]}')
+            for clave in ('llamadas_api', 'llamadas_api_reruns'):
+                if metricas[clave] > anterior.get(clave, metricas[clave]):
+                    regresiones.append(f'{n} {pagina} {clave}: {anterior[clave]} -> {metricas[clave]}')
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS, help='número de citas')
+    parser.add_argument('--paginas', nargs='+', default=PAGINAS, choices=PAGINAS)
+    parser.add_argument('--reruns', type=int, default=RERUNS)
+    parser.add_argument('--guardar', type=Path, help='escribir los resultados en este JSON')
+    parser.add_argument('--comparar', type=Path, help='JSON base con el que comparar')
+    parser.add_argument('--tolerancia', type=float, default=1.5,
+                        help='factor de tiempo admitido frente a la base (por defecto 1.5)')
+    args = parser.parse_args(argv)
+
+    resultado = ejecutar(args.tamanos, args.paginas, args.reruns)
+    if args.guardar:
+        args.guardar.write_text(json.dumps(resultado, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    if args.comparar:
+        regresiones = comparar(resultado, json.loads(args.comparar.read_text(encoding='utf-8')),
+                               args.tolerancia)
+        for regresion in regresiones:
+            print('REGRESIÓN', regresion)
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
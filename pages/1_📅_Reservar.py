@@ -4,13 +4,13 @@ Página para clientes que quieren solicitar una cita
 """
 
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
+import uuid
 import pandas as pd
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+
+from beautybox import instrumentacion
+from beautybox.conexion import get_indice_solicitudes, get_notificador, get_repositorio, get_snapshot
+from beautybox.instrumentacion import medido
 
 # ============================================
 # CONFIGURACIÓN DE LA PÁGINA
@@ -198,155 +198,48 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ============================================
-# CONEXIÓN A GOOGLE SHEETS
+# CONEXIÓN A LOS DATOS
 # ============================================
 
-@st.cache_resource
-def get_google_connection():
-    try:
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=scopes
-        )
-        client = gspread.authorize(credentials)
-        return client
-    except Exception as e:
-        st.error(f"Error de conexión: {e}")
-        st.stop()
-
-@st.cache_resource
-def get_spreadsheet():
-    client = get_google_connection()
-    try:
-        return client.open("BeautyBox_Database")
-    except:
-        st.error("Error conectando a la base de datos")
-        st.stop()
+instrumentacion.iniciar_rerun('reservar')
 
+@medido
 def get_servicios():
-    spreadsheet = get_spreadsheet()
     try:
-        worksheet = spreadsheet.worksheet('servicios')
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data) if data else pd.DataFrame()
+        # Del snapshot compartido por todas las sesiones: solo las columnas del
+        # formulario, sin leer la hoja en cada rerun de cada visitante
+        df = get_snapshot().proyectar({'servicios': (['id', 'nombre', 'activo'], None)})['servicios']
         if len(df) > 0:
             df = df[df['activo'] == 1]
         return df
     except:
         return pd.DataFrame()
 
+@medido
 def insertar_solicitud(nombre, telefono, email, servicio, preferencia, mensaje):
-    spreadsheet = get_spreadsheet()
-    headers = ['id', 'nombre', 'telefono', 'email', 'servicio_solicitado', 'preferencia_horario', 
-               'mensaje', 'estado', 'fecha_solicitud', 'fecha_respuesta', 'notas_admin']
-    
-    try:
-        worksheet = spreadsheet.worksheet('solicitudes')
-    except:
-        worksheet = spreadsheet.add_worksheet(title='solicitudes', rows=1000, cols=20)
-        worksheet.append_row(headers)
-    
-    data = worksheet.get_all_records()
-    new_id = max([row.get('id', 0) for row in data], default=0) + 1
-    
-    row = [new_id, nombre, telefono, email, servicio, preferencia, mensaje, 'pendiente',
-           datetime.now().isoformat(), '', '']
-    worksheet.append_row(row)
-    return new_id
-
+    return get_repositorio().insertar('solicitudes', {
+        'nombre': nombre, 'telefono': telefono, 'email': email,
+        'servicio_solicitado': servicio, 'preferencia_horario': preferencia,
+        'mensaje': mensaje, 'estado': 'pendiente',
+        'fecha_solicitud': datetime.now().isoformat(), 'fecha_respuesta': '', 'notas_admin': ''
+    })
+
+@medido
+def registrar_solicitud(clave, nombre, telefono, email, servicio, preferencia, mensaje):
+    """Guardar la solicitud salvo que repita una reciente (misma clave de envío o
+    mismo teléfono, servicio y preferencia). Devuelve (id, si es nueva)"""
+    return get_indice_solicitudes().registrar(
+        clave, telefono, servicio, preferencia,
+        lambda: insertar_solicitud(nombre, telefono, email, servicio, preferencia, mensaje))
+
+@medido
 def enviar_notificacion_email(nombre, telefono, email, servicio, preferencia, mensaje):
-    """Enviar notificación por email cuando se recibe una nueva solicitud"""
-    try:
-        # Configuración del email desde secrets
-        try:
-            email_sender = st.secrets["email"]["sender"]
-            email_password = st.secrets["email"]["app_password"]
-            email_recipient = st.secrets["email"]["recipient"]
-        except KeyError as e:
-            st.error(f"❌ DEBUG: Falta configuración de email: {e}")
-            return False
-
-        if not email_password:
-            st.error("❌ DEBUG: app_password está vacío")
-            return False
-
-        # DEBUG: Mostrar que los secrets se leyeron bien
-        st.info(f"📧 DEBUG: Intentando enviar a {email_recipient}...")
-
-        # Crear el mensaje
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f'Nueva Solicitud de Cita - {nombre}'
-        msg['From'] = email_sender
-        msg['To'] = email_recipient
-
-        # Contenido del email en texto plano
-        text_content = f"""
-Nueva Solicitud de Cita - BeautyBox Málaga
-
-👤 Cliente: {nombre}
-📱 Teléfono: {telefono}
-📧 Email: {email if email else 'No proporcionado'}
-💅 Servicio: {servicio}
-🕐 Preferencia: {preferencia}
-💬 Mensaje: {mensaje if mensaje else 'Sin mensaje'}
-
-📅 Fecha de solicitud: {datetime.now().strftime('%d/%m/%Y %H:%M')}
-
-Abre la app para confirmar o rechazar esta solicitud.
-        """
-
-        # Contenido del email en HTML
-        html_content = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; background-color: #FDF8F7; padding: 20px;">
-            <div style="max-width: 480px; margin: 0 auto; background: white; border-radius: 20px; padding: 24px; box-shadow: 0 4px 20px rgba(0,0,0,0.08);">
-                <div style="text-align: center; margin-bottom: 20px;">
-                    <h1 style="color: #c48b9f; margin: 0;">🔔 Nueva Solicitud</h1>
-                    <p style="color: #8E8E93; margin: 5px 0;">BeautyBox Málaga</p>
-                </div>
-
-                <div style="background: #F8F9FA; border-radius: 12px; padding: 16px; margin-bottom: 16px;">
-                    <p style="margin: 8px 0;"><strong>👤 Cliente:</strong> {nombre}</p>
-                    <p style="margin: 8px 0;"><strong>📱 Teléfono:</strong> <a href="tel:{telefono}">{telefono}</a></p>
-                    <p style="margin: 8px 0;"><strong>📧 Email:</strong> {email if email else 'No proporcionado'}</p>
-                </div>
-
-                <div style="background: #F8F9FA; border-radius: 12px; padding: 16px; margin-bottom: 16px;">
-                    <p style="margin: 8px 0;"><strong>💅 Servicio:</strong> {servicio}</p>
-                    <p style="margin: 8px 0;"><strong>🕐 Preferencia:</strong> {preferencia}</p>
-                    <p style="margin: 8px 0;"><strong>💬 Mensaje:</strong> {mensaje if mensaje else 'Sin mensaje'}</p>
-                </div>
-
-                <div style="text-align: center; padding: 16px; background: linear-gradient(135deg, #d4a5a5 0%, #c48b9f 100%); border-radius: 12px;">
-                    <p style="color: white; margin: 0; font-weight: 600;">📲 Abre la app para confirmar o rechazar</p>
-                </div>
-
-                <p style="text-align: center; color: #8E8E93; font-size: 12px; margin-top: 16px;">
-                    Solicitud recibida: {datetime.now().strftime('%d/%m/%Y %H:%M')}
-                </p>
-            </div>
-        </body>
-        </html>
-        """
-
-        msg.attach(MIMEText(text_content, 'plain'))
-        msg.attach(MIMEText(html_content, 'html'))
-
-        # Enviar el email
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(email_sender, email_password)
-            server.sendmail(email_sender, email_recipient, msg.as_string())
-
-        st.success("✅ DEBUG: Email enviado correctamente!")
-        return True
-    except Exception as e:
-        # Mostrar el error para debugging
-        st.error(f"❌ DEBUG Error enviando email: {e}")
+    """Encolar la notificación por email de una nueva solicitud (se envía en segundo plano)"""
+    notificador = get_notificador()
+    if notificador is None:
         return False
+    notificador.avisar(nombre, telefono, email, servicio, preferencia, mensaje)
+    return True
 
 # ============================================
 # FORMULARIO
@@ -364,6 +257,9 @@ st.markdown("""
 # Estado del formulario
 if 'solicitud_enviada' not in st.session_state:
     st.session_state.solicitud_enviada = False
+# Clave de envío del formulario: los reenvíos del mismo formulario no crean otra solicitud
+if 'clave_solicitud' not in st.session_state:
+    st.session_state.clave_solicitud = uuid.uuid4().hex
 
 if st.session_state.solicitud_enviada:
     # Mensaje de éxito
@@ -377,6 +273,7 @@ if st.session_state.solicitud_enviada:
     
     if st.button("📝 Nueva Solicitud"):
         st.session_state.solicitud_enviada = False
+        st.session_state.clave_solicitud = uuid.uuid4().hex
         st.rerun()
 else:
     # Formulario
@@ -412,17 +309,13 @@ else:
             if not nombre or not telefono:
                 st.error("Por favor completa los campos obligatorios (*)")
             else:
-                insertar_solicitud(nombre, telefono, email, servicio, preferencia, mensaje)
-                st.success("✅ Solicitud guardada en base de datos")
-                # Enviar notificación por email
-                st.write("---")
-                st.write("**🔍 DEBUG - Intentando enviar email...**")
-                resultado_email = enviar_notificacion_email(nombre, telefono, email, servicio, preferencia, mensaje)
-                st.write(f"**Resultado:** {'✅ Éxito' if resultado_email else '❌ Falló'}")
-                st.write("---")
-                # TEMPORAL: Comentado para ver debug
-                # st.session_state.solicitud_enviada = True
-                # st.rerun()
+                _, nueva = registrar_solicitud(st.session_state.clave_solicitud,
+                                               nombre, telefono, email, servicio, preferencia, mensaje)
+                # El email lo envía un hilo aparte: la clienta no espera a Gmail
+                if nueva:
+                    enviar_notificacion_email(nombre, telefono, email, servicio, preferencia, mensaje)
+                st.session_state.solicitud_enviada = True
+                st.rerun()
 
 # Info de contacto
 st.markdown("""
@@ -440,3 +333,5 @@ st.markdown("""
     <p>Lashes & Brows</p>
 </div>
 """, unsafe_allow_html=True)
+
+instrumentacion.terminar_rerun()
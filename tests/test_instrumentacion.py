@@ -0,0 +1,44 @@
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from beautybox import instrumentacion
+
+
+def script_lector():
+    import streamlit as st
+
+    from beautybox import instrumentacion
+    from beautybox.instrumentacion import cache_compartida
+
+    instrumentacion.iniciar_rerun('prueba')
+
+    @cache_compartida(lambda: st.session_state.get('version', 1))
+    def get_prueba_cache_compartida():
+        return 42
+
+    st.write(get_prueba_cache_compartida())
+    instrumentacion.terminar_rerun()
+
+
+def cache_de_los_reruns(n):
+    return [evento['cache'] for traza in list(instrumentacion.TRAZAS)[-n:]
+            for evento in traza['eventos'] if evento['nombre'] == 'get_prueba_cache_compartida']
+
+
+def test_cache_compartida_sobrevive_a_los_reruns(monkeypatch):
+    monkeypatch.setenv('BEAUTYBOX_TRAZAS', '')
+    at = AppTest.from_function(script_lector)
+    at.run()
+    at.run()
+    assert not at.exception
+    assert cache_de_los_reruns(2) == ['fallo', 'acierto']
+
+    # Otra versión de los datos se vuelve a calcular
+    at.session_state['version'] = 2
+    at.run()
+    assert cache_de_los_reruns(1) == ['fallo']
+
+    # Con st.cache_resource.clear() el snapshot empieza de nuevo: lo guardado ya no vale
+    st.cache_resource.clear()
+    at.run()
+    assert cache_de_los_reruns(1) == ['fallo']